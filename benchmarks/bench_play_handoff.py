@@ -0,0 +1,55 @@
+"""
+Microbenchmark for handing plays off to the worker processes
+
+Compares pickling the plays along with their variables to pickling their descriptors,
+which refer to the variables shipped to every worker once
+
+USAGE
+    python3 -m benchmarks.bench_play_handoff [play count]
+"""
+# -*- coding: utf-8 -*-
+import sys
+import pickle
+import timeit
+from stackmate.playbooks import Play
+
+
+def get_shared_vars():
+    """Returns variables about the size of a project's, with the SSH keys included"""
+    shared_vars = {'var_{}'.format(idx): 'value-{}'.format(idx) * 8 for idx in range(500)}
+    shared_vars.update(private_key='k' * 3243, public_key='k' * 725)
+
+    return shared_vars
+
+
+def get_plays(count, shared_vars):
+    """Returns plays sharing the same variables, the way the playbooks create them"""
+    return [Play(
+        role={'name': 'role-{}'.format(idx), 'hosts': 'all', 'execution': 'free'},
+        task_vars={'provisions': [{'id': 'resource-{}'.format(idx)}], 'store_state': True},
+        global_vars=shared_vars,
+        forks=5,
+    ) for idx in range(count)]
+
+
+def main(count):
+    """Runs the benchmark"""
+    shared_vars = get_shared_vars()
+    plays = get_plays(count, shared_vars)
+
+    handoffs = {
+        'plays': lambda: [pickle.dumps(play) for play in plays],
+        'descriptors': lambda: [pickle.dumps(play.get_descriptor(shared_vars)) for play in plays],
+    }
+
+    for name, handoff in handoffs.items():
+        timer = timeit.Timer(handoff)
+        runs, total = timer.autorange()
+        size = sum(len(pickled) for pickled in handoff())
+
+        print('{count} {name}: {t:.4f}s, {size} bytes pickled ({runs} runs)'.format(
+            count=count, name=name, t=total / runs, size=size, runs=runs))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,65 @@
+"""
+Microbenchmark for the changes computed over large resource lists
+
+USAGE
+    python3 -m benchmarks.bench_resource_list [resource count]
+"""
+# -*- coding: utf-8 -*-
+import sys
+import timeit
+from stackmate.resources import Resource, ResourceList
+
+
+class BenchmarkDeployable:
+    """Stands in for a deployable, providing what the resource list requires"""
+    def __init__(self, idx):
+        self.deployable_id = 'configfile-{}'.format(idx)
+        self.provision_params = {'name': 'file-{}.conf'.format(idx), 'revision': 2}
+
+    def as_resources(self):
+        """Returns the deployable as resources"""
+        return [Resource(
+            id=self.deployable_id, group={'name': 'configfiles'},
+            provision_params=self.provision_params)]
+
+
+def get_resources(count):
+    """Returns the state entries for the resources"""
+    return [{
+        'id': 'configfile-{}'.format(idx),
+        'group': {'name': 'configfiles'},
+        'created_at': '2020-02-07 17:26:57.{:06d}'.format(idx),
+        'provision_params': {'name': 'file-{}.conf'.format(idx), 'revision': 1},
+    } for idx in range(count)]
+
+
+def plan(resources, deployables):
+    """Computes and serializes the changes the way the provisioner does"""
+    resource_list = ResourceList(resources)
+    resource_list.modify_touched_resources()
+    resource_list.terminate_unused_resources(deployables)
+
+    for idx, deployable in enumerate(deployables):
+        if not resource_list.exists(deployable):
+            resource_list.provision(deployable)
+        elif idx % 10 == 0:
+            resource_list.modify(deployable)
+
+    return resource_list.serialize()
+
+
+def main(count):
+    """Runs the benchmark"""
+    resources = get_resources(count)
+    # a tenth of the resources are no longer used, as many deployables are new
+    deployables = [BenchmarkDeployable(idx) for idx in range(count // 10, count + count // 10)]
+
+    timer = timeit.Timer(lambda: plan(resources, deployables))
+    runs, total = timer.autorange()
+
+    print('{count} resources: {t:.4f}s per plan ({runs} runs)'.format(
+        count=count, t=total / runs, runs=runs))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
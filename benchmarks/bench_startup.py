@@ -0,0 +1,83 @@
+"""
+Benchmark for the start-up time of the CLI commands, based on python's `-X importtime`
+
+Reports, for every command, the wall clock time, the time spent importing modules
+and whether ansible and jinja2 got imported
+
+USAGE
+    python3 -m benchmarks.bench_startup [runs]
+"""
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import subprocess
+
+ROOTPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_PATH = os.path.join(ROOTPATH, 'tests', 'data', 'rails-fully-deployed')
+
+COMMANDS = (
+    ('--help',),
+    ('state',),
+    ('validate',),
+    ('plan', '--help'),
+    ('deploy', '--help'),
+    ('rollback', '--help'),
+)
+
+# the packages that should only be imported when a play runs
+TRACKED_PACKAGES = ('ansible', 'jinja2')
+
+
+def parse_importtime(output):
+    """Returns the time spent on imports, in microseconds, and the names of the imported modules"""
+    total, modules = 0, set()
+
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+
+        # nested imports are indented, only the top level ones add up to the total
+        if not name.startswith('  '):
+            total += int(cumulative)
+
+    return total, modules
+
+
+def run_command(args):
+    """Runs a CLI command with the import times reported, returns the wall time and the imports"""
+    command = [
+        sys.executable, '-X', 'importtime', os.path.join(ROOTPATH, 'cli.py'),
+        '--stage', 'production', '--path', PROJECT_PATH,
+    ] + list(args)
+
+    started = time.perf_counter()
+    process = subprocess.run(command, cwd=ROOTPATH, capture_output=True, text=True, check=False)
+    elapsed = time.perf_counter() - started
+
+    return elapsed, parse_importtime(process.stderr)
+
+
+def main(runs):
+    """Runs the benchmark"""
+    print('{:<20} {:>10} {:>10}  {}'.format('command', 'wall', 'imports', 'loaded'))
+
+    for args in COMMANDS:
+        results = [run_command(args) for _ in range(runs)]
+        # the fastest run is the least affected by the noise of the system
+        elapsed, (total, modules) = min(results, key=lambda result: result[0])
+        loaded = [
+            package for package in TRACKED_PACKAGES
+            if any(name == package or name.startswith(package + '.') for name in modules)
+        ]
+
+        print('{:<20} {:>9.1f}ms {:>9.1f}ms  {}'.format(
+            ' '.join(args), elapsed * 1000, total / 1000,
+            ', '.join(loaded) or '-'))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
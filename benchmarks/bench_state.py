@@ -0,0 +1,72 @@
+"""
+Microbenchmark for loading and updating a large state file
+
+USAGE
+    python3 -m benchmarks.bench_state [size in MB]
+"""
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import tempfile
+from stackmate.configurations import StageState
+from stackmate.state import State
+
+STAGE = 'production'
+ROLES = 50
+
+
+def get_contents(size):
+    """Returns the contents for a state file of about the size specified, in MB"""
+    # every resource takes roughly 512 bytes once serialized
+    per_role = size * 2048 // ROLES
+
+    return {
+        'role-{}'.format(role): [{
+            'id': 'resource-{}-{}'.format(role, idx),
+            'group': {'name': 'group-{}'.format(role)},
+            'created_at': '2020-02-07 17:26:57.{:06d}'.format(idx),
+            'provision_params': {
+                'name': 'resource-{}.conf'.format(idx),
+                'revision': 1,
+                'reference': 'ref-{}'.format(idx),
+                'settings': {'key-{}'.format(key): 'value-{}'.format(key) for key in range(10)},
+            },
+            'output': {'host': '10.0.{}.{}'.format(role, idx % 255), 'port': 5432},
+        } for idx in range(per_role)]
+        for role in range(ROLES)
+    }
+
+
+def main(size):
+    """Runs the benchmark"""
+    with tempfile.TemporaryDirectory() as rootpath:
+        stage_state = StageState(rootpath=rootpath, stage=STAGE)
+        stage_state.contents = get_contents(size)
+        stage_state.write()
+        path = stage_state.path
+        print('state file: {:.1f}MB'.format(os.path.getsize(path) / 1024 / 1024))
+
+        started = time.perf_counter()
+        state = State(rootpath=rootpath, stage=STAGE)
+        loaded = time.perf_counter()
+
+        for role in state.keys():
+            for entry in state.get(role):
+                entry.output.port # pylint: disable=pointless-statement
+
+        accessed = time.perf_counter()
+
+        for role in state.keys():
+            state.update(role, [dict(resource) for resource in state.contents[role][:10]])
+            state.contents.set_path('settings.{}.revision'.format(role), 2)
+            state.contents.copy()
+
+        updated = time.perf_counter()
+
+    print('load: {:.4f}s, access: {:.4f}s, update: {:.4f}s'.format(
+        loaded - started, accessed - loaded, updated - accessed))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
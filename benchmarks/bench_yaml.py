@@ -0,0 +1,59 @@
+"""
+Microbenchmark for parsing and dumping the YAML files of the test fixtures
+
+USAGE
+    python3 -m benchmarks.bench_yaml
+"""
+# -*- coding: utf-8 -*-
+import os
+import glob
+import timeit
+import tempfile
+import yaml
+from stackmate.helpers import YamlDumper, YamlLoader, FastYamlDumper, read_compiled_yaml
+
+ROOTPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATTERNS = ['tests/data/**/*.yml', 'stackmate/config/*.yml']
+
+
+def get_files():
+    """Returns the contents of the YAML files to benchmark with"""
+    files = {}
+
+    for pattern in PATTERNS:
+        for path in sorted(glob.glob(os.path.join(ROOTPATH, pattern), recursive=True)):
+            with open(path) as file:
+                files[os.path.relpath(path, ROOTPATH)] = file.read()
+
+    return files
+
+
+def measure(func):
+    """Returns the time (in seconds) that a function takes to run"""
+    runs, total = timeit.Timer(func).autorange()
+    return total / runs
+
+
+def main():
+    """Runs the benchmark"""
+    print('{:<55} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'file', 'load', 'load (C)', 'compiled', 'dump', 'dump (C)'))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for path, contents in get_files().items():
+            data = yaml.load(contents, Loader=yaml.FullLoader)
+            fullpath = os.path.join(ROOTPATH, path)
+
+            print('{:<55} {:>9.2f}ms {:>9.2f}ms {:>9.2f}ms {:>9.2f}ms {:>9.2f}ms'.format(
+                path,
+                measure(lambda: yaml.load(contents, Loader=yaml.FullLoader)) * 1000,
+                measure(lambda: yaml.load(contents, Loader=YamlLoader)) * 1000,
+                measure(lambda: read_compiled_yaml(fullpath, cache_dir=cache_dir)) * 1000,
+                measure(lambda: yaml.dump(data, Dumper=YamlDumper, default_flow_style=False)) * 1000,
+                measure(lambda: yaml.dump(data, Dumper=FastYamlDumper, default_flow_style=False)) \
+                    * 1000,
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,17 @@ Commands explanation & specs:
 state        Inspect the project's state
     - verify state is present inside the project directory under .stackmate
     - print state for given branch
+    - compact the changes recorded in the state journal into the state file
+    - migrate the state file where the stages are stored together, to a file per stage
 
 validate     Validate YAML configuration file
     - make sure the project type is supported
     - make sure there are encrypted credentials for all services
 
+plan         Compute the changes of a deployment, without deploying
+    - write out the changes for every step and role in a plan file
+    - the plan can be deployed later on using `deploy --plan <file>`
+
 deploy       Deploy a project
 rollback     Roll back to the previous release
     - check if there's a more up-to date version of the state in the remote repo
@@ -22,8 +28,8 @@ rollback     Roll back to the previous release
 # -*- coding: utf-8 -*-
 
 import os
+import json
 import click
-from stackmate.operations import DeploymentOperation, RollbackOperation
 from stackmate.constants import ENV_STACKMATE_OPERATION_ID
 
 @click.group()
@@ -33,6 +39,12 @@ from stackmate.constants import ENV_STACKMATE_OPERATION_ID
 @click.option('--debug/--no-debug', default=False, \
     help='Print the playbook to be executed, do not deploy')
 @click.option('--url', 'operation_url', default=None, help='The URL for the deployment')
+@click.option('--fail-fast/--no-fail-fast', default=False, \
+    help='Stop the plays that are running as soon as one of them fails')
+@click.option('--play-timeout', type=int, default=None, \
+    help='The time (in seconds) that a play is allowed to run for')
+@click.option('--step-timeout', type=int, default=None, \
+    help='The time (in seconds) that a step is allowed to run for')
 @click.pass_context
 def cli(ctx, stage, path=os.getcwd(), **kwargs):
     """
@@ -51,12 +63,33 @@ def cli(ctx, stage, path=os.getcwd(), **kwargs):
         'debug': kwargs.get('debug', False),
         'operation_url': kwargs.get('operation_url'),
         'operation_id': os.environ.get(ENV_STACKMATE_OPERATION_ID),
+        'fail_fast': kwargs.get('fail_fast', False),
+        'play_timeout': kwargs.get('play_timeout'),
+        'step_timeout': kwargs.get('step_timeout'),
     }
 
 
 @cli.command(name='state')
-def state_commands():
+@click.option('--compact/--no-compact', default=False, \
+    help='Write the changes recorded in the state journal to the state file')
+@click.option('--migrate/--no-migrate', default=False, \
+    help='Store the state of every stage in a file of its own')
+@click.pass_context
+def state_commands(ctx, compact=False, migrate=False):
     """Inspect the project's state"""
+    # pylint: disable=import-outside-toplevel
+    from stackmate.state import State
+    from stackmate.locks import StateLock
+    from stackmate.configurations import migrate_branched_state
+
+    if migrate:
+        stages = migrate_branched_state(ctx.obj['path'])
+        click.echo(json.dumps({'migrated': stages}))
+
+    if compact:
+        # the journal can't be compacted while an operation is still recording changes in it
+        with StateLock(rootpath=ctx.obj['path'], stage=ctx.obj['stage'], timeout=0):
+            State.load(rootpath=ctx.obj['path'], stage=ctx.obj['stage']).compact()
 
 
 @cli.command(name='validate')
@@ -69,6 +102,10 @@ def validate_config():
 @click.option('--commit', 'commit_reference', default=None)
 @click.option('--author', 'commit_author', default=None)
 @click.option('--message', 'commit_message', default=None)
+@click.option('--resume/--no-resume', default=False, \
+    help='Resume a failed deployment, skipping the plays that have already completed')
+@click.option('--plan', default=None, type=click.Path(exists=True), \
+    help='Deploy the changes computed in a plan file')
 @click.pass_context
 def deploy(ctx, **kwargs):
     """
@@ -77,14 +114,34 @@ def deploy(ctx, **kwargs):
         STACKMATE_PUBLIC_KEY=... STACKMATE_PRIVATE_KEY=... \
             python3 cli.py --stage=production --path=./tests/data/mock-project deploy
     """
+    from stackmate.operations import DeploymentOperation # pylint: disable=import-outside-toplevel
+
     DeploymentOperation(**dict(**ctx.obj, **kwargs)).run()
 
 
+@cli.command()
+@click.option('--output', 'plan_file', default=None, type=click.Path(), \
+    help='The path to the plan file')
+@click.pass_context
+def plan(ctx, **kwargs):
+    """Compute the changes of a deployment, without deploying"""
+    # pylint: disable=import-outside-toplevel
+    from stackmate.operations import PlanOperation
+    from stackmate.planner import Planner
+
+    operation = PlanOperation(**dict(**ctx.obj, **kwargs))
+    changes = Planner.summary(operation.run())
+
+    click.echo(json.dumps({'plan': operation.plan_path, 'changes': changes}, indent=2))
+
+
 @cli.command()
 @click.option('--steps', default=1, help='How many releases to roll back to')
 @click.pass_context
 def rollback(ctx, **kwargs):
     """Roll back to the previous release"""
+    from stackmate.operations import RollbackOperation # pylint: disable=import-outside-toplevel
+
     RollbackOperation(**dict(**ctx.obj, **kwargs)).run()
 
 
@@ -7,17 +7,18 @@ from ansible.vars.manager import VariableManager as AnsibleVariableManager
 from ansible.inventory.manager import InventoryManager as AnsibleInventoryManager
 from ansible.executor.task_queue_manager import TaskQueueManager as AnsibleTaskQueueManager
 from stackmate.constants import STACKMATE_STATE_FACT
-from stackmate.configurations import ConfigurationFile
+from stackmate.configurations import CachedConfigurationFile
 from stackmate.deployables.service import Service
 
 
-class Configuration(ConfigurationFile):
+class Configuration(CachedConfigurationFile):
     """
     Configuration file that provides default ansible configurations
     """
     def __init__(self):
         super().__init__(
-            rootpath=os.path.join(os.getcwd(), 'stackmate', 'config'), \
+            rootpath=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), \
+                'config'),
             filename='ansible.yml')
 
 
@@ -32,14 +33,17 @@ class InventoryManager(AnsibleInventoryManager):
         return True
 
     def set_inventory(self, inventory):
-        """Sets the inventory as a dictionary"""
+        """Sets the inventory as a dictionary of groups, with the variables of every host"""
         for group, hosts in inventory.items():
             if not group in self._inventory.groups:
                 self._inventory.add_group(group)
 
-            for host in hosts:
+            for host, hostvars in hosts.items():
                 self._inventory.add_host(host, group)
 
+                for name, value in (hostvars or {}).items():
+                    self._inventory.set_variable(host, name, value)
+
         return self
 
 
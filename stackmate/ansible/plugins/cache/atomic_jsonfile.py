@@ -0,0 +1,38 @@
+"""Provides a JSON file cache for the facts, that can be read while it gets written"""
+# -*- coding: utf-8 -*-
+import json
+from ansible.parsing.ajson import AnsibleJSONEncoder
+from ansible.plugins.cache.jsonfile import CacheModule as JsonFileCacheModule
+from stackmate.helpers import write_atomically
+
+DOCUMENTATION = '''
+    cache: atomic_jsonfile
+    short_description: JSON formatted files, that are written atomically.
+    description:
+        - Same as the jsonfile cache, the files are replaced rather than written in place,
+          so that the workers never read the facts of a host while they're being written.
+    options:
+      _uri:
+        required: True
+        description:
+          - Path in which the cache plugin will save the JSON files
+        env:
+          - name: ANSIBLE_CACHE_PLUGIN_CONNECTION
+      _prefix:
+        description: User defined prefix to use when creating the JSON files
+        env:
+          - name: ANSIBLE_CACHE_PLUGIN_PREFIX
+      _timeout:
+        default: 86400
+        description: Expiration timeout for the cache plugin data
+        env:
+          - name: ANSIBLE_CACHE_PLUGIN_TIMEOUT
+        type: integer
+'''
+
+
+class CacheModule(JsonFileCacheModule):
+    """Caches the facts in JSON files, written atomically"""
+    def _dump(self, value, filepath):
+        contents = json.dumps(value, cls=AnsibleJSONEncoder, sort_keys=True, indent=4)
+        write_atomically(filepath, contents.encode('utf-8'))
@@ -5,6 +5,7 @@ import json
 import sys
 import uuid
 import logging
+import threading
 from datetime import datetime
 from ansible.plugins.callback import CallbackBase
 from ansible.parsing.ajson import AnsibleJSONEncoder
@@ -12,7 +13,8 @@ from ansible.vars.clean import strip_internal_keys, module_response_deepcopy
 from stackmate.constants import TASK_ACTION_START, TASK_ACTION_SUCCESS, TASK_ACTION_SKIP, \
                                 TASK_ACTION_FAILURE, LOCALHOST, ENV_STACKMATE_OPERATION_ID, \
                                 OUTPUT_TYPE_DEPLOYMENT, OUTPUT_TYPE_GROUP, OUTPUT_TYPE_TASK, \
-                                IGNORE_EMPTY_OUTPUT_TAG, LIVE_OUTPUT_TAG, COMMAND_VAR_TAG
+                                IGNORE_EMPTY_OUTPUT_TAG, LIVE_OUTPUT_TAG, COMMAND_VAR_TAG, \
+                                EVENT_OUTPUT
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
@@ -37,15 +39,42 @@ class CallbackModule(CallbackBase):
         self._task_start = datetime.utcnow()
         self._operation_id = os.environ.get(ENV_STACKMATE_OPERATION_ID)
         self._play_context = None
+        # the queue of the event channel, when the output is written by the parent process
+        self._events = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
 
     def set_play_context(self, play_context):
         """Sets the play context"""
         self._play_context = play_context
 
+    def set_event_queue(self, events):
+        """Publishes the output to the event channel of the parent process, instead of writing it"""
+        self._events = events
+
     def write(self, result):
         """Write output to stdout"""
-        self.results.append(result)
-        print(json.dumps(result, cls=AnsibleJSONEncoder))
+        line = json.dumps(result, cls=AnsibleJSONEncoder)
+
+        if self._events is not None:
+            self._events.put((EVENT_OUTPUT, line))
+            return
+
+        self.write_line(line, result)
+
+    def write_line(self, line, result=None):
+        """Writes an encoded result to stdout, one line at a time across threads"""
+        with self._lock:
+            self.results.append(result if result is not None else json.loads(line))
+            print(line)
 
     def explicit_deployment_output(self, status, **kwargs):
         """Logs explicit deployment output"""
@@ -80,6 +80,7 @@ def get_stackmate_aws_instances_state(variables):
             'name': name,
             'resource_id': instance_result['instance_id'],
             'ip': instance_result.get('public_ip_address'),
+            'private_ip': instance_result.get('private_ip_address'),
             'host': instance_result.get('public_dns_name'),
             'port': None,
         })
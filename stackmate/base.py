@@ -2,19 +2,41 @@
 Provides base classes
 """
 # -*- coding: utf-8 -*-
+import builtins
 import operator
-from pydoc import locate
-from functools import reduce
+from functools import reduce, lru_cache
 from collections import OrderedDict
-from stackmate.helpers import reduce_bool_list
+from stackmate.helpers import reduce_bool_list, add_yaml_representer
 from stackmate.exceptions import ValidationError
 
+_MISSING = object()
+
+
+@lru_cache(maxsize=None)
+def locate_datatype(name: str):
+    """Returns the type for its name, builtin types are located without importing pydoc"""
+    if isinstance(getattr(builtins, name, None), type):
+        return getattr(builtins, name)
+
+    from pydoc import locate # pylint: disable=import-outside-toplevel
+    return locate(name)
+
+
+@lru_cache(maxsize=None)
+def compile_path(path: str) -> tuple:
+    """Splits a dotted path into its parts, once for every path"""
+    return tuple(path.split('.'))
+
+
 class AttributeDict(OrderedDict):
     """
     A class to convert a nested Dictionary into an object with key-values
     that are accessible using attribute notation (AttrDict.attribute) instead of
     key notation (Dict["key"]). This class recursively sets Dicts to objects,
     allowing you to recurse down nested dicts (like: AttrDict.attr.attr)
+
+    Nested values are only wrapped when they're first accessed as attributes,
+    and copies share the nested values until they're updated using `set_path`
     """
     __slots__ = () # helps with memory usage
 
@@ -23,16 +45,51 @@ class AttributeDict(OrderedDict):
     # https://stackoverflow.com/questions/4984647/accessing-dict-keys-like-an-attribute
     # http://databio.org/posts/python_AttributeDict.html
     # https://stackoverflow.com/questions/3387691/how-to-perfectly-override-a-dict
-    def __init__(self, iterable, **kwargs):
-        super().__init__(iterable, **kwargs)
-        self._set_iterable(iterable)
+    def __init__(self, iterable=None, **kwargs):
+        super().__init__(iterable or {}, **kwargs)
+
+    def __getattr__(self, name):
+        # only called when the value hasn't been wrapped yet
+        if name.startswith('__') or name not in self:
+            raise AttributeError(name)
+
+        return self._get_attribute(name)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate(key)
+
+    def pop(self, key, *args):
+        self._invalidate(key)
+        return super().pop(key, *args)
+
+    def popitem(self, last=True):
+        key, value = super().popitem(last)
+        self._invalidate(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        self._invalidate(key)
+        return super().setdefault(key, default)
+
+    def clear(self):
+        super().clear()
+        self.__dict__.clear()
 
     def get_path(self, path, default=None):
         """Returns a path in the state"""
         result = default
+        [name, *parts] = compile_path(path)
+
+        if name not in self:
+            return default
 
         try:
-            result = reduce(operator.getitem, path.split('.'), self.__dict__)
+            result = reduce(operator.getitem, parts, self._get_attribute(name))
         except KeyError:
             result = default
         except TypeError:
@@ -40,43 +97,155 @@ class AttributeDict(OrderedDict):
 
         return result
 
+    def get_paths(self, *paths, default=None) -> list:
+        """Returns the values for many paths at once, in the order they were specified"""
+        return [self.get_path(path, default) for path in paths]
+
     def set_path(self, path, contents):
         """Updates a part of the state for a given path"""
         if not path:
             raise ValueError('The path to update should not be empty')
 
         current_dict = self
-        parts = path.split('.')
+        parts = compile_path(path)
 
         for part in parts[:-1]:
-            if part not in current_dict:
-                current_dict[part] = {}
-
+            # copy the dictionaries along the path, they might be shared with other copies
+            current_dict[part] = current_dict[part].copy() if part in current_dict else {}
             current_dict = current_dict[part]
 
         current_dict[parts[-1]] = contents
 
-        self._set_iterable(current_dict)
-
         return self
 
-    def _set_iterable(self, iterable):
-        """Sets the dictionary values"""
-        for key, value in iterable.items():
+    def _get_attribute(self, name):
+        """Returns the value for a key, wrapped (once) in attribute dicts"""
+        if name not in self.__dict__:
+            value = self[name]
+
             if isinstance(value, dict):
-                self.__dict__[key] = AttributeDict(value)
+                value = AttributeDict(value)
             elif isinstance(value, list):
-                self.__dict__[key] = [
-                    AttributeDict(v) for v in value if isinstance(v, dict)
-                ]
-            else:
-                self.__dict__[key] = value
+                value = [AttributeDict(v) for v in value if isinstance(v, dict)]
+
+            self.__dict__[name] = value
+
+        return self.__dict__[name]
+
+    def _invalidate(self, key):
+        """Discards the wrapped value for a key that has been updated"""
+        self.__dict__.pop(key, None)
+
+    def copy(self):
+        """Copies the current attribute dict, the nested values are shared with the copy"""
+        return AttributeDict(self)
+
+    def __reduce__(self):
+        # the wrapped values are rebuilt on access, no need to serialize them
+        return (self.__class__, (dict(self),))
+
+
+class CachedAttributeDict(AttributeDict):
+    """
+    Attribute dict for read-only configurations, which memoizes the values for the paths
+    that are looked up. The memoized values are discarded whenever a key is updated
+    """
+    __slots__ = ('_path_cache',)
+
+    def __init__(self, iterable=None, **kwargs):
+        self._path_cache = {}
+        super().__init__(iterable, **kwargs)
+
+    def get_path(self, path, default=None):
+        """Returns a path in the configuration, looking it up only once"""
+        result = self._path_cache.get(path, _MISSING)
+
+        if result is _MISSING:
+            result = self._path_cache[path] = super().get_path(path, _MISSING)
+
+        return default if result is _MISSING else result
+
+    def clear(self):
+        super().clear()
+        self._path_cache.clear()
+
+    def _invalidate(self, key):
+        """Discards the wrapped value and the memoized paths for a key that has been updated"""
+        super()._invalidate(key)
+        self._path_cache.clear()
+
+    def copy(self):
+        """Copies the current attribute dict, the nested values are shared with the copy"""
+        return CachedAttributeDict(self)
+
+
+class FrozenDict(dict):
+    """
+    A read-only dictionary. Serialized models are cached and handed out as such,
+    so that callers can't modify the cached copy
+    """
+    __slots__ = ()
+
+    def _readonly(self, *_args, **_kwargs):
+        raise TypeError('The dictionary is read-only, copy it before modifying it')
 
-        return self.__dict__
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
 
     def copy(self):
-        """Copies the current attribute dict"""
-        return AttributeDict(dict(self).copy())
+        """Returns a modifiable copy of the dictionary, along with the values nested in it"""
+        return thaw(self)
+
+
+class FrozenList(list):
+    """A read-only list, for the lists nested in the serialized models"""
+    __slots__ = ()
+
+    def _readonly(self, *_args, **_kwargs):
+        raise TypeError('The list is read-only, copy it before modifying it')
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+    def copy(self):
+        """Returns a modifiable copy of the list, along with the values nested in it"""
+        return thaw(self)
+
+
+def freeze(value):
+    """Returns a read-only copy of a value, along with the dicts and lists nested in it"""
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze(item) for key, item in value.items()})
+
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+
+    return value
+
+
+def thaw(value):
+    """Returns a modifiable copy of a value, along with the dicts and lists nested in it"""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+
+    return value
+
+
+add_yaml_representer(FrozenDict, lambda d, v: d.represent_dict(dict(v)))
+add_yaml_representer(FrozenList, lambda d, v: d.represent_list(list(v)))
+add_yaml_representer(AttributeDict, lambda d, v: d.represent_dict(dict(v)), multi=True)
 
 
 class ModelAttribute:
@@ -86,7 +255,7 @@ class ModelAttribute:
 
     def __init__(self, required=False, datatype=str, default=None, **kwargs):
         self.required = required
-        self.datatype = locate(datatype) if isinstance(datatype, str) else datatype
+        self.datatype = locate_datatype(datatype) if isinstance(datatype, str) else datatype
         self.default = default
         self.shape = kwargs.get('shape')
         self.choices = kwargs.get('choices')
@@ -96,6 +265,17 @@ class ModelAttribute:
 
         self.setup_validations()
 
+    def copy(self):
+        """Returns a copy of the attribute"""
+        return ModelAttribute(
+            required=self.required,
+            datatype=self.datatype,
+            default=self.default,
+            shape=self.shape,
+            choices=self.choices,
+            name=self.name,
+            serializable=self.serializable)
+
     def set_params(self, **options):
         """
         Sets the attribute's params
@@ -228,12 +408,17 @@ class ModelAttribute:
         }
 
 
+# the attributes declared on every model class, looked up once per class
+_CLASS_ATTRIBUTES = {}
+
+
 class Model:
     """
     Provides support to dynamically load attributes via a YML configuration
     """
     def __init__(self, **kwargs):
         self._attributes = {}
+        self._serialized = None
         self.__values = {}
         self.setup_attributes(additional_setup=kwargs.get('model_setup', {}))
         self.errors = {}
@@ -246,13 +431,7 @@ class Model:
         """
         Initialize the attributes for the model
         """
-        attributes = {}
-        for name in dir(self.__class__):
-            att = getattr(self.__class__, name)
-
-            if isinstance(att, ModelAttribute):
-                attr_name = name[1:]
-                attributes[attr_name] = att
+        attributes = dict(self.get_class_attributes())
 
         if not isinstance(additional_setup, dict):
             raise ValueError(
@@ -272,10 +451,33 @@ class Model:
             # setup the instance variable
             setattr(self, name, att.default)
 
+    @classmethod
+    def get_class_attributes(cls) -> dict:
+        """Returns the attributes that are declared on the class"""
+        if cls not in _CLASS_ATTRIBUTES:
+            attributes = {}
+
+            for name in dir(cls):
+                att = getattr(cls, name)
+
+                if isinstance(att, ModelAttribute):
+                    attributes[name[1:]] = att
+
+            _CLASS_ATTRIBUTES[cls] = attributes
+
+        return _CLASS_ATTRIBUTES[cls]
+
     # This is just to make the linter happy
     def __getattribute__(self, name): # pylint: disable=useless-super-delegation
         return super().__getattribute__(name)
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+
+        # setting any of the attributes invalidates the cached serialization
+        if name in getattr(self, '_attributes', {}):
+            super().__setattr__('_serialized', None)
+
     @property
     def attribute_names(self):
         """Returns the attribute names"""
@@ -308,7 +510,10 @@ class Model:
             raise AttributeError('Attribute {at} in model {m} was not found'.format(
                 at=attr, m=self.__class__.__name__))
 
+        # attributes are shared among the instances of a class, copy before updating
+        self._attributes[attr] = self._attributes[attr].copy()
         self._attributes[attr].set_params(**params)
+        self._serialized = None
 
     def validate(self):
         """
@@ -332,21 +537,40 @@ class Model:
         return True
 
     def serialize(self):
-        """Serializes a model"""
+        """
+        Serializes a model. The result is cached until any of the attributes is set
+        and is read-only, along with the values nested in it.
+        Use `model.serialize().copy()` for a copy that can be modified
+        """
+        if self._serialized is not None:
+            return self._serialized
+
         serialized = {}
+        # nested models might change without us knowing, the result can't be cached
+        cacheable = True
 
         for name in self.serializable_attributes:
-            attr = self.attributes[name]
+            attr = getattr(self, name)
 
             if isinstance(attr, Model):
                 serialized[name] = attr.serialize()
-            elif isinstance(attr, list) and all([isinstance(m, Model) for m in attr]):
+                cacheable = False
+            elif isinstance(attr, list) and attr and all([isinstance(m, Model) for m in attr]):
                 serialized[name] = [m.serialize() for m in attr]
-            elif isinstance(attr, dict) and all([isinstance(m, Model) for m in attr.values()]):
+                cacheable = False
+            elif isinstance(attr, dict) and attr and \
+                    all([isinstance(m, Model) for m in attr.values()]):
                 serialized[name] = {k: m.serialize() for k, m in attr.items()}
+                cacheable = False
             else:
                 serialized[name] = attr
 
+        # the values nested in the result are shared with every caller, they're read-only too
+        serialized = freeze(serialized)
+
+        if cacheable:
+            self._serialized = serialized
+
         return serialized
 
     def __dict__(self):
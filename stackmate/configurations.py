@@ -3,8 +3,8 @@
 
 import os
 from abc import ABC
-from stackmate.base import AttributeDict
-from stackmate.helpers import read_yaml, write_yaml
+from stackmate.base import AttributeDict, CachedAttributeDict
+from stackmate.helpers import read_yaml, write_yaml, read_compiled_yaml
 from stackmate.exceptions import ProjectFileMissingError, ProjectFileCorruptedError, \
     ConfigurationFileUnreadableError
 
@@ -12,11 +12,18 @@ from stackmate.exceptions import ProjectFileMissingError, ProjectFileCorruptedEr
 PROJECT_CONFIG_FILE = 'config.yml'
 OPERATIONS_CONFIG_FILE = 'operations.yml'
 STATE_CONFIG_FILE = 'state.yml'
+STATE_DIRECTORY = 'state'
+STATE_INDEX_FILE = 'index.yml'
+STAGE_STATE_FILE = '{stage}.yml'
+MIGRATED_STATE_CONFIG_FILE = 'state.yml.migrated'
 MAIN_CONFIG_FILE = 'stackmate.yml'
 VAULT_FILE = 'vault.yml'
 
 class ConfigurationFile(ABC):
     """Abstract class representing configuration files"""
+    # files that are not edited by hand are dumped using the faster emitter
+    FAST_YAML = False
+
     def __init__(self, rootpath=None, filename=None):
         self.rootpath = rootpath if rootpath else os.getcwd()
         self._filename = filename
@@ -60,7 +67,7 @@ class ConfigurationFile(ABC):
 
     def write(self):
         """Writes the configuration file"""
-        return write_yaml(self.path, self._contents)
+        return write_yaml(self.path, self._contents, fast=self.__class__.FAST_YAML)
 
     def _parse_contents(self, contents):
         # pylint: disable=no-self-use
@@ -153,7 +160,21 @@ class CreatableConfiguration(ConfigurationFile):
         return contents
 
 
-class StackmateConfiguration(ReadOnlyConfigurationFile):
+class CachedConfigurationFile(ReadOnlyConfigurationFile):
+    """
+    Read-only configuration file, where the paths looked up are memoized.
+    The file is only parsed when it has changed since it was last read (see `read_compiled_yaml`)
+    """
+    def read(self):
+        """Read the configuration file"""
+        return self._parse_contents(read_compiled_yaml(self.path))
+
+    def _parse_contents(self, contents):
+        """Parses the file's contents"""
+        return CachedAttributeDict(contents or {})
+
+
+class StackmateConfiguration(CachedConfigurationFile):
     """Represents the global application's configuration"""
 
     def __init__(self):
@@ -162,7 +183,7 @@ class StackmateConfiguration(ReadOnlyConfigurationFile):
             filename=MAIN_CONFIG_FILE)
 
 
-class OperationsConfiguration(ReadOnlyConfigurationFile):
+class OperationsConfiguration(CachedConfigurationFile):
     """Represents the operations to be executed in playbooks"""
 
     def __init__(self):
@@ -202,7 +223,8 @@ class ProjectConfiguration(ReadOnlyConfigurationFile, BranchedConfiguration):
 
 class ProjectState(BranchedConfiguration, CreatableConfiguration):
     """
-    The Project's state file
+    The Project's state file, where the state of all stages is stored together.
+    It is superseded by a state file per stage (see `StageState`) and only read when migrating
     """
     ROOT_ATTRIBUTES = ['version']
 
@@ -211,6 +233,114 @@ class ProjectState(BranchedConfiguration, CreatableConfiguration):
         self.set_branch(stage)
 
 
+class StateIndex(CreatableConfiguration):
+    """The index of the stages that have a state file in the state directory"""
+    FAST_YAML = True
+
+    def __init__(self, rootpath):
+        super().__init__(
+            rootpath=os.path.join(rootpath or os.getcwd(), STATE_DIRECTORY),
+            filename=STATE_INDEX_FILE)
+        self.project_path = rootpath
+
+    @property
+    def stages(self) -> list:
+        """Returns the stages that have a state file"""
+        return list(self.contents.get('stages') or [])
+
+    def add(self, *stages):
+        """Adds stages to the index, the index is only written when there are new ones"""
+        from stackmate.locks import StateLock # pylint: disable=import-outside-toplevel
+
+        if all(stage in self.stages for stage in stages):
+            return False
+
+        # stages of the project can be written concurrently, the index is updated exclusively
+        with StateLock(rootpath=self.project_path):
+            self.contents = self.read()
+            current = self.stages
+
+            if all(stage in current for stage in stages):
+                return False
+
+            self.contents = dict(self.contents, stages=sorted(set(current).union(stages)))
+            return self.write()
+
+    def write(self):
+        """Writes the index file"""
+        os.makedirs(self.rootpath, exist_ok=True)
+        return super().write()
+
+
+class StageState(CreatableConfiguration):
+    """
+    The project's state for a single stage, stored in a file of its own in the state
+    directory, so that loading and writing a stage doesn't involve the other ones
+    """
+    FAST_YAML = True
+
+    def __init__(self, rootpath, stage):
+        super().__init__(
+            rootpath=os.path.join(rootpath or os.getcwd(), STATE_DIRECTORY),
+            filename=STAGE_STATE_FILE.format(stage=stage))
+        self.stage = stage
+        self.index = StateIndex(rootpath)
+
+    def write(self):
+        """Writes the stage's state file and adds the stage to the index"""
+        os.makedirs(self.rootpath, exist_ok=True)
+        written = super().write()
+        self.index.add(self.stage)
+
+        return written
+
+
+def is_state_migrated(rootpath) -> bool:
+    """Whether the state file where the stages are stored together has been split per stage"""
+    return not ProjectState(rootpath=rootpath, stage=None).exists or StateIndex(rootpath).exists
+
+
+def migrate_branched_state(rootpath) -> list:
+    """
+    Splits the state file where the stages are stored together (see `ProjectState`)
+    into a file per stage. Returns the stages that were migrated
+    """
+    from stackmate.locks import StateLock # pylint: disable=import-outside-toplevel
+
+    if is_state_migrated(rootpath):
+        return []
+
+    with StateLock(rootpath=rootpath):
+        # the state might have been migrated while we were waiting for the lock
+        if is_state_migrated(rootpath):
+            return []
+
+        return _split_branched_state(rootpath)
+
+
+def _split_branched_state(rootpath) -> list:
+    """Writes the state of every stage in a file of its own, returns the stages"""
+    legacy = ProjectState(rootpath=rootpath, stage=None)
+    index = StateIndex(rootpath)
+
+    full_contents = read_yaml(legacy.path) or {}
+    root = legacy.get_root_attributes(full_contents)
+    stages = [k for k in full_contents if k not in ProjectState.ROOT_ATTRIBUTES]
+
+    for stage in stages:
+        stage_state = StageState(rootpath=rootpath, stage=stage)
+        os.makedirs(stage_state.rootpath, exist_ok=True)
+        write_yaml(stage_state.path, dict(**root, **(full_contents[stage] or {})), fast=True)
+
+    index.contents = {'stages': sorted(stages)}
+    index.write()
+
+    # keep the original file around, it's no longer read
+    os.replace(legacy.path, os.path.join(legacy.rootpath, MIGRATED_STATE_CONFIG_FILE))
+
+    return stages
+
+
 class ProjectVault(CreatableConfiguration):
     """Represents the project vault where the credentials are stored"""
     def __init__(self, rootpath):
@@ -30,6 +30,8 @@ DEPLOYMENT_STARTED = 'started'
 DEPLOYMENT_SUCCESS = 'success'
 DEPLOYMENT_FAILURE = 'failure'
 DEPLOYMENT_CANCEL = 'cancelled'
+DEPLOYMENT_TIMEOUT = 'timeout'
+DEPLOYMENT_RESUMED = 'resumed'
 
 # Project types
 PROJECT_TYPE_RAILS = 'rails'
@@ -70,6 +72,13 @@ ENV_PUBLIC_KEY = 'STACKMATE_PUBLIC_KEY'
 ENV_PRIVATE_KEY = 'STACKMATE_PRIVATE_KEY'
 ENV_MITOGEN_PATH = 'STACKMATE_MITOGEN_PATH'
 ENV_STACKMATE_OPERATION_ID = 'STACKMATE_OPERATION_ID'
+ENV_WORKER_START_METHOD = 'STACKMATE_WORKER_START_METHOD'
+ENV_FORKS_BUDGET = 'STACKMATE_FORKS_BUDGET'
+ENV_PLAY_TIMEOUT = 'STACKMATE_PLAY_TIMEOUT'
+ENV_STEP_TIMEOUT = 'STACKMATE_STEP_TIMEOUT'
+ENV_STATE_BACKEND = 'STACKMATE_STATE_BACKEND'
+ENV_STATE_LOCK_TIMEOUT = 'STACKMATE_STATE_LOCK_TIMEOUT'
+ENV_CACHE_DIR = 'STACKMATE_CACHE_DIR'
 
 # Services that are loadbalanced
 LOAD_BALANCED_SERVICES = {'application'}
@@ -104,6 +113,10 @@ FLATTENED_PROVISION_PARAM_ROLES = set([
 
 INVENTORY_INCLUDED_ROLES = ['instances']
 
+# Play variables that change on every operation and should not invalidate
+# the plays that have completed when resuming an operation
+FINGERPRINT_IGNORED_VARS = ['operation_id', 'operation_url']
+
 # Keys to preserve from the original resource output,
 # when they're specified as empty in a state update process
 STATE_OUTPUT_PRESERVED_KEYS = [
@@ -119,9 +132,37 @@ FORCED_STRATEGIES_PER_ROLE = {
     'mailer': STRATEGY_LINEAR,
 }
 
-# Increase the number of ansible forks
+# Increase the number of ansible forks.
+# This is the budget shared among all the plays that run concurrently
 ANSIBLE_FORKS_NUM = 100
 
+# How the processes of the worker pool that runs the plays are started
+WORKER_START_METHOD_FORK = 'fork'
+WORKER_START_METHOD_FORKSERVER = 'forkserver'
+WORKER_START_METHODS = [
+    WORKER_START_METHOD_FORK,
+    WORKER_START_METHOD_FORKSERVER,
+]
+# How long a worker is given to stop a play that ran out of time, in seconds.
+# Workers that don't stop it by then are considered hung, and get terminated
+PLAY_TIMEOUT_GRACE = 10
+
+# The events that the workers stream to the parent process.
+# Workers block once the channel holds as many events, until the parent catches up
+EVENT_CHANNEL_SIZE = 1000
+# How long to wait for the events of a play that completed, in seconds
+EVENT_CHANNEL_TIMEOUT = 10
+EVENT_OUTPUT = 'output'
+EVENT_PLAY_COMPLETED = 'play_completed'
+EVENT_CHANNEL_CLOSED = 'closed'
+
+# The facts gathered on the hosts are cached for the whole operation, shared by the workers.
+# With the `smart` gathering, the facts of every host are only gathered by the first play on it.
+# The files of the cache are replaced atomically, since the workers read them concurrently
+FACT_CACHE_PLUGIN = 'atomic_jsonfile'
+# the cache only lives as long as the operation, its facts don't expire
+FACT_CACHE_TIMEOUT = 0
+
 
 # Attributes that can be found in the configuration file with a different name
 CONFIG_RENAMED_ATTRIBUTES = {
@@ -228,6 +269,20 @@ LIVE_OUTPUT_TAG = 'live_output'
 COMMAND_VAR_TAG = 'has_command_var'
 IGNORE_EMPTY_OUTPUT_TAG = 'ignore_empty_output'
 
+# The time (in seconds) within which state commits are batched into a single write
+STATE_SAVE_INTERVAL = 1
+
+# The backends where the state can be stored
+STATE_BACKEND_YAML = 'yaml'
+STATE_BACKEND_SQLITE = 'sqlite'
+STATE_BACKENDS = [STATE_BACKEND_YAML, STATE_BACKEND_SQLITE]
+
+# The time (in seconds) to wait for another operation on the same stage to release its lock,
+# and the time after which a lock is considered abandoned
+STATE_LOCK_TIMEOUT = 3600
+STATE_LOCK_STALE_AFTER = 24 * 3600
+STATE_LOCK_POLL_INTERVAL = 0.5
+
 # How many attempts should we do in order to get an APT lock
 APT_RETRIES = 50
 APT_DELAY = 15
@@ -1,6 +1,7 @@
 """Deployables are either dependencies or services that can be deployed"""
 # -*- coding: utf-8 -*-
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from stackmate.base import Model, ModelAttribute
 from stackmate.core.credentials import Credentials
 from stackmate.configurations import STACKMATE_CONFIGURATION
@@ -45,6 +46,16 @@ def parse_deployable_config(cfg, **kwargs):
     return parsed
 
 
+@lru_cache(maxsize=None)
+def get_replacement_triggers(kind) -> tuple:
+    """Returns the attributes that trigger a replacement for a deployable kind"""
+    default, specific = STACKMATE_CONFIGURATION.get_paths(
+        'services.replacement_triggers.default',
+        'services.replacement_triggers.{}'.format(kind), default=[])
+
+    return tuple(default + specific)
+
+
 class Deployable(Model, ABC):
     """Represents a deployable, either a service, a dependency or utility"""
     _kind = ModelAttribute(required=True, datatype=str)
@@ -205,9 +216,7 @@ class Deployable(Model, ABC):
         if self.rolename == 'databases' and hasattr(self, 'provider') and self.provider == 'aws':
             return []
 
-        cfg = STACKMATE_CONFIGURATION
-        return cfg.get_path('services.replacement_triggers.default', []) + \
-            cfg.get_path('services.replacement_triggers.{}'.format(self.kind), [])
+        return list(get_replacement_triggers(self.kind))
 
     def diff_ignored_keys(self):
         """Returns the keys that should be ignored when diff-ing two deployables"""
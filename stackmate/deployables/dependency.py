@@ -2,6 +2,7 @@
 Dependencies that can be deployed in the systems
 """
 # -*- coding: utf-8 -*-
+from functools import lru_cache
 from stackmate.base import ModelAttribute
 from stackmate.deployables import Deployable, parse_deployable_config
 from stackmate.exceptions import DependencyNotAvailableError
@@ -42,6 +43,13 @@ class Dependency(Deployable):
             raise DependencyNotAvailableError(
                 'The dependency named {n} is not available in Stackmate'.format(n=kind))
 
+        return Dependency(model_setup=Dependency.get_model_setup(kind), from_factory=True, \
+            host_groups=host_groups, **kwargs)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_model_setup(kind) -> dict:
+        """Returns the attributes for a dependency kind, they are only set up once per kind"""
         attributes = STACKMATE_CONFIGURATION.get_path('dependencies.attributes.{kind}'.format(
             kind=kind)) or {}
 
@@ -49,14 +57,13 @@ class Dependency(Deployable):
             attr: ModelAttribute(name=attr, **opts) for attr, opts in attributes.items() if opts
         }
 
+        choices, default = STACKMATE_CONFIGURATION.get_paths(
+            'versions.{d}.available'.format(d=kind), 'versions.{d}.default'.format(d=kind))
+
         setup['version'] = ModelAttribute(
-            required=True,
-            datatype=str,
-            choices=STACKMATE_CONFIGURATION.get_path('versions.{d}.available'.format(d=kind)),
-            default=STACKMATE_CONFIGURATION.get_path('versions.{d}.default'.format(d=kind))
-        )
+            required=True, datatype=str, choices=choices, default=default)
 
-        return Dependency(model_setup=setup, from_factory=True, host_groups=host_groups, **kwargs)
+        return setup
 
     @staticmethod
     def collect(project, services):
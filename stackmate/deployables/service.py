@@ -1,5 +1,6 @@
 """The service types that are available in the system"""
 # -*- coding: utf-8 -*-
+from functools import lru_cache
 from stackmate.base import ModelAttribute
 from stackmate.deployables import Deployable, parse_deployable_config
 from stackmate.exceptions import ServiceNotAvailableError
@@ -16,6 +17,7 @@ class Service(Deployable):
     _dependencies = ModelAttribute(required=False, datatype=list, default=[], serializable=False)
 
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_deployable_subclass(kind, provider=None):
         """Determine the class to be instantiated"""
         managed = set(STACKMATE_CONFIGURATION.get_path('services.managed.{}'.format(provider), []))
@@ -43,14 +45,7 @@ class Service(Deployable):
         if not kind:
             raise ValueError('You have to provide the service to instantiate')
 
-        attributes = STACKMATE_CONFIGURATION.get_path('services.attributes.{kind}'.format(
-            kind=kind)) or {}
-
-        setup = {
-            attr: ModelAttribute(name=attr, **opts) for attr, opts in attributes.items() if opts
-        }
-
-        service_args = dict(from_factory=True, model_setup=setup, **config)
+        service_args = dict(from_factory=True, model_setup=Service.get_model_setup(kind), **config)
 
         service_class = Service.get_deployable_subclass(kind, provider)
 
@@ -59,6 +54,17 @@ class Service(Deployable):
 
         return service_class(**service_args)
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_model_setup(kind) -> dict:
+        """Returns the attributes for a service kind, they are only set up once per kind"""
+        attributes = STACKMATE_CONFIGURATION.get_path('services.attributes.{kind}'.format(
+            kind=kind)) or {}
+
+        return {
+            attr: ModelAttribute(name=attr, **opts) for attr, opts in attributes.items() if opts
+        }
+
     @staticmethod
     def collect(project):
         """Collect all the services of a kind available"""
@@ -8,9 +8,9 @@ Utilities are provider-agnostic otherwise they're managed services
 import os
 import json
 from abc import abstractmethod
-from jinja2 import Template
+from functools import lru_cache
 from stackmate.base import ModelAttribute
-from stackmate.constants import LOCALHOST
+from stackmate.constants import LOCALHOST, DIFF_IGNORE_KEYS
 from stackmate.deployables import Deployable, parse_deployable_config
 from stackmate.exceptions import UtilityNotAvailableError
 from stackmate.configurations import STACKMATE_CONFIGURATION
@@ -47,23 +47,28 @@ class Utility(Deployable):
         if not kind:
             raise ValueError('You have to provide the name of the utility to instantiate')
 
-        attributes = STACKMATE_CONFIGURATION.get_path(
-            'utilities.attributes.{kind}'.format(kind=kind), {})
-
         # get the utility's dedicated class
         utility_class = Utility.get_deployable_subclass(kind, provider=config.get('provider'))
 
         if not utility_class:
             raise UtilityNotAvailableError('There is no utility class for utility %s' % kind)
 
-        # process the dynamic model attributes
-        setup = {attr: ModelAttribute(name=attr, **opts) for attr, opts in attributes.items()}
         # form the utility init arguments
-        init_args = dict(model_setup=setup, from_factory=True, **config)
+        init_args = dict(model_setup=Utility.get_model_setup(kind), from_factory=True, **config)
 
         return utility_class(**init_args)
 
     @staticmethod
+    @lru_cache(maxsize=None)
+    def get_model_setup(kind) -> dict:
+        """Returns the dynamic attributes for a utility kind, they are only set up once per kind"""
+        attributes = STACKMATE_CONFIGURATION.get_path(
+            'utilities.attributes.{kind}'.format(kind=kind), {})
+
+        return {attr: ModelAttribute(name=attr, **opts) for attr, opts in attributes.items()}
+
+    @staticmethod
+    @lru_cache(maxsize=None)
     def get_deployable_subclass(kind, provider=None):
         """Utilities have dedicated sub-classes, this method detects which class to instantiate"""
         try:
@@ -86,10 +91,10 @@ class Utility(Deployable):
     @staticmethod
     def available(provider) -> set:
         """Returns the utility available for a specific provider"""
-        return set(
-            STACKMATE_CONFIGURATION.get_path('utilities.available', []) +
-            STACKMATE_CONFIGURATION.get_path('utilities.managed.%s' % provider, [])
-        )
+        available, managed = STACKMATE_CONFIGURATION.get_paths(
+            'utilities.available', 'utilities.managed.%s' % provider, default=[])
+
+        return set(available + managed)
 
     @staticmethod
     def collect(kind, project, services, dependencies=None):
@@ -451,6 +456,9 @@ class EnvironmentUtility(Utility):
             substitutions.update(node)
             substitutions.update({'host': node.get('host') or node.get('ip')})
 
+        # jinja is only imported once there are variables to render
+        from jinja2 import Template # pylint: disable=import-outside-toplevel
+
         # Finally render the value and key making sure that it's safe to render in jinja
         self.set_attribute(
             'value', jinja_safe(Template(str(self.raw or '')).render(**substitutions)))
@@ -658,6 +666,7 @@ class PrepareUtility(Utility):
 class ProjectUtility(Utility):
     """Handles the project role"""
     DAEMON_ROLES = {'nginx', 'workers', 'appservers'}
+    DIFF_IGNORE_KEYS = DIFF_IGNORE_KEYS + ['release_path', 'release_success', 'removed_releases']
     default_host_groups = ['application', 'workers']
 
     @staticmethod
@@ -719,4 +728,4 @@ class ProjectUtility(Utility):
     def diff_ignored_keys(self):
         """Returns the keys that should be ignored when diff-ing two deployables"""
         # pylint: disable=no-self-use
-        return super().diff_ignored_keys() + ['release_path', 'release_success', 'removed_releases']
+        return self.DIFF_IGNORE_KEYS
@@ -0,0 +1,99 @@
+"""Channel that streams events from the worker processes to the parent process"""
+# -*- coding: utf-8 -*-
+import queue
+import logging
+import threading
+import multiprocessing
+from stackmate.constants import EVENT_CHANNEL_SIZE, EVENT_CHANNEL_TIMEOUT, \
+                                EVENT_PLAY_COMPLETED, EVENT_CHANNEL_CLOSED
+
+
+class EventChannel:
+    """
+    Streams the events published by the workers to a sink in the parent, on a thread of its own.
+
+    Events are passed on in the order that every worker published them, so the events
+    of a play stay in order. The queue is bounded, workers block once it is full.
+
+    Workers that get killed while publishing can leave the queue unusable (eg. holding its
+    write lock), the channel should not be used any longer once its workers are terminated
+    """
+    def __init__(self, sink, start_method=None, maxsize=EVENT_CHANNEL_SIZE):
+        # the queue is handed to the workers when they start, it has to share their context
+        self.queue = multiprocessing.get_context(start_method).Queue(maxsize)
+        self.sink = sink
+        self._completed = set()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        """Starts passing the events on to the sink"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._consume, daemon=True)
+            self._thread.start()
+
+        return self
+
+    def _consume(self):
+        """Passes the events on to the sink, until the channel is closed"""
+        while True:
+            try:
+                kind, payload = self.queue.get()
+            except Exception: # pylint: disable=broad-except
+                # the queue was closed, or a worker got killed while publishing
+                # and left a truncated event behind, which is skipped
+                if self._closed:
+                    break
+                logging.exception('Skipping an event that could not be read')
+                continue
+
+            if kind == EVENT_CHANNEL_CLOSED:
+                break
+
+            if kind == EVENT_PLAY_COMPLETED:
+                with self._condition:
+                    self._completed.add(payload)
+                    self._condition.notify_all()
+                continue
+
+            try:
+                self.sink(kind, payload)
+            except Exception: # pylint: disable=broad-except
+                # the events of the other plays should still be passed on
+                logging.exception('The sink failed to process an event of kind %s', kind)
+
+    def wait(self, token, timeout=EVENT_CHANNEL_TIMEOUT) -> bool:
+        """Waits until the events of a play have been passed on to the sink"""
+        with self._condition:
+            completed = self._condition.wait_for(lambda: token in self._completed, timeout)
+            self._completed.discard(token)
+
+        return completed
+
+    def close(self, timeout=EVENT_CHANNEL_TIMEOUT):
+        """
+        Passes on the events left in the channel and stops. The events that can't
+        be passed on within the timeout (eg. the queue is broken) are dropped
+        """
+        if self._thread is None:
+            return
+
+        try:
+            self.queue.put((EVENT_CHANNEL_CLOSED, None), timeout=timeout)
+        except queue.Full:
+            pass
+
+        self._thread.join(timeout)
+        self._thread = None
+        self._closed = True
+
+        # the queue might never be flushed if a worker died holding its lock, don't wait for it
+        self.queue.cancel_join_thread()
+        self.queue.close()
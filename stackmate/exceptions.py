@@ -19,6 +19,18 @@ class ConfigurationFileUnreadableError(Exception):
 class DeploymentFailedError(Exception):
     """Throw when a deployment fails"""
 
+class DeploymentTimeoutError(DeploymentFailedError):
+    """Throw when a play or a step of the deployment takes longer than allowed"""
+
+class StateLockedError(Exception):
+    """Throw when the state of a stage is locked by another operation for longer than we can wait"""
+
+class StateMigrationRequiredError(Exception):
+    """Throw when the state of the stages is still stored together and has to be migrated"""
+
+class InvalidPlanError(Exception):
+    """Throw when a plan cannot be executed (eg. the state has changed since it was computed)"""
+
 class ServiceNotAvailableError(Exception):
     """Throw when trying to instantiate an invalid service"""
 
@@ -1,13 +1,17 @@
 """Helper functions"""
 # -*- coding: utf-8 -*-
+import os
 import re
+import stat
 import random
+import tempfile
+import pickle
 import hashlib
 import string
 from functools import reduce
 from operator import iconcat
 import yaml
-from ansible.utils.unsafe_proxy import AnsibleUnsafeText
+from stackmate.constants import ENV_CACHE_DIR
 
 BLOCKSIZE = 65536
 DEFAULT_REMOVED_CHARS = ["'", '"', '`', ',', '\\']
@@ -20,8 +24,27 @@ class YamlDumper(yaml.Dumper): # pylint: disable=too-many-ancestors
         return super().increase_indent(flow, False)
 
 
-yaml.add_representer(
-    AnsibleUnsafeText, lambda d, v: d.represent_scalar('tag:yaml.org,2002:str', str(v)))
+# libyaml's parser and emitter are used when available. The emitter doesn't allow
+# for the indentation fix, it's only used for the files that are not edited by hand
+YamlLoader = yaml.CFullLoader if yaml.__with_libyaml__ else yaml.FullLoader
+FastYamlDumper = type('FastYamlDumper', (yaml.CDumper,), {}) \
+    if yaml.__with_libyaml__ else YamlDumper
+YAML_DUMPERS = {yaml.Dumper, YamlDumper, FastYamlDumper}
+
+
+def add_yaml_representer(datatype, representer, multi=False):
+    """Registers a representer with the dumpers that we use"""
+    for dumper in YAML_DUMPERS:
+        if multi:
+            yaml.add_multi_representer(datatype, representer, Dumper=dumper)
+        else:
+            yaml.add_representer(datatype, representer, Dumper=dumper)
+
+
+# subclasses of str (eg. ansible's AnsibleUnsafeText) are dumped as plain strings,
+# without having to import ansible when the helpers are imported
+add_yaml_representer(
+    str, lambda d, v: d.represent_scalar('tag:yaml.org,2002:str', str(v)), multi=True)
 
 
 def random_string(length=16, with_special_chars=True, remove_chars=None):
@@ -41,13 +64,13 @@ def random_string(length=16, with_special_chars=True, remove_chars=None):
 
 def load_yaml(contents):
     """Loads a YAML string into an object"""
-    return yaml.load(contents, Loader=yaml.FullLoader) if contents else {}
+    return yaml.load(contents, Loader=YamlLoader) if contents else {}
 
 
-def dump_yaml(contents) -> str:
-    """Dumps a yaml into a string"""
+def dump_yaml(contents, fast=False) -> str:
+    """Dumps a yaml into a string, `fast` uses libyaml's emitter when it's available"""
     yaml_str = yaml.dump(contents, \
-                         Dumper=YamlDumper,
+                         Dumper=FastYamlDumper if fast else YamlDumper,
                          allow_unicode=True,
                          explicit_start=True,
                          default_flow_style=False,
@@ -68,11 +91,85 @@ def read_yaml(path):
     return load_yaml(contents)
 
 
-def write_yaml(path, contents=""):
+def write_yaml(path, contents="", fast=False):
     """Writes a YAML file"""
-    with open(path, 'w') as file:
-        file.write(dump_yaml(contents))
-        file.close()
+    return write_atomically(path, dump_yaml(contents, fast=fast))
+
+
+def read_compiled_yaml(path, cache_dir=None):
+    """
+    Reads a YAML file, parsing it only if it hasn't been parsed before. The parsed
+    contents are pickled in the cache directory, keyed by the hash of the file's contents
+    """
+    with open(path, 'rb') as file:
+        source = file.read()
+
+    cache_dir = cache_dir or get_cache_dir()
+    name = os.path.basename(path)
+    cached = os.path.join(cache_dir, '{}.{}.pickle'.format(name, hashlib.md5(source).hexdigest()))
+
+    try:
+        with open(cached, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    contents = load_yaml(source.decode('utf-8'))
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_atomically(cached, pickle.dumps(contents, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        # the cache is an optimization, we can do without it
+        pass
+
+    return contents
+
+
+def get_cache_dir():
+    """Returns the directory where stackmate caches the files it compiles"""
+    if os.environ.get(ENV_CACHE_DIR):
+        return os.environ[ENV_CACHE_DIR]
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'stackmate')
+
+
+def write_atomically(path, contents):
+    """
+    Writes a file by writing to a temporary file next to it, which then replaces it.
+    This way, the file is either fully written or left untouched if we crash
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temppath = tempfile.mkstemp(
+        dir=directory, prefix='.{}.'.format(os.path.basename(path)))
+
+    try:
+        with os.fdopen(descriptor, 'wb' if isinstance(contents, bytes) else 'w') as file:
+            file.write(contents)
+            file.flush()
+            os.fsync(file.fileno())
+
+        # keep the permissions of the file that gets replaced, temporary files are private
+        if os.path.exists(path):
+            os.chmod(temppath, stat.S_IMODE(os.stat(path).st_mode))
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temppath, 0o666 & ~umask)
+
+        os.replace(temppath, path)
+    except BaseException:
+        if os.path.exists(temppath):
+            os.remove(temppath)
+        raise
+
+    # make sure the rename itself is durable
+    dirfd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dirfd)
+    finally:
+        os.close(dirfd)
 
     return True
 
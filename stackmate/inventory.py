@@ -0,0 +1,97 @@
+"""Provides the inventory of the hosts that the plays run on"""
+# -*- coding: utf-8 -*-
+from stackmate.constants import INVENTORY_INCLUDED_ROLES
+
+
+class InventoryIndex:
+    """
+    Indexes the project's hosts by role, out of the resources in the state.
+
+    A role's hosts are only indexed again when its resources change in the state,
+    the inventory is shared by the plays until then
+    """
+    def __init__(self, project, state):
+        self.project = project
+        self.state = state
+        # the hosts of every role, as {group: {host: host vars}}
+        self._hosts_per_role = {}
+        self._inventory = None
+
+    def update(self, rolename: str):
+        """Indexes the hosts of a role once again, after its resources have changed"""
+        if rolename not in INVENTORY_INCLUDED_ROLES:
+            return
+
+        self._hosts_per_role.pop(rolename, None)
+        self._inventory = None
+
+    def get(self) -> dict:
+        """Returns the inventory for the plays"""
+        # see https://docs.ansible.com/ansible/latest/user_guide/intro_inventory.html
+        if self._inventory is not None:
+            return self._inventory
+
+        inventory = {'all': {}, 'provisionables': {}}
+
+        for rolename in INVENTORY_INCLUDED_ROLES:
+            if rolename not in self._hosts_per_role:
+                self._hosts_per_role[rolename] = self._index_role(rolename)
+
+            for group, hosts in self._hosts_per_role[rolename].items():
+                inventory.setdefault(group, {}).update(hosts)
+
+        self._inventory = inventory
+
+        return self._inventory
+
+    def _index_role(self, rolename: str) -> dict:
+        """Returns the hosts of a role's deployables per group, along with their variables"""
+        groups = {}
+        # the resources of the role are looked up once, rather than once per deployable
+        resources = self.state.get_resources(rolename)
+
+        for deployable in self.project.deployables_per_role.get(rolename, []):
+            for resource in resources.find(deployable):
+                hosts = self._get_resource_hosts(deployable, resource)
+
+                if not hosts:
+                    continue
+
+                # ansible inventory requires the host ips to be keys
+                for group in deployable.host_groups:
+                    groups.setdefault(group, {}).update(hosts)
+                    groups.setdefault('all', {}).update(hosts)
+
+                    if rolename == 'instances':
+                        groups.setdefault('provisionables', {}).update(hosts)
+
+        return groups
+
+    @staticmethod
+    def _get_resource_hosts(deployable, resource) -> dict:
+        """Returns the hosts of a resource, along with the variables for each one of them"""
+        output = resource.output
+        group = resource.group.get('name') if isinstance(resource.group, dict) else resource.group
+        nodes = [output]
+
+        if hasattr(deployable, 'nodes') and output.get('nodes'):
+            nodes = output['nodes']
+
+        hosts = {}
+
+        for node in nodes:
+            # prefer IP over hostname
+            host = node.get('ip') or node.get('host')
+
+            if not host:
+                continue
+
+            hostvars = {
+                'node_name': node.get('name') or resource.provision_params.get('name'),
+                'private_ip': node.get('private_ip'),
+                'node_group': group,
+            }
+
+            hosts[host] = {name: value for name, value in hostvars.items() if value is not None}
+
+        return hosts
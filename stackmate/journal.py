@@ -0,0 +1,137 @@
+"""Append-only journals, stored next to the state file"""
+# -*- coding: utf-8 -*-
+import os
+import json
+from datetime import datetime
+
+PLAY_JOURNAL_FILE = 'plays.{stage}.journal'
+STATE_JOURNAL_FILE = 'state.{stage}.journal'
+
+
+class Journal:
+    """Durable, append-only file of JSON entries, one per line"""
+    FILENAME = None
+
+    def __init__(self, rootpath=None, stage=None):
+        self.rootpath = rootpath if rootpath else os.getcwd()
+        self.stage = stage
+
+    @property
+    def path(self):
+        """Returns the full path for the journal"""
+        return os.path.join(self.rootpath, self.__class__.FILENAME.format(stage=self.stage))
+
+    @property
+    def exists(self):
+        """Returns whether there are entries in the journal"""
+        return os.path.isfile(self.path)
+
+    def read_lines(self) -> list:
+        """Reads the entries in the journal file"""
+        entries = []
+
+        if not self.exists:
+            return entries
+
+        with open(self.path) as journal:
+            for line in journal:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # the last line might be incomplete if we crashed while writing it
+                    continue
+
+        return entries
+
+    def append(self, *entries):
+        """Appends entries to the journal, making sure they're written to disk at once"""
+        with open(self.path, 'a') as journal:
+            journal.write(''.join(json.dumps(entry, default=str) + '\n' for entry in entries))
+            journal.flush()
+            os.fsync(journal.fileno())
+
+        return entries[-1] if entries else None
+
+    def clear(self):
+        """Removes the journal"""
+        if self.exists:
+            os.remove(self.path)
+
+
+class PlayJournal(Journal):
+    """
+    Durable, append-only record of the plays that completed during an operation,
+    along with the fingerprint of their inputs and the state facts they produced.
+
+    It lives next to the state file and allows a failed operation to be resumed,
+    skipping the plays whose inputs have not changed since they completed
+    """
+    FILENAME = PLAY_JOURNAL_FILE
+
+    def __init__(self, rootpath=None, stage=None):
+        super().__init__(rootpath=rootpath, stage=stage)
+        self._entries = None
+
+    @property
+    def entries(self) -> dict:
+        """Returns the journal entries, indexed by the play fingerprint"""
+        if self._entries is None:
+            self._entries = self.read()
+        return self._entries
+
+    def read(self) -> dict:
+        """Reads the journal file"""
+        return {entry['fingerprint']: entry for entry in self.read_lines()}
+
+    def record(self, fingerprint: str, play, facts: list):
+        """Records a completed play"""
+        entry = self.append({
+            'fingerprint': fingerprint,
+            'role': play.rolename,
+            'play': play.playname,
+            'facts': facts,
+            'completed_at': str(datetime.utcnow()),
+        })
+
+        self.entries[fingerprint] = entry
+
+        return entry
+
+    def get_facts(self, fingerprint: str):
+        """Returns the facts for a play that has completed, None if it hasn't"""
+        entry = self.entries.get(fingerprint)
+        return entry['facts'] if entry else None
+
+    def clear(self):
+        """Removes the journal, once the operation has completed"""
+        self._entries = {}
+        super().clear()
+
+
+class StateJournal(Journal):
+    """
+    Durable, append-only record of the changes to the state's roles.
+
+    Rather than rewriting the state file after every play, the resources of the roles
+    that changed are appended to the journal, which is compacted into the state file
+    once the operation is over. The journal is replayed when the state is loaded,
+    so that no changes are lost if the operation crashed before compacting it
+    """
+    FILENAME = STATE_JOURNAL_FILE
+
+    def record(self, role: str, resources: list):
+        """Records the resources for a role that has changed"""
+        return self.append({'role': role, 'resources': resources})
+
+    def record_many(self, changes: dict):
+        """Records the resources for many roles that have changed, in a single write"""
+        return self.append(*[
+            {'role': role, 'resources': resources} for role, resources in changes.items()
+        ])
+
+    def replay(self, contents):
+        """Applies the recorded changes to the state's contents, in order"""
+        for entry in self.read_lines():
+            contents.set_path(entry['role'], entry['resources'])
+
+        return contents
@@ -0,0 +1,159 @@
+"""Inter-process locks on the state of the project's stages"""
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import fcntl
+import socket
+from stackmate.configurations import STATE_DIRECTORY
+from stackmate.constants import STATE_LOCK_TIMEOUT, STATE_LOCK_STALE_AFTER, \
+    STATE_LOCK_POLL_INTERVAL, ENV_STATE_LOCK_TIMEOUT
+from stackmate.exceptions import StateLockedError
+
+STATE_LOCK_FILE = '{stage}.lock'
+# the lock for the state of the whole project, eg. the index of the stages
+STATE_PROJECT_LOCK_FILE = 'index.lock'
+
+
+def pid_exists(pid) -> bool:
+    """Whether a process with the given pid is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+class StateLock:
+    """
+    Advisory lock on the state of a project's stage, held while an operation loads,
+    modifies and saves it. Operations on other stages or projects are not affected.
+    Without a stage, the lock is held on the state of the whole project (eg. the index).
+
+    The lock file holds the details of the process that acquired the lock. A lock that
+    was acquired by a process that no longer runs, or that has been held for longer than
+    `stale_after` seconds, is considered abandoned and gets broken
+    """
+    def __init__(self, rootpath=None, stage=None, timeout=None, stale_after=STATE_LOCK_STALE_AFTER):
+        filename = STATE_LOCK_FILE.format(stage=stage) if stage else STATE_PROJECT_LOCK_FILE
+        self.path = os.path.join(rootpath or os.getcwd(), STATE_DIRECTORY, filename)
+        self.timeout = timeout if timeout is not None else \
+            float(os.environ.get(ENV_STATE_LOCK_TIMEOUT, STATE_LOCK_TIMEOUT))
+        self.stale_after = stale_after
+        self.metrics = {'waited': 0.0, 'attempts': 0, 'broken': False}
+        self._file = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+    @property
+    def locked(self) -> bool:
+        """Whether we're holding the lock"""
+        return self._file is not None
+
+    def holder(self) -> dict:
+        """Returns the details of the process that acquired the lock last"""
+        try:
+            with open(self.path) as lockfile:
+                return json.loads(lockfile.read() or '{}')
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def is_stale(self, holder: dict) -> bool:
+        """Whether the lock has been abandoned by its holder"""
+        if not holder:
+            return False
+
+        if time.time() - holder.get('acquired_at', 0) > self.stale_after:
+            return True
+
+        # the process that acquired it has died, the lock is held by the children it left behind
+        return holder.get('hostname') == socket.gethostname() and not pid_exists(holder.get('pid'))
+
+    def acquire(self):
+        """Acquires the lock, waiting for the operation that holds it for up to `timeout` seconds"""
+        started = time.monotonic()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        while True:
+            self.metrics['attempts'] += 1
+            lockfile = open(self.path, 'a+')
+
+            try:
+                fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lockfile.close()
+                self._wait(started)
+                continue
+
+            # the lock file might have been replaced while we were acquiring the lock
+            if not self._is_current(lockfile):
+                lockfile.close()
+                continue
+
+            lockfile.seek(0)
+            lockfile.truncate()
+            lockfile.write(json.dumps({
+                'pid': os.getpid(), 'hostname': socket.gethostname(), 'acquired_at': time.time(),
+            }))
+            lockfile.flush()
+
+            self._file = lockfile
+            self.metrics['waited'] = time.monotonic() - started
+
+            return self
+
+    def release(self):
+        """Releases the lock"""
+        if self._file is None:
+            return
+
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def _wait(self, started):
+        """Waits for the lock to be released, breaking it if it's been abandoned"""
+        holder = self.holder()
+
+        if self.is_stale(holder):
+            self._break(holder)
+            return
+
+        waited = time.monotonic() - started
+        if waited >= self.timeout:
+            self.metrics['waited'] = waited
+            raise StateLockedError(
+                'The state is locked by process {pid} on {hostname} since {since}'.format(
+                    pid=holder.get('pid'), hostname=holder.get('hostname'),
+                    since=time.ctime(holder.get('acquired_at', 0))))
+
+        time.sleep(min(STATE_LOCK_POLL_INTERVAL, max(self.timeout - waited, 0)))
+
+    def _break(self, holder):
+        """
+        Breaks an abandoned lock by removing the lock file. Its holder keeps locking
+        a file that is no longer used, a new one is created by the next attempt
+        """
+        if self.holder() != holder:
+            return
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+        self.metrics['broken'] = True
+
+    def _is_current(self, lockfile) -> bool:
+        """Whether the file we've locked is still the lock file"""
+        try:
+            return os.stat(self.path).st_ino == os.fstat(lockfile.fileno()).st_ino
+        except FileNotFoundError:
+            return False
@@ -4,9 +4,12 @@ import pprint
 from abc import ABC, abstractmethod
 from stackmate.base import Model, ModelAttribute
 from stackmate.playbooks import PlaybookIterator
-from stackmate.runner import Runner
+from stackmate.planner import Planner
 from stackmate.project import Project
 from stackmate.state import State
+from stackmate.configurations import migrate_branched_state
+from stackmate.journal import PlayJournal
+from stackmate.locks import StateLock
 
 class BaseOperation(Model, ABC):
     """Base operation model"""
@@ -15,12 +18,17 @@ class BaseOperation(Model, ABC):
     _path = ModelAttribute(required=True, datatype=str)
     _stage = ModelAttribute(required=True, datatype=str)
     _debug = ModelAttribute(required=False, datatype=bool, default=False)
+    _fail_fast = ModelAttribute(required=False, datatype=bool, default=False)
+    _play_timeout = ModelAttribute(required=False, datatype=int)
+    _step_timeout = ModelAttribute(required=False, datatype=int)
+    _resume = ModelAttribute(required=False, datatype=bool, default=False)
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
         self._project = Project.load(rootpath=self.path, stage=self.stage)
-        self._state = State(rootpath=self.path, stage=self.stage)
+        self._state = None
+        self._lock = None
         self._iterator = None
         self._extra_vars = {}
         self._runner = None
@@ -34,6 +42,13 @@ class BaseOperation(Model, ABC):
         """Returns the extra vars to be used in playbooks"""
         return self._extra_vars
 
+    @property
+    def state(self) -> State:
+        """Returns the stage's state, it's loaded once it's first used"""
+        if self._state is None:
+            self._state = State.load(rootpath=self.path, stage=self.stage)
+        return self._state
+
     @property
     @abstractmethod
     def iterator(self) -> PlaybookIterator:
@@ -41,17 +56,34 @@ class BaseOperation(Model, ABC):
 
     def get_runner(self):
         """Returns the runner for the operation"""
+        # ansible's executor is only imported when the operation is about to run
+        from stackmate.runner import Runner # pylint: disable=import-outside-toplevel
+
         if not self._runner:
-            self._runner = Runner(iterator=self.iterator)
+            self._runner = Runner(
+                iterator=self.iterator,
+                fail_fast=self.fail_fast,
+                play_timeout=self.play_timeout,
+                step_timeout=self.step_timeout,
+                journal=PlayJournal(rootpath=self.path, stage=self.stage),
+                resume=self.resume,
+                lock=self._lock)
         return self._runner
 
     def run(self):
         """Runs the operation"""
         self.validate()
 
-        runner = self.get_runner()
+        # operations that modify the state store it per stage, before loading it
+        migrate_branched_state(self.path)
+
+        # the state is loaded and saved while holding the lock for the stage,
+        # so that operations running on the same stage don't overwrite each other's changes
+        with StateLock(rootpath=self.path, stage=self.stage) as lock:
+            self._lock = lock
+            runner = self.get_runner()
 
-        return runner.run() if not self.debug else pprint.pprint(runner.dump())
+            return runner.run() if not self.debug else pprint.pprint(runner.dump())
 
     def dump(self):
         """Runs the playbook"""
@@ -71,6 +103,7 @@ class DeploymentOperation(BaseOperation):
     _commit_reference = ModelAttribute(required=True, datatype=str)
     _commit_author = ModelAttribute(required=True, datatype=str)
     _commit_message = ModelAttribute(required=True, datatype=str)
+    _plan = ModelAttribute(required=False, datatype=str)
 
     @property
     def extra_vars(self):
@@ -94,12 +127,54 @@ class DeploymentOperation(BaseOperation):
         """Returns the playbook for this operation"""
         if not self._iterator:
             self._iterator = PlaybookIterator(
-                'deployment', project=self._project, state=self._state, **self.extra_vars
+                'deployment', project=self._project, state=self.state, **self.extra_vars
             )
 
+            # execute the changes that have been computed in a plan
+            if self.plan:
+                self._iterator.plan = Planner.load(self.plan, self._iterator)
+
         return self._iterator
 
 
+class PlanOperation(BaseOperation):
+    """Computes the changes of a deployment without running it"""
+    _plan_file = ModelAttribute(required=False, datatype=str)
+
+    def validate(self):
+        """Validates the model and the project, ssh keys are not required for planning"""
+        return Model.validate(self) and self._project.validate()
+
+    @property
+    def iterator(self) -> PlaybookIterator:
+        """Returns the playbook for the deployment to be planned"""
+        if not self._iterator:
+            self._iterator = PlaybookIterator(
+                'deployment', project=self._project, state=self.state, **self.extra_vars
+            )
+
+        return self._iterator
+
+    @property
+    def plan_path(self) -> str:
+        """Returns the path where the plan is written"""
+        return self.plan_file or Planner.get_path(self.path, self.stage)
+
+    def run(self):
+        """Computes the plan and writes it out"""
+        self.validate()
+
+        # the plan is computed against the state, it should not change meanwhile.
+        # Planning is refused while an operation is running on the stage, rather than waiting
+        with StateLock(rootpath=self.path, stage=self.stage, timeout=0) as lock:
+            self._lock = lock
+            plan = Planner(self.iterator).compute()
+
+        Planner.write(plan, self.plan_path)
+
+        return plan
+
+
 class RollbackOperation(BaseOperation):
     """The Rollback operation"""
     _steps = ModelAttribute(required=True, datatype=int, default=1)
@@ -117,7 +192,7 @@ class RollbackOperation(BaseOperation):
         """Returns the playbook for this operation"""
         if not self._iterator:
             self._iterator = PlaybookIterator(
-                'rollback', project=self._project, state=self._state, **self.extra_vars
+                'rollback', project=self._project, state=self.state, **self.extra_vars
             )
 
         return self._iterator
@@ -0,0 +1,120 @@
+"""Computes the changes of an operation, without running any plays"""
+# -*- coding: utf-8 -*-
+import os
+import json
+from datetime import datetime
+from stackmate.playbooks import Playbook
+from stackmate.provisioner import Provisioner
+from stackmate.exceptions import InvalidPlanError
+
+PLAN_FILE = 'plan.{stage}.json'
+PLAN_VERSION = 2
+
+
+def to_json(value):
+    """Converts the values that JSON does not support (eg. sets) when writing the plan"""
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+
+    return str(value)
+
+
+class Planner:
+    """
+    Computes the provisions, modifications and terminations for every step and role
+    of an operation, in a single pass over the project's deployables & state.
+
+    The plan only holds the resources to be changed, the operation that executes it
+    computes their provision params against the state, as it gets updated by every step
+    """
+    def __init__(self, iterator):
+        self.iterator = iterator
+
+    def compute(self) -> dict:
+        """Computes the plan for the operation"""
+        # the plan is only valid for the state it was computed against
+        state_fingerprint = self.iterator.state.fingerprint()
+        updated_roles = set()
+        steps = []
+
+        for stepconfig in self.iterator.steps:
+            playbook = Playbook(
+                config=stepconfig,
+                project=self.iterator.project,
+                state=self.iterator.state,
+                extra_vars=self.iterator.extra_vars,
+                save_state=False)
+
+            roles = {}
+            for rolespec in stepconfig.get('roles', []):
+                changes, _deplist = playbook.get_role_changes(rolespec, updated_roles)
+
+                if changes:
+                    roles[rolespec['name']] = Provisioner.change_set(changes)
+
+            steps.append({'name': stepconfig.get('name'), 'roles': roles})
+
+        return {
+            'version': PLAN_VERSION,
+            'operation': self.iterator.operation,
+            'stage': self.iterator.project.stage,
+            'state': state_fingerprint,
+            'created_at': str(datetime.utcnow()),
+            'steps': steps,
+        }
+
+    @staticmethod
+    def summary(plan: dict) -> dict:
+        """Returns the number of changes per role in the plan"""
+        summary = {}
+
+        for step in plan['steps']:
+            for rolename, changes in step['roles'].items():
+                counts = summary.setdefault(rolename, {
+                    'provisions': 0, 'modifications': 0, 'terminations': 0,
+                })
+
+                for key in counts:
+                    counts[key] += len(changes.get(key) or [])
+
+        return summary
+
+    @staticmethod
+    def get_path(rootpath, stage) -> str:
+        """Returns the default path for a plan"""
+        return os.path.join(rootpath, PLAN_FILE.format(stage=stage))
+
+    @staticmethod
+    def write(plan: dict, path: str):
+        """Writes out the plan"""
+        with open(path, 'w') as planfile:
+            json.dump(plan, planfile, indent=2, sort_keys=True, default=to_json)
+
+        return path
+
+    @staticmethod
+    def load(path: str, iterator) -> dict:
+        """Loads a plan that should be executed by the operation"""
+        try:
+            with open(path) as planfile:
+                plan = json.load(planfile)
+        except (OSError, ValueError) as exc:
+            raise InvalidPlanError('The plan {} could not be read: {}'.format(path, exc))
+
+        if plan.get('version') != PLAN_VERSION:
+            raise InvalidPlanError(
+                'The plan {} was written with version {} of the plan format, while version {} '
+                'is required. Compute the plan again'.format(
+                    path, plan.get('version'), PLAN_VERSION))
+
+        if plan.get('operation') != iterator.operation or \
+                plan.get('stage') != iterator.project.stage or \
+                len(plan.get('steps', [])) != len(iterator.steps):
+            raise InvalidPlanError('The plan {} was computed for a different operation'.format(
+                path))
+
+        if plan.get('state') != iterator.state.fingerprint():
+            raise InvalidPlanError(
+                'The state has changed since the plan {} was computed'.format(path))
+
+        return plan
@@ -1,25 +1,56 @@
 """Generates playbooks to be executed by ansible"""
 # -*- coding: utf-8 -*-
 import os
+import json
 import hashlib
+from collections import namedtuple
 from stackmate.configurations import OperationsConfiguration
-from stackmate.helpers import get_scm_service, get_project_resource_suffix
+from stackmate.helpers import get_scm_service, get_project_resource_suffix, string_hash
 from stackmate.provisioner import Provisioner
+from stackmate.inventory import InventoryIndex
 from stackmate.constants import PROVIDER_AWS, STRATEGY_LINEAR, STRATEGY_MITOGEN_LINEAR, \
                                 STRATEGY_PARALLEL, STRATEGY_MITOGEN_PARALLEL, \
                                 CONNECTION_LOCAL, CONNECTION_SSH, LOCALHOST, BECOME_METHOD_SUDO, \
                                 DEPLOYMENT_USER, DEPLOYMENT_SUCCESS, \
                                 DEPLOYMENT_FAILURE, STACKMATE_STATE_FACT, CHECK_MODE, \
                                 OMNIPRESENT_ROLES, FLATTENED_PROVISION_PARAM_ROLES, \
-                                INVENTORY_INCLUDED_ROLES, ENV_MITOGEN_PATH, \
+                                ENV_MITOGEN_PATH, \
                                 APT_RETRIES, APT_DELAY, \
                                 LOCAL_DEPLOYMENT_PROJECT_TYPES, FORCED_STRATEGIES_PER_ROLE, \
-                                ROLE_TO_DEPENDS_ON_MAPPING, \
+                                ROLE_TO_DEPENDS_ON_MAPPING, FINGERPRINT_IGNORED_VARS, \
                                 PREVIEW_DOMAIN, PREVIEW_DOMAIN_HOSTED_ZONE_ID
 
 OPERATIONS = OperationsConfiguration()
 
 
+class PlayDescriptor(namedtuple('PlayDescriptor', \
+        'role task_vars playname force_local forks variables shares_vars')):
+    """
+    A compact description of a play, handed off to the worker processes. The operation-wide
+    variables are shipped to every worker once, the descriptor only carries the ones that differ
+    """
+    __slots__ = ()
+
+    def get_play(self, shared_vars: dict) -> 'Play':
+        """Returns the play that the descriptor describes"""
+        global_vars = self.variables
+
+        if self.shares_vars:
+            global_vars = shared_vars
+
+            if self.variables:
+                global_vars = dict(shared_vars)
+                global_vars.update(self.variables)
+
+        return Play(
+            role=self.role,
+            task_vars=self.task_vars,
+            playname=self.playname,
+            force_local=self.force_local,
+            global_vars=global_vars,
+            forks=self.forks)
+
+
 class Play:
     """Represents an Ansible play that takes place into a playbook"""
     # pylint: disable=too-many-instance-attributes
@@ -33,10 +64,12 @@ class Play:
         self._task_vars = task_vars
         self._force_local = kwargs.get('force_local', False)
         self._global_vars = kwargs.get('global_vars', {})
+        # the number of ansible forks granted to the play
+        self.forks = kwargs.get('forks')
 
     def get_source(self) -> dict:
         """Returns the source of the play to be executed"""
-        return dict(
+        source = dict(
             name=self.playname,
             hosts=self.hosts,
             connection=self.connection,
@@ -48,10 +81,54 @@ class Play:
             check_mode=bool(CHECK_MODE),
         )
 
+        # roles can gather a subset of the facts, when they're the first to gather them on a host
+        if self._role.get('gather_subset'):
+            source['gather_subset'] = self._role['gather_subset']
+
+        return source
+
     def get_variables(self) -> dict:
         """Returns the variables to be used in a play"""
         return self._global_vars
 
+    def get_descriptor(self, shared_vars: dict = None) -> PlayDescriptor:
+        """
+        Returns the descriptor for the play. Only the variables that differ from
+        the shared ones are included, unless the play is missing some of them
+        """
+        shared_vars = shared_vars or {}
+        variables = self._global_vars
+        shares_vars = shared_vars.keys() <= variables.keys()
+
+        if variables is shared_vars:
+            variables = {}
+        elif shares_vars:
+            variables = {
+                k: v for k, v in variables.items()
+                if k not in shared_vars or shared_vars[k] is not v
+            }
+
+        return PlayDescriptor(
+            role=self._role,
+            task_vars=self._task_vars,
+            playname=self.playname,
+            force_local=self._force_local,
+            forks=self.forks,
+            variables=variables,
+            shares_vars=shares_vars)
+
+    def fingerprint(self, inventory: dict = None) -> str:
+        """Returns a hash of the play's inputs, which tells whether the play has changed"""
+        variables = {
+            k: v for k, v in self.get_variables().items() if k not in FINGERPRINT_IGNORED_VARS
+        }
+
+        return string_hash(json.dumps({
+            'source': self.get_source(),
+            'variables': variables,
+            'inventory': inventory or {},
+        }, sort_keys=True, default=str))
+
     @property
     def tasks(self) -> list:
         """Returns the tasks to run during the play"""
@@ -87,6 +164,13 @@ class Play:
         """Returns whether this play should be executed in localhost only"""
         return self.hosts == LOCALHOST
 
+    def host_count(self, inventory: dict) -> int:
+        """Returns the number of hosts the play targets in the inventory"""
+        if self.is_local():
+            return 1
+
+        return max(1, len(inventory.get(self.hosts) or {}))
+
     @property
     def connection(self) -> str:
         """Returns the connection to be used"""
@@ -98,110 +182,48 @@ class Play:
         return self._role.get('gather_facts', not self.is_local())
 
 
-class Playbook:
-    """Represents an ansible playbook"""
-    def __init__(self, config, project, state, **kwargs):
-        self.config = config
+class ProjectVars:
+    """
+    Holds the variables that are shared by the plays of an operation. They are computed once,
+    only the output of the prerequisites is refreshed, once it changes
+    """
+    def __init__(self, project, state, extra_vars=None):
         self.project = project
         self.state = state
-        self.extra_vars = kwargs.get('extra_vars', {})
-        self._omnipresent_roles = OMNIPRESENT_ROLES.get(self.project.flavor, [])
+        self.extra_vars = extra_vars or {}
+        self._static_vars = None
+        self._prerequisites_output = None
+        self._variables = None
 
-    @property
-    def rolenames(self):
-        """Returns the roles to be executed within this playbook"""
-        return [r['name'] for r in self.config.get('roles', []) if r.get('name')]
+    def get(self) -> dict:
+        """Returns the variables, the same dictionary is shared until the prerequisites change"""
+        output = self._get_prerequisites_output()
 
-    def get_plays(self, updated_roles: set = None) -> tuple:
-        """Returns the list of plays to be executed"""
-        plays = []
-        updated_roles = updated_roles or set()
+        if self._variables is None or output != self._prerequisites_output:
+            if self._static_vars is None:
+                self._static_vars = self._get_static_vars()
 
-        for rolespec in self.config.get('roles', []):
-            rolename = rolespec['name']
-            provisioner_entries = set(self.config.get('entries', []))
-            resources = self.state.get_resources(rolename)
-            deplist = []
-
-            # process the state for every deployable that is to be provisioned
-            # and add it to the deployables list
-            for dep in self.project.deployables_per_role.get(rolename, []):
-                dep.process_state(self.state)
-                deplist.append(dep)
-
-            # Get the changes that are supposed to happen, then filter
-            # by the entries that the current play requires (eg. only terminations)
-            changes = Provisioner.changes(
-                deplist, resources, updated_roles, provisioner_entries)
-
-            # there aren't any changes to provision and the role should not be always present
-            if not changes and rolename not in self._omnipresent_roles:
-                continue
+            self._variables = dict(self._static_vars)
+            self._variables.update(output)
+            self._prerequisites_output = output
 
-            # add the role in the list of pdated ones if there are changes to it
-            # (might be omnipresent though)
-            if changes:
-                updated_roles.add(rolename)
-                self.mark_dependants_as_touched(rolename)
-
-            # only store the state when we have provisions or modifications
-            store_state = ('provisions' in changes and changes['provisions']) or \
-                            ('modifications' in changes and changes['modifications'])
-
-            if rolename in FLATTENED_PROVISION_PARAM_ROLES:
-                for deployable in deplist:
-                    plays.append(Play(
-                        role=rolespec,
-                        task_vars=deployable.provision_params,
-                        global_vars=self._get_project_vars(),
-                        force_local=self._force_local_plays(),
-                    ))
-            else:
-                plays.append(Play(
-                    role=rolespec,
-                    task_vars=dict(**changes, store_state=bool(store_state)),
-                    global_vars=self._get_project_vars(),
-                    force_local=self._force_local_plays(),
-                ))
+        return self._variables
 
-        return (plays, updated_roles)
+    def _get_prerequisites_output(self) -> dict:
+        """Returns the output from the prerequisites role (if available)"""
+        preq = self.state.get('prerequisites')
 
-    @property
-    def can_run_in_parallel(self) -> bool:
-        """Returns whether this play can execute roles in parallel"""
-        return bool(self.config.get('parallel'))
-
-    def get_failure_play(self):
-        """Returns a special play for when the deployment fails"""
-        notifs_deployable = next(
-            (d for d in self.project.deployables if d.rolename == 'notifications'), None)
-
-        if not notifs_deployable:
-            return None
-
-        task_vars = notifs_deployable.provision_params
-        task_vars.update({'deployment_status': DEPLOYMENT_FAILURE})
-
-        return Play(
-            role={'name': 'notifications', 'hosts': LOCALHOST, 'execution': STRATEGY_PARALLEL},
-            task_vars=task_vars,
-            global_vars=self._get_project_vars(),
-            force_local=True)
-
-    def mark_dependants_as_touched(self, rolename):
-        """Marks dependant resources as tainted"""
-        dependants = [
-            key for key, roles in ROLE_TO_DEPENDS_ON_MAPPING.items() if rolename in roles
-        ]
-
-        for dependant_role in dependants:
-            self.state.merge_role_resource_attributes(dependant_role, touched=True)
+        if not preq:
+            return {}
 
-        self.state.save()
+        # there should be 1 entry at most in the prerequisites key
+        if len(preq) > 1:
+            raise Exception(
+                'There are more than 1 entries in for prerequisites in the state. ' +
+                'Please contact our support and report this as a bug'
+            )
 
-    def _force_local_plays(self):
-        """Whether we should force local plays"""
-        return self.project.framework in LOCAL_DEPLOYMENT_PROJECT_TYPES
+        return dict(preq[0].get('output', {}))
 
     def _get_cloud_vars(self):
         """Returns the variables for the cloud provider"""
@@ -231,11 +253,14 @@ class Playbook:
 
         return {}
 
-    def _get_project_vars(self):
-        """Returns the variables to be used """
+    def _get_static_vars(self):
+        """Returns the variables that stay the same throughout the operation"""
+        # the keys are read from their files every time the property is accessed
+        ssh_keys = self.project.ssh_keys
+
         project_vars = dict(
             **self.project.serialize(),
-            **self.project.ssh_keys,
+            **ssh_keys,
             **self._get_cloud_vars(),
             stage=self.project.stage,
             scm=get_scm_service(self.project.repository),
@@ -248,7 +273,7 @@ class Playbook:
             # by default we consider the deployment to finish successfully
             deployment_status=DEPLOYMENT_SUCCESS,
             # ansible vars
-            ansible_ssh_private_key_file=self.project.ssh_keys['private_key_filename'],
+            ansible_ssh_private_key_file=ssh_keys['private_key_filename'],
             ansible_check_mode=bool(CHECK_MODE),
             is_on_preview_domain=self.project.domain.endswith(PREVIEW_DOMAIN),
             preview_domain=PREVIEW_DOMAIN,
@@ -262,73 +287,166 @@ class Playbook:
         if self.extra_vars:
             project_vars.update(self.extra_vars)
 
-        # add the output from the prerequisites role (if available)
-        if self.state.get('prerequisites'):
-            preq = self.state.get('prerequisites')
+        return project_vars
 
-            # there should be 1 entry at most in the prerequisites key
-            if len(preq) > 1:
-                raise Exception(
-                    'There are more than 1 entries in for prerequisites in the state. ' +
-                    'Please contact our support and report this as a bug'
-                )
 
-            project_vars.update(preq[0].get('output', {}))
+class Playbook:
+    """Represents an ansible playbook"""
+    def __init__(self, config, project, state, **kwargs):
+        self.config = config
+        self.project = project
+        self.state = state
+        self.extra_vars = kwargs.get('extra_vars', {})
+        # the changes per role, when they have been computed in a plan
+        self.planned_changes = kwargs.get('planned_changes')
+        # whether the state file gets updated (not the case when planning)
+        self.save_state = kwargs.get('save_state', True)
+        self._omnipresent_roles = OMNIPRESENT_ROLES.get(self.project.flavor, [])
+        # the variables are shared by the playbooks of an operation
+        self.project_vars = kwargs.get('project_vars') or \
+            ProjectVars(self.project, self.state, self.extra_vars)
+        self.inventory = kwargs.get('inventory') or InventoryIndex(self.project, self.state)
 
-        return project_vars
+    @property
+    def rolenames(self):
+        """Returns the roles to be executed within this playbook"""
+        return [r['name'] for r in self.config.get('roles', []) if r.get('name')]
 
-    def get_inventory(self) -> dict:
-        """Returns the inventory for the play"""
-        # see https://docs.ansible.com/ansible/latest/user_guide/intro_inventory.html
-        inventory = {'all': {}, 'provisionables': {}}
-        # Iterate through the services in the state and filter out the standaloneservices
-        deployables = [dep for dep in self.project.deployables if dep.include_in_inventory]
-
-        for deployable in deployables:
-            # Only allow hosts for specific roles to be included in the inventory
-            if deployable.rolename not in INVENTORY_INCLUDED_ROLES:
-                continue
+    def get_plays(self, updated_roles: set = None) -> tuple:
+        """Returns the list of plays to be executed"""
+        plays = []
+        updated_roles = updated_roles or set()
+
+        for rolespec in self.config.get('roles', []):
+            role_plays, updated_roles = self.get_role_plays(rolespec, updated_roles)
+            plays += role_plays
+
+        return (plays, updated_roles)
+
+    def get_role_changes(self, rolespec: dict, updated_roles: set = None) -> tuple:
+        """
+        Returns the changes to be applied for a single role of the playbook,
+        along with the deployables that refer to the role
+        """
+        updated_roles = updated_roles if updated_roles is not None else set()
+        rolename = rolespec['name']
+        provisioner_entries = set(self.config.get('entries', []))
+        deplist = []
+
+        # process the state for every deployable that is to be provisioned
+        # and add it to the deployables list
+        for dep in self.project.deployables_per_role.get(rolename, []):
+            dep.process_state(self.state)
+            deplist.append(dep)
+
+        # Get the changes that are supposed to happen, then filter
+        # by the entries that the current play requires (eg. only terminations)
+        changes = Provisioner.changes(
+            deplist, self.state.get_resources(rolename), updated_roles, provisioner_entries)
+
+        if self.planned_changes is not None:
+            # the plan only holds which resources change, the provision params
+            # are the current ones, since they depend on the roles that ran before
+            changes = Provisioner.planned_changes(changes, self.planned_changes.get(rolename))
+
+        # add the role in the list of pdated ones if there are changes to it
+        # (might be omnipresent though)
+        if changes:
+            updated_roles.add(rolename)
+            self.mark_dependants_as_touched(rolename)
+
+        return (changes, deplist)
+
+    def get_role_plays(self, rolespec: dict, updated_roles: set = None) -> tuple:
+        """Returns the list of plays to be executed for a single role of the playbook"""
+        plays = []
+        updated_roles = updated_roles if updated_roles is not None else set()
+        rolename = rolespec['name']
+        changes, deplist = self.get_role_changes(rolespec, updated_roles)
+
+        # there aren't any changes to provision and the role should not be always present
+        if not changes and rolename not in self._omnipresent_roles:
+            return (plays, updated_roles)
+
+        # only store the state when we have provisions or modifications
+        store_state = ('provisions' in changes and changes['provisions']) or \
+                        ('modifications' in changes and changes['modifications'])
+
+        if rolename in FLATTENED_PROVISION_PARAM_ROLES:
+            for deployable in deplist:
+                plays.append(Play(
+                    role=rolespec,
+                    task_vars=deployable.provision_params,
+                    global_vars=self._get_project_vars(),
+                    force_local=self._force_local_plays(),
+                ))
+        else:
+            plays.append(Play(
+                role=rolespec,
+                task_vars=dict(**changes, store_state=bool(store_state)),
+                global_vars=self._get_project_vars(),
+                force_local=self._force_local_plays(),
+            ))
+
+        return (plays, updated_roles)
+
+    @property
+    def can_run_in_parallel(self) -> bool:
+        """Returns whether this play can execute roles in parallel"""
+        return bool(self.config.get('parallel'))
+
+    def get_failure_play(self):
+        """Returns a special play for when the deployment fails"""
+        notifs_deployable = next(
+            (d for d in self.project.deployables if d.rolename == 'notifications'), None)
 
-            dep_groups = deployable.host_groups
-            dep_resources = self.state.get_deployable_resources(deployable)
-            deployable_hosts = []
+        if not notifs_deployable:
+            return None
 
-            for resource in dep_resources.all:
-                output = resource.output
+        task_vars = dict(notifs_deployable.provision_params, deployment_status=DEPLOYMENT_FAILURE)
 
-                if hasattr(deployable, 'nodes') and output.get('nodes'):
-                    deployable_hosts += list([
-                        n.get('ip') or n.get('host') for n in output['nodes']
-                    ])
-                elif output.get('ip'): # prefer IP over hostname
-                    deployable_hosts.append(output['ip'])
-                elif output.get('host'):
-                    deployable_hosts.append(output['host'])
+        return Play(
+            role={'name': 'notifications', 'hosts': LOCALHOST, 'execution': STRATEGY_PARALLEL},
+            task_vars=task_vars,
+            global_vars=self._get_project_vars(),
+            force_local=True)
+
+    def mark_dependants_as_touched(self, rolename):
+        """Marks dependant resources as tainted"""
+        dependants = [
+            key for key, roles in ROLE_TO_DEPENDS_ON_MAPPING.items() if rolename in roles
+        ]
+
+        for dependant_role in dependants:
+            self.state.merge_role_resource_attributes(dependant_role, touched=True)
 
-                # add the group and the hosts in the inventory
-                for group in dep_groups:
-                    for host in deployable_hosts:
-                        if group not in inventory:
-                            inventory[group] = {}
+        if self.save_state:
+            self.state.save()
 
-                        # ansible inventory requires the host ips to be keys
-                        inventory['all'][host] = {}
-                        inventory[group][host] = {}
+    def _force_local_plays(self):
+        """Whether we should force local plays"""
+        return self.project.framework in LOCAL_DEPLOYMENT_PROJECT_TYPES
 
-                        if deployable.rolename == 'instances':
-                            inventory['provisionables'][host] = {}
+    def _get_project_vars(self):
+        """Returns the variables to be used """
+        return self.project_vars.get()
 
-        return inventory
+    def get_inventory(self) -> dict:
+        """Returns the inventory for the play"""
+        return self.inventory.get()
 
 
 class PlaybookIterator:
     """Iterates playbooks"""
     # pylint: disable=too-many-instance-attributes
-    def __init__(self, operation, project, state, **kwargs):
+    def __init__(self, operation, project, state, plan=None, **kwargs):
         self.project = project
         self.state = state
+        self.plan = plan
         self.extra_vars = kwargs
         self.operation = operation
+        self.project_vars = ProjectVars(project, state, self.extra_vars)
+        self.inventory = InventoryIndex(project, state)
         self._idx = -1
         self._config = self._get_config(operation).get('steps', [])
         self._set_iterable()
@@ -377,7 +495,15 @@ class PlaybookIterator:
             config=self._steps[idx],
             project=self.project,
             state=self.state,
-            extra_vars=self.extra_vars)
+            extra_vars=self.extra_vars,
+            project_vars=self.project_vars,
+            inventory=self.inventory,
+            planned_changes=self.plan['steps'][idx]['roles'] if self.plan else None)
+
+    @property
+    def steps(self) -> list:
+        """Returns the configuration of the operation's steps"""
+        return self._config
 
     def reset(self):
         """Resets the index to its initial state so that we can iterate once more"""
@@ -389,10 +515,35 @@ class PlaybookIterator:
         # that the role was executed (either got provisioned, modified or terminated)
         #
         # Hence, it's OK to replace that the fact represents the actual state for the deployable
-        return [
-            self.state.update(f['role'], f.get('resources', [])) for f in facts if f.get('role')
-        ]
+        updates = []
+
+        for fact in facts:
+            if not fact.get('role'):
+                continue
+
+            updates.append(self.state.update(fact['role'], fact.get('resources', [])))
+            # the hosts of the role might have changed along with its resources
+            self.inventory.update(fact['role'])
+
+        return updates
 
     def commit_state(self):
-        """Commits state into the file"""
+        """Commits state into the journal"""
         return self.state.save()
+
+    def flush_state(self):
+        """Writes the state changes that have been batched into the journal"""
+        return self.state.flush()
+
+    def flush_due_state(self):
+        """Writes the state changes that have been batched for as long as the save interval"""
+        return self.state.flush_if_due()
+
+    @property
+    def state_flush_deadline(self):
+        """Returns the time by which the state changes that have been batched should be written"""
+        return self.state.flush_deadline
+
+    def compact_state(self):
+        """Writes the state file, once the operation is over"""
+        return self.state.compact()
@@ -0,0 +1,200 @@
+"""Process pool that is shared across the steps of an operation"""
+# -*- coding: utf-8 -*-
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from stackmate.exceptions import DeploymentTimeoutError
+from stackmate.constants import ENV_WORKER_START_METHOD, WORKER_START_METHODS, \
+                                WORKER_START_METHOD_FORK, WORKER_START_METHOD_FORKSERVER, \
+                                ENV_FORKS_BUDGET, ANSIBLE_FORKS_NUM
+
+# how long to wait for terminated workers to exit
+WORKER_TERMINATION_TIMEOUT = 10
+
+
+def _warm_up():
+    """No-op task that makes the executor spawn its worker processes"""
+    return os.getpid()
+
+
+class WorkerPool:
+    """
+    A pool of worker processes that lives for the whole operation.
+
+    Workers are spawned (and initialized) once, when the pool starts,
+    instead of once per step or play
+    """
+    def __init__(self, max_workers=None, start_method=None, initializer=None, \
+            initargs=(), preload=None):
+        self.max_workers = max_workers or os.cpu_count()
+        self.start_method = start_method or \
+            os.environ.get(ENV_WORKER_START_METHOD, WORKER_START_METHOD_FORK)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.preload = preload or []
+        self._executor = None
+
+        if self.start_method not in WORKER_START_METHODS:
+            raise ValueError('Invalid worker start method {m}, should be one of {a}'.format(
+                m=self.start_method, a=', '.join(WORKER_START_METHODS)))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    @property
+    def started(self) -> bool:
+        """Whether the pool has been started"""
+        return self._executor is not None
+
+    def start(self):
+        """Starts the pool and spawns the workers ahead of any work being submitted"""
+        if self.started:
+            return self
+
+        context = multiprocessing.get_context(self.start_method)
+
+        # the fork server imports the modules once, every worker forked off it inherits them
+        if self.start_method == WORKER_START_METHOD_FORKSERVER and self.preload:
+            context.set_forkserver_preload(self.preload)
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=context,
+            initializer=self.initializer,
+            initargs=self.initargs)
+
+        wait([self._executor.submit(_warm_up) for _ in range(self.max_workers)])
+
+        return self
+
+    def submit(self, func, *args, **kwargs):
+        """Submits work to the pool, starting it if required"""
+        if not self.started:
+            self.start()
+
+        return self._executor.submit(func, *args, **kwargs)
+
+    def shutdown(self, wait_for_workers=True):
+        """Shuts the pool down"""
+        if not self.started:
+            return
+
+        self._executor.shutdown(wait=wait_for_workers)
+        self._executor = None
+
+    def terminate(self):
+        """
+        Stops the workers immediately, along with the plays they are running.
+        The pool is started again on the next submission
+        """
+        if not self.started:
+            return
+
+        # pylint: disable=protected-access
+        processes = list((self._executor._processes or {}).values())
+
+        for process in processes:
+            process.terminate()
+
+        for process in processes:
+            process.join(WORKER_TERMINATION_TIMEOUT)
+
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+
+def terminate_worker(_signum, _frame):
+    """
+    Signal handler for the workers of the pool.
+    Terminates the processes the worker has spawned (eg. ansible forks) before exiting
+    """
+    for child in multiprocessing.active_children():
+        child.terminate()
+
+    os._exit(1) # pylint: disable=protected-access
+
+
+def stop_timed_out_play(_signum, _frame):
+    """
+    Signal handler for the workers of the pool, for plays that run out of time.
+    Terminates the processes the play has spawned (eg. ansible forks) and fails it,
+    so that the worker is free to run the next play
+    """
+    for child in multiprocessing.active_children():
+        child.terminate()
+
+    raise DeploymentTimeoutError('The play ran for longer than allowed')
+
+
+class ForkBudget:
+    """
+    Controller-wide budget of ansible forks, shared by the plays that run concurrently.
+
+    Every play is granted fork slots in proportion to the number of hosts it targets
+    and gives them back once it finishes
+    """
+    def __init__(self, total=None):
+        self.total = int(total or os.environ.get(ENV_FORKS_BUDGET, ANSIBLE_FORKS_NUM))
+        self._allocations = {}
+        self._peak = 0
+
+        if self.total < 1:
+            raise ValueError('The fork budget should be a positive number')
+
+    @property
+    def in_use(self) -> int:
+        """The number of forks currently handed out"""
+        return sum(self._allocations.values())
+
+    @property
+    def available(self) -> int:
+        """The number of forks that can still be handed out"""
+        return self.total - self.in_use
+
+    def allocate(self, requests: dict) -> dict:
+        """
+        Grants forks to plays that are about to start.
+
+        `requests` maps every play to the number of hosts it targets. The available
+        forks are split among the plays in proportion to their hosts, a play never
+        gets more forks than hosts. Plays that were granted no forks should wait
+        until others finish and release theirs
+        """
+        available = self.available
+        demand = sum(max(1, hosts) for hosts in requests.values())
+        grants = {}
+
+        for key, hosts in requests.items():
+            hosts = max(1, hosts)
+            share = max(1, (available * hosts) // max(1, demand))
+            granted = min(hosts, share, self.available)
+
+            if granted < 1:
+                grants[key] = 0
+                continue
+
+            self._allocations[key] = granted
+            grants[key] = granted
+
+        self._peak = max(self._peak, self.in_use)
+
+        return grants
+
+    def release(self, key):
+        """Gives back the forks granted to a play"""
+        return self._allocations.pop(key, 0)
+
+    @property
+    def utilisation(self) -> dict:
+        """Returns the current utilisation of the budget"""
+        return {
+            'total': self.total,
+            'in_use': self.in_use,
+            'available': self.available,
+            'peak': self._peak,
+            'plays': len(self._allocations),
+            'ratio': round(self.in_use / self.total, 2),
+        }
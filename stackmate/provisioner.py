@@ -3,6 +3,9 @@
 from stackmate.resources import ResourceList
 from stackmate.types import DeployableList
 from stackmate.constants import STATE_CREDENTIAL_KEYS, PROVIDER_AWS
+from stackmate.exceptions import InvalidPlanError
+
+CHANGE_KINDS = ('provisions', 'modifications', 'terminations')
 
 
 class Provisioner:
@@ -48,6 +51,43 @@ class Provisioner:
 
         return changes if changes['has_changes'] else {}
 
+    @staticmethod
+    def change_set(changes: dict) -> dict:
+        """Returns the resources to be changed, as ids per kind of change (eg. for a plan)"""
+        return {
+            kind: [Provisioner._change_key(entry) for entry in changes.get(kind) or []]
+            for kind in CHANGE_KINDS
+        }
+
+    @staticmethod
+    def planned_changes(changes: dict, change_set: dict) -> dict:
+        """
+        Narrows the changes, as computed against the current state, down to the planned ones,
+        so that the provision params always reflect the outputs of the previous roles
+        """
+        if not change_set:
+            return {}
+
+        planned = dict(changes, has_changes=False)
+        for kind in CHANGE_KINDS:
+            expected = [tuple(key) for key in change_set.get(kind) or []]
+            entries = {Provisioner._change_key(entry): entry for entry in changes.get(kind) or []}
+            missing = [key for key in expected if key not in entries]
+
+            if missing:
+                raise InvalidPlanError('The {} of {} are no longer part of the changes'.format(
+                    kind, ', '.join(str(key[0]) for key in missing)))
+
+            planned[kind] = [entries[key] for key in expected]
+            planned['has_changes'] = planned['has_changes'] or bool(planned[kind])
+
+        return planned if planned['has_changes'] else {}
+
+    @staticmethod
+    def _change_key(entry: dict) -> tuple:
+        """Identifies a changed resource, nodes of the same deployable are told apart by name"""
+        return (entry.get('id'), (entry.get('provision_params') or {}).get('name'))
+
     @staticmethod
     def should_regenerate_credentials(deployable, resource_list: ResourceList) -> bool:
         """Whether we should re-generate credentials"""
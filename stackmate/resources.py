@@ -80,6 +80,11 @@ class ResourceList:
         self._modifications = []
         self._terminations = []
         self._all_resources = []
+        # the resources (and the changes) indexed by their id, which is also the deployable id
+        self._index = {}
+        self._provisions_index = {}
+        self._modifications_index = {}
+        self._terminations_index = {}
         self.reset(resources)
 
     def modify_touched_resources(self):
@@ -87,6 +92,7 @@ class ResourceList:
         for res in self._all_resources:
             if res.touched:
                 self._modifications.append(res)
+                self._add_to_index(self._modifications_index, res)
 
     def terminate_unused_resources(self, deployables):
         """
@@ -95,8 +101,10 @@ class ResourceList:
         ie. resources that do not refer to any of the deployables in the list
             or explicitly marked as tainted
         """
+        deployable_ids = {dep.deployable_id for dep in deployables}
+
         for res in self._all_resources:
-            is_relevant = any(res.refers_to(dep) for dep in deployables)
+            is_relevant = res.id in deployable_ids
             is_tainted = res.tainted
 
             if is_tainted or not is_relevant:
@@ -106,15 +114,15 @@ class ResourceList:
 
     def find(self, deployable) -> list:
         """Finds the resources that correspond to the deployable"""
-        return list([res for res in self._all_resources if res.refers_to(deployable)])
+        return list(self._index.get(deployable.deployable_id, []))
 
     def find_by_id(self, resource_id) -> Resource:
         """Finds a resource by a given id"""
-        return next((res for res in self._all_resources if res.id == resource_id), None)
+        return next(iter(self._index.get(resource_id, [])), None)
 
     def exists(self, deployable):
         """Checks whether a deployable exists in the resource list"""
-        return len(self.find(deployable)) > 0
+        return bool(self._index.get(deployable.deployable_id))
 
     def provision(self, deployable):
         """Provision a deployable"""
@@ -143,11 +151,10 @@ class ResourceList:
 
     def unchanged(self):
         """Returns the resources that are left unchanged"""
-        changed_serialized = [r.serialize() for r in self.changed()]
+        # changes always refer to the resource objects in the list, compare by identity
+        changed = {id(res) for res in self.changed()}
 
-        return [
-            res for res in self._all_resources if res.serialize() not in changed_serialized
-        ]
+        return [res for res in self._all_resources if id(res) not in changed]
 
     def reset(self, resources):
         """Add the resources to the list"""
@@ -159,6 +166,10 @@ class ResourceList:
             all_resources.append(res)
 
         self._all_resources = self._sort_resources(all_resources)
+        self._index = {}
+
+        for res in self._all_resources:
+            self._add_to_index(self._index, res)
 
     def touch(self, deployable):
         """Marks the resource as touched (to be force-modified)"""
@@ -168,33 +179,48 @@ class ResourceList:
     def append(self, *resources):
         """Aads a resource to the list"""
         for resource in resources:
-            if not self._provisions or not any(resource.is_identical(r) for r in self._provisions):
+            if not self._is_indexed(self._provisions_index, resource):
                 self._all_resources.append(resource)
                 self._provisions.append(resource)
+                self._add_to_index(self._index, resource)
+                self._add_to_index(self._provisions_index, resource)
 
         return self._provisions
 
     def replace(self, deployable, *resources):
         """Modifies a resource on the list"""
         for resource in resources:
-            for res in self._all_resources:
-                if res.id != resource.id:
-                    continue
+            for res in self._index.get(resource.id, []):
                 res.provision_params = deployable.provision_params
 
-            if not any(resource.is_identical(res) for res in self._modifications):
+            if not self._is_indexed(self._modifications_index, resource):
                 self._modifications.append(resource)
+                self._add_to_index(self._modifications_index, resource)
 
         return self._modifications
 
     def remove(self, *resources):
         """Removes a resource from the list"""
         for resource in resources:
-            if not any(resource.is_identical(res) for res in self._terminations):
+            if not self._is_indexed(self._terminations_index, resource):
                 self._terminations.append(resource)
+                self._add_to_index(self._terminations_index, resource)
 
         return self._terminations
 
+    @staticmethod
+    def _add_to_index(index: dict, resource: Resource):
+        """Adds a resource to an index"""
+        index.setdefault(resource.id, []).append(resource)
+
+    @staticmethod
+    def _is_indexed(index: dict, resource: Resource) -> bool:
+        """
+        Returns whether an identical resource exists in the index. Provision params
+        are mutable (see `replace`), which is why they are compared rather than hashed
+        """
+        return any(resource.is_identical(res) for res in index.get(resource.id, []))
+
     def serialize(self) -> dict:
         """Serialize the changeset into a dictionary"""
         return {
@@ -248,11 +274,14 @@ class ResourceList:
         return len(self._all_resources)
 
     def __getitem__(self, deployable_id: str):
-        return next((res.id == deployable_id for res in self._all_resources), None)
+        return self.find_by_id(deployable_id)
 
     def __contains__(self, resource: Resource):
-        return any(res.id == resource.id for res in self._all_resources)
+        return resource.id in self._index
 
     def __iadd__(self, otherlist: ResourceList) -> ResourceList:
-        self._all_resources += otherlist
+        for resource in otherlist.all:
+            self._all_resources.append(resource)
+            self._add_to_index(self._index, resource)
+
         return self
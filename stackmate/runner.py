@@ -2,30 +2,54 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import time
+import shutil
+import signal
+import tempfile
 import traceback
 from collections import namedtuple
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, wait
 from ansible import constants as C
 from ansible.config.manager import ConfigManager
 from ansible.parsing.dataloader import DataLoader
-from ansible.plugins.loader import strategy_loader
-from stackmate.helpers import list_chunks
-from stackmate.exceptions import DeploymentFailedError
+from ansible.plugins.loader import strategy_loader, cache_loader
+from stackmate.exceptions import DeploymentFailedError, DeploymentTimeoutError
+from stackmate.scheduler import PlayGraph, get_role_dependencies
+from stackmate.pool import WorkerPool, ForkBudget, terminate_worker, stop_timed_out_play
+from stackmate.events import EventChannel
 from stackmate.ansible.plugins.callback.output import CallbackModule as StackmateOutput
+from stackmate.ansible.plugins import cache as cache_plugins
 from stackmate.ansible import Play, Configuration as AnsibleConfiguration,\
                               VariableManager, InventoryManager, TaskQueueManager
 from stackmate.constants import ENV_MITOGEN_PATH, DEPLOYMENT_STARTED, \
                                 DEPLOYMENT_SUCCESS, DEPLOYMENT_FAILURE, \
-                                ANSIBLE_FORKS_NUM
+                                DEPLOYMENT_CANCEL, DEPLOYMENT_TIMEOUT, DEPLOYMENT_RESUMED, \
+                                ANSIBLE_FORKS_NUM, ENV_PLAY_TIMEOUT, ENV_STEP_TIMEOUT, \
+                                EVENT_OUTPUT, EVENT_PLAY_COMPLETED, \
+                                FACT_CACHE_PLUGIN, FACT_CACHE_TIMEOUT, PLAY_TIMEOUT_GRACE
 
 
 Setting = namedtuple('Setting', 'name value')
 ANSIBLE_DEFAULTS = AnsibleConfiguration().contents.get('default_config')
 
+# whether the ansible configuration has been initialized in the current process
+_ANSIBLE_INITIALIZED = False
+
+# the operation-wide variables, output logger and event queue, handed to every worker once
+_SHARED_VARS = {}
+_OUTPUT_LOGGER = None
+_EVENTS = None
 
 
 def init_ansible_configuration():
     """Initializes ansible configuration & generates the constants required"""
+    # pylint: disable=global-statement
+    global _ANSIBLE_INITIALIZED
+
+    # the configuration is only initialized once per process
+    if _ANSIBLE_INITIALIZED:
+        return
+
     # Load the defaults we've defined under 'stackmate/config/ansible.yml'
     custom_settings = []
     config = ConfigManager()
@@ -56,6 +80,67 @@ def init_ansible_configuration():
     for setting in config.data.get_settings():
         C.set_constant(setting.name, setting.value)
 
+    _ANSIBLE_INITIALIZED = True
+
+
+def init_fact_cache(path):
+    """Caches the facts of the hosts in a directory, shared by the plays of the operation"""
+    # the cache plugin reads its options from the environment, once it's loaded
+    os.environ['ANSIBLE_CACHE_PLUGIN_CONNECTION'] = path
+    os.environ['ANSIBLE_CACHE_PLUGIN_TIMEOUT'] = str(FACT_CACHE_TIMEOUT)
+
+    cache_loader.add_directory(os.path.dirname(cache_plugins.__file__))
+
+    C.set_constant('CACHE_PLUGIN', FACT_CACHE_PLUGIN)
+    C.set_constant('CACHE_PLUGIN_CONNECTION', path)
+    C.set_constant('CACHE_PLUGIN_TIMEOUT', FACT_CACHE_TIMEOUT)
+
+
+def init_worker(shared_vars=None, output_logger=None, events=None, fact_cache=None):
+    """Initializes a worker process of the pool, before it runs any plays"""
+    # pylint: disable=global-statement
+    global _SHARED_VARS, _OUTPUT_LOGGER, _EVENTS
+
+    # the plays handed to the worker only carry the variables that differ from these
+    _SHARED_VARS = shared_vars or {}
+    _OUTPUT_LOGGER = output_logger
+    _EVENTS = events
+
+    # the output is written by the parent process, as it streams in from the workers
+    if _OUTPUT_LOGGER is not None and _EVENTS is not None:
+        _OUTPUT_LOGGER.set_event_queue(_EVENTS)
+
+    # terminate the ansible forks along with the worker, when plays get cancelled
+    signal.signal(signal.SIGTERM, terminate_worker)
+    # stop the plays that run out of time, the worker is reused by the next ones
+    signal.signal(signal.SIGALRM, stop_timed_out_play)
+
+    init_ansible_configuration()
+
+    if fact_cache is not None:
+        init_fact_cache(fact_cache)
+
+    # load the strategy plugins once, instead of on every play
+    strategy_loader.all(class_only=True)
+
+
+def run_play_descriptor(process_func, descriptor, inventory, token=None, timeout=None):
+    """
+    Runs the play of a descriptor in a worker, with the variables shared with the worker.
+    Plays that run for longer than `timeout` seconds fail with a DeploymentTimeoutError
+    """
+    try:
+        if timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, max(timeout, 0.001))
+
+        return process_func(descriptor.get_play(_SHARED_VARS), inventory, _OUTPUT_LOGGER)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+        # lets the parent know that all of the play's events have been published
+        if _EVENTS is not None:
+            _EVENTS.put((EVENT_PLAY_COMPLETED, token))
+
 
 def run_play(play, inventory, output_logger):
     """Runs a play"""
@@ -69,7 +154,7 @@ def run_play(play, inventory, output_logger):
         inventory=inventory_manager,
         variable_manager=variable_manager,
         loader=loader,
-        forks=ANSIBLE_FORKS_NUM,
+        forks=play.forks or ANSIBLE_FORKS_NUM,
         passwords={}, # TODO
         stdout_callback=output_logger,
     )
@@ -80,8 +165,10 @@ def run_play(play, inventory, output_logger):
         variable_manager=variable_manager,
         loader=loader)
 
-    exit_code = tqm.run(runnable)
-    tqm.cleanup()
+    try:
+        exit_code = tqm.run(runnable)
+    finally:
+        tqm.cleanup()
 
     if int(exit_code) != 0:
         raise DeploymentFailedError
@@ -99,12 +186,40 @@ def dump_output(play, _inventory, output_logger):
 
 class Runner:
     """Generates files required by ansible and runs the playbook"""
-    def __init__(self, iterator, json_output=True):
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    def __init__(self, iterator, json_output=True, start_method=None, max_workers=None, \
+            fail_fast=False, play_timeout=None, step_timeout=None, journal=None, resume=False,
+            lock=None):
         self.iterator = iterator
         self.output_logger = StackmateOutput() if json_output else None
+        # stop the plays that are running as soon as one of them fails
+        self.fail_fast = fail_fast
+        # the time (in seconds) that a play or a step can run for
+        self.play_timeout = play_timeout or os.environ.get(ENV_PLAY_TIMEOUT)
+        self.step_timeout = step_timeout or os.environ.get(ENV_STEP_TIMEOUT)
+        # the journal of completed plays, used to resume a failed operation
+        self.journal = journal
+        self.resume = resume and journal is not None
+        # the lock held on the stage's state, reported along with the deployment
+        self.lock = lock
+        # the variables shared by the plays, shipped to the workers when the pool starts
+        self.shared_vars = {}
+        # streams the output of the plays from the workers, written by the parent
+        self.events = None
+        # the directory where the facts of the hosts are cached during the operation
+        self.fact_cache = None
+        self.pool = WorkerPool(
+            max_workers=max_workers,
+            start_method=start_method,
+            initializer=init_worker,
+            preload=['stackmate.runner'])
+        self.forks = ForkBudget()
 
     def dump(self):
         """Prints out the entire playbook (for debugging purposes)"""
+        # nothing gets deployed, the journal should be left intact
+        self.journal = None
+        self.resume = False
         self.run(process_func=dump_output, commit_state=False)
 
     def log_stackmate_output(self, action, **kwargs):
@@ -114,92 +229,349 @@ class Runner:
 
         self.output_logger.explicit_deployment_output(action, **kwargs)
 
-    def _run_plays_sequentially(self, plays, inventory, process_func, commit_state=True):
-        """Runs the plays sequentially"""
-        for play in plays:
-            if not play.tasks:
-                continue
-
-            facts = process_func(play, inventory, self.output_logger)
-
-            self.iterator.apply_state_changes(facts)
-
-            if commit_state:
-                self.iterator.commit_state()
-
-    def _run_plays_in_parallel(self, plays, inventory, process_func, commit_state=True):
-        """Runs the plays in parallel"""
-        failures = 0
-        batch_size = os.cpu_count()
-        results = []
-        result_objects = []
-
-        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-            chunks = list_chunks(plays, chunk_size=batch_size)
-            futures_to_play = {}
-
-            for chunk in chunks:
-                futures_to_play.update({
-                    executor.submit(
-                        process_func, pp, inventory, self.output_logger): pp for pp in chunk
-                })
-
-                for future in as_completed(futures_to_play, timeout=None):
-                    try:
-                        facts = future.result()
-
-                        self.iterator.apply_state_changes(facts)
-
-                        if commit_state:
-                            self.iterator.commit_state()
-                    except DeploymentFailedError:
-                        failures += 1
-
-            executor.shutdown(wait=True)
-
-        if failures > 0:
-            raise DeploymentFailedError
-
     def run(self, process_func=None, commit_state=True):
         """Runs a series of playbooks within a try / except block that handles failures"""
         try:
+            self.shared_vars = self.iterator.project_vars.get()
+            self.fact_cache = tempfile.mkdtemp(prefix='stackmate-facts-')
+            self._open_event_channel()
+            self.pool.start()
             self.process(process_func=process_func, commit_state=commit_state)
         except Exception as exc: # pylint: disable=broad-except
             tback = sys.exc_info()[2]
             self.log_stackmate_output(DEPLOYMENT_FAILURE, debug={
                 'exception': traceback.format_exception(type(exc), exc, tback)
             })
+        finally:
+            self.pool.shutdown()
+
+            if self.events is not None:
+                self.events.close()
+                self.events = None
+
+            if self.fact_cache is not None:
+                shutil.rmtree(self.fact_cache, ignore_errors=True)
+                self.fact_cache = None
 
     def process(self, process_func=None, commit_state=True):
-        """Processes the list of playbooks"""
-        updated_roles = set()
+        """
+        Processes the list of playbooks.
+
+        Rather than running the steps one after the other, every role is scheduled
+        as soon as the roles it depends upon have finished (see `PlayGraph`)
+        """
         process_func = process_func or run_play
         playbooks = list(iter(self.iterator))
+        graph = PlayGraph(self.iterator.steps, get_role_dependencies(self.iterator.project))
 
         # mark the deployment as started
         self.log_stackmate_output(
-            DEPLOYMENT_STARTED, roles=list({r for pb in playbooks for r in pb.rolenames}))
+            DEPLOYMENT_STARTED, roles=list({r for pb in playbooks for r in pb.rolenames}),
+            state_lock=self.lock.metrics if self.lock else None)
+
+        # start over, unless we're resuming the operation from where it stopped
+        if self.journal is not None and not self.resume:
+            self.journal.clear()
+
+        failed_node = self._schedule(graph, playbooks, process_func, commit_state)
+
+        # the state changes have been recorded in the journal, write them to the state file
+        if commit_state:
+            self.iterator.compact_state()
+
+        if failed_node is not None:
+            # run the special play that is notifying us about failures
+            failplay = playbooks[failed_node.step].get_failure_play()
+
+            if failplay is not None:
+                future = self._submit(
+                    process_func, failplay, playbooks[failed_node.step].get_inventory())
+                wait([future])
+                self._wait_for_events(failplay)
+                future.result()
+
+            return self.log_stackmate_output(DEPLOYMENT_FAILURE, forks=self.forks.utilisation)
+
+        if self.journal is not None:
+            self.journal.clear()
+
+        return self.log_stackmate_output(
+            DEPLOYMENT_SUCCESS,
+            critical_path=self._critical_path_output(graph),
+            forks=self.forks.utilisation)
+
+    def _open_event_channel(self):
+        """Opens the channel that streams the events of the workers, for the pool to start"""
+        if self.output_logger is not None:
+            self.events = EventChannel(
+                sink=self._write_event, start_method=self.pool.start_method).start()
+
+        self.pool.initargs = (
+            self.shared_vars, self.output_logger, self.events.queue if self.events else None,
+            self.fact_cache)
+
+    def _terminate_pool(self):
+        """
+        Terminates the workers, along with the plays they are running. The workers that get
+        killed might leave the channel broken, the restarted pool streams over a new one
+        """
+        self.pool.terminate()
+
+        if self.events is not None:
+            self.events.close()
+            self._open_event_channel()
+
+    def _write_event(self, kind, payload):
+        """Writes the events streamed from the workers"""
+        if kind == EVENT_OUTPUT:
+            self.output_logger.write_line(payload)
+
+    def _submit(self, process_func, play, inventory, deadline=None):
+        """
+        Hands the play off to a worker, as a descriptor that refers to the shared variables.
+        The worker stops the play once the deadline has passed
+        """
+        timeout = deadline - time.monotonic() if deadline is not None else None
+
+        return self.pool.submit(
+            run_play_descriptor, process_func, play.get_descriptor(self.shared_vars), inventory,
+            token=id(play), timeout=timeout)
+
+    def _wait_for_events(self, play):
+        """Waits until the output of a play that completed has been written"""
+        if self.events is not None:
+            self.events.wait(id(play))
+
+    def _schedule(self, graph, playbooks, process_func, commit_state=True):
+        """
+        Runs the nodes of the graph, each one as soon as its dependencies have completed.
+        Returns the node that failed, if any
+        """
+        # pylint: disable=too-many-locals,too-many-branches
+        updated_roles = set()
+        pending = list(graph.nodes)
+        queued = {}
+        running = {}
+        deadlines = {}
+        fingerprints = {}
+        steps_started = {}
+        failed_node = None
+        cancel = False
+
+        while True:
+            # no new plays start once a failure has occurred
+            while failed_node is None and graph.ready(pending):
+                for node in graph.ready(pending):
+                    pending.remove(node)
+                    plays, updated_roles = playbooks[node.step].get_role_plays(
+                        node.rolespec, updated_roles)
+                    plays = [play for play in plays if play.tasks]
+
+                    # provisioning not required, the node is considered complete
+                    if not plays:
+                        graph.complete(node)
+                        continue
+
+                    node.start()
+                    steps_started.setdefault(node.step, node.started_at)
+                    queued[node.key] = (plays, playbooks[node.step].get_inventory())
+
+            # submit the plays of the started nodes. Plays of nodes that belong
+            # to sequential steps are submitted one at a time
+            startable = []
+            for key, (plays, inventory) in queued.items():
+                node = graph.get_node(key)
+
+                if not node.parallel and self._is_running(running, key):
+                    continue
+
+                startable += [(key, play, inventory) for play in (
+                    plays if node.parallel else plays[:1])]
+
+            # plays that completed in a previous run of the operation are not run again
+            if self.resume:
+                remaining = self._resume_plays(graph, startable, queued, running, commit_state)
+
+                # resumed plays might have completed nodes that others were waiting for
+                if len(remaining) < len(startable):
+                    continue
+
+            # split the available ansible forks among the plays about to start,
+            # plays that get no forks wait for the running ones to give theirs back
+            grants = self.forks.allocate({
+                id(play): play.host_count(inventory) for _key, play, inventory in startable
+            })
 
-        for playbook in playbooks:
-            inventory = playbook.get_inventory()
-            plays, updated_roles = playbook.get_plays(updated_roles)
+            for key, play, inventory in startable:
+                play.forks = grants[id(play)]
+                if not play.forks:
+                    continue
 
-            # no plays were found, provisioning probably not required, move on
-            if not plays:
+                deadline = self._get_deadline(graph.get_node(key), steps_started[key[0]])
+                future = self._submit(process_func, play, inventory, deadline)
+                running[future] = (key, play)
+                # the worker stops the play at its deadline, it's only hung if it doesn't
+                deadlines[future] = deadline + PLAY_TIMEOUT_GRACE if deadline is not None else None
+                fingerprints[future] = play.fingerprint(inventory) if self.journal else None
+
+                self._dequeue(queued, key, play)
+
+            if not running:
+                break
+
+            # the state changes that were batched are written within the save interval,
+            # even if no other play completes in the meantime
+            flush_deadline = self.iterator.state_flush_deadline if commit_state else None
+            done, _ = wait(
+                running, timeout=self._get_wait_timeout(deadlines, flush_deadline),
+                return_when=FIRST_COMPLETED)
+
+            if commit_state:
+                self.iterator.flush_due_state()
+
+            for future in set(running) - done:
+                if deadlines[future] is None or deadlines[future] > time.monotonic():
+                    continue
+
+                # the worker didn't stop the play, it is considered failed and the
+                # worker that is hanging will be terminated
+                key, play = running.pop(future)
+                deadlines.pop(future)
+                fingerprints.pop(future)
+                self.forks.release(id(play))
+                self.log_stackmate_output(DEPLOYMENT_TIMEOUT, name=play.playname)
+
+                failed_node = failed_node or graph.get_node(key)
+                queued.pop(key, None)
+                cancel = True
+
+            for future in done:
+                key, play = running.pop(future)
+                deadlines.pop(future)
+                fingerprint = fingerprints.pop(future)
+                node = graph.get_node(key)
+                self.forks.release(id(play))
+                self._wait_for_events(play)
+
+                try:
+                    facts = future.result()
+
+                    self.iterator.apply_state_changes(facts)
+
+                    if commit_state:
+                        self.iterator.commit_state()
+
+                    if self.journal is not None:
+                        self.journal.record(fingerprint, play, facts)
+                except DeploymentFailedError as exc:
+                    if isinstance(exc, DeploymentTimeoutError):
+                        self.log_stackmate_output(DEPLOYMENT_TIMEOUT, name=play.playname)
+
+                    failed_node = failed_node or node
+                    queued.pop(key, None)
+
+                if key not in queued and not self._is_running(running, key):
+                    graph.complete(node)
+
+                    # the state commits that were batched are written once the step is over
+                    if commit_state and graph.is_step_complete(node.step):
+                        self.iterator.flush_state()
+
+            # stop the plays that are still running, instead of waiting for them to finish
+            if failed_node is not None and self.fail_fast:
+                queued.clear()
+                self._cancel(running)
+
+        # plays that timed out are still running in the workers
+        if cancel:
+            self._terminate_pool()
+
+        return failed_node
+
+    def _resume_plays(self, graph, startable, queued, running, commit_state=True) -> list:
+        """
+        Applies the facts of the plays that have completed in a previous run of the operation,
+        as recorded in the journal. Returns the plays that should still run
+        """
+        remaining = []
+
+        for key, play, inventory in startable:
+            facts = self.journal.get_facts(play.fingerprint(inventory))
+
+            if facts is None:
+                remaining.append((key, play, inventory))
                 continue
 
-            try:
-                if playbook.can_run_in_parallel:
-                    self._run_plays_in_parallel(plays, inventory, process_func, commit_state)
-                else:
-                    self._run_plays_sequentially(plays, inventory, process_func, commit_state)
-            except DeploymentFailedError:
-                # run the special play that is notifying us about failures
-                failplay = playbook.get_failure_play()
+            self.iterator.apply_state_changes(facts)
+
+            if commit_state:
+                self.iterator.commit_state()
+
+            self.log_stackmate_output(DEPLOYMENT_RESUMED, name=play.playname)
+            self._dequeue(queued, key, play)
+
+            if key not in queued and not self._is_running(running, key):
+                graph.complete(graph.get_node(key))
 
-                if failplay is not None:
-                    process_func(failplay, inventory, self.output_logger)
+        return remaining
 
-                return self.log_stackmate_output(DEPLOYMENT_FAILURE)
+    @staticmethod
+    def _dequeue(queued: dict, key, play):
+        """Removes a play from the ones that are queued for a node"""
+        queued[key][0].remove(play)
+
+        if not queued[key][0]:
+            del queued[key]
+
+    def _cancel(self, running: dict):
+        """Cancels the running plays and terminates the workers that run them"""
+        if not running:
+            return
 
-        return self.log_stackmate_output(DEPLOYMENT_SUCCESS)
+        for future, (_key, play) in running.items():
+            future.cancel()
+            self.forks.release(id(play))
+            self.log_stackmate_output(DEPLOYMENT_CANCEL, name=play.playname)
+
+        running.clear()
+        self._terminate_pool()
+
+    def _get_deadline(self, node, step_started_at):
+        """
+        Returns the time by which a play of the node should finish,
+        given the per-play and per-step timeouts
+        """
+        deadlines = []
+        play_timeout = node.rolespec.get('timeout', self.play_timeout)
+        step_timeout = node.stepconfig.get('timeout', self.step_timeout)
+
+        if play_timeout:
+            deadlines.append(time.monotonic() + float(play_timeout))
+
+        if step_timeout:
+            deadlines.append(step_started_at + float(step_timeout))
+
+        return min(deadlines) if deadlines else None
+
+    @staticmethod
+    def _get_wait_timeout(deadlines: dict, *others):
+        """Returns how long to wait for the running plays, before the first deadline expires"""
+        upcoming = [d for d in list(deadlines.values()) + list(others) if d is not None]
+
+        if not upcoming:
+            return None
+
+        return max(0, min(upcoming) - time.monotonic())
+
+    @staticmethod
+    def _is_running(running, key) -> bool:
+        """Whether any of the plays for a node are running"""
+        return any(running_key == key for running_key, _play in running.values())
+
+    @staticmethod
+    def _critical_path_output(graph):
+        """Returns the critical path of the operation in a format suitable for the output"""
+        return [
+            {'step': n.stepconfig.get('name'), 'role': n.rolename, 'duration': n.duration}
+            for n in graph.critical_path()
+        ]
@@ -0,0 +1,169 @@
+"""Schedules the plays of an operation as a dependency graph"""
+# -*- coding: utf-8 -*-
+import time
+from stackmate.constants import LOCALHOST, ROLE_TO_DEPENDS_ON_MAPPING
+
+
+def get_role_dependencies(project=None) -> dict:
+    """
+    Returns the roles that every role depends upon.
+
+    Apart from the static mapping, a role depends on the roles of the deployables
+    its own deployables are derived from (eg. environment variables that are
+    rendered using the output of a database or a CDN)
+    """
+    dependencies = {role: set(deps) for role, deps in ROLE_TO_DEPENDS_ON_MAPPING.items()}
+
+    if project is None:
+        return dependencies
+
+    for rolename, deployables in project.deployables_per_role.items():
+        for deployable in deployables:
+            parent = getattr(deployable, 'parent', None)
+            parent_role = getattr(parent, 'rolename', None)
+
+            if parent_role and parent_role != rolename:
+                dependencies.setdefault(rolename, set()).add(parent_role)
+
+    return dependencies
+
+
+class PlayNode:
+    """A role that runs within an operation's step, the unit of scheduling"""
+    def __init__(self, step, index, rolespec, stepconfig):
+        self.step = step
+        self.index = index
+        self.rolespec = rolespec
+        self.stepconfig = stepconfig
+        self.dependencies = set()
+        self.started_at = None
+        self.finished_at = None
+
+    def __repr__(self):
+        return '<PlayNode {step}:{role}>'.format(step=self.step, role=self.rolename)
+
+    @property
+    def key(self) -> tuple:
+        """The key that identifies the node in the graph"""
+        return (self.step, self.index)
+
+    @property
+    def rolename(self) -> str:
+        """The role to be executed"""
+        return self.rolespec['name']
+
+    @property
+    def is_remote(self) -> bool:
+        """Whether the role runs on the provisioned hosts rather than the controller"""
+        return self.rolespec.get('hosts', LOCALHOST) != LOCALHOST
+
+    @property
+    def parallel(self) -> bool:
+        """Whether the plays for the node can run in parallel"""
+        return bool(self.stepconfig.get('parallel'))
+
+    def start(self):
+        """Marks the node as started"""
+        self.started_at = time.monotonic()
+
+    def finish(self):
+        """Marks the node as finished"""
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self.finished_at = time.monotonic()
+
+    @property
+    def duration(self) -> float:
+        """How long it took for the node's plays to run"""
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class PlayGraph:
+    """
+    Directed acyclic graph of the roles to run during an operation.
+
+    A role in a step depends on:
+    - the roles it depends upon that run in earlier steps
+    - the same role when it has run in an earlier step (eg. instance terminations)
+    - the remote roles of earlier steps, when it runs on the hosts too,
+      so that work on the same hosts keeps the order of the steps (eg. apt locks)
+    - the previous role of the step, when the step is not parallel
+    - every role of the earlier steps, when the step is marked as a barrier
+    """
+    def __init__(self, steps: list, role_dependencies: dict = None):
+        self.steps = steps
+        self.role_dependencies = role_dependencies or get_role_dependencies()
+        self.nodes = []
+        self._completed = set()
+        self._build()
+
+    def _build(self):
+        """Creates the nodes and the edges of the graph"""
+        for step, stepconfig in enumerate(self.steps):
+            step_nodes = []
+            earlier_nodes = list(self.nodes)
+
+            for index, rolespec in enumerate(stepconfig.get('roles', [])):
+                node = PlayNode(step, index, rolespec, stepconfig)
+                depends_on = self.role_dependencies.get(node.rolename, set())
+
+                for other in earlier_nodes:
+                    if stepconfig.get('barrier') \
+                            or other.rolename in depends_on \
+                            or other.rolename == node.rolename \
+                            or (node.is_remote and other.is_remote):
+                        node.dependencies.add(other.key)
+
+                if step_nodes and not node.parallel:
+                    node.dependencies.add(step_nodes[-1].key)
+
+                step_nodes.append(node)
+
+            self.nodes += step_nodes
+
+    def get_node(self, key) -> PlayNode:
+        """Returns a node by its key"""
+        return next(n for n in self.nodes if n.key == key)
+
+    def complete(self, node: PlayNode):
+        """Marks the node as completed"""
+        node.finish()
+        self._completed.add(node.key)
+
+    def is_complete(self, node: PlayNode) -> bool:
+        """Whether the node has completed"""
+        return node.key in self._completed
+
+    def is_step_complete(self, step: int) -> bool:
+        """Whether all the nodes of a step have completed"""
+        return all(self.is_complete(n) for n in self.nodes if n.step == step)
+
+    def ready(self, pending: list) -> list:
+        """Returns the pending nodes whose dependencies have completed"""
+        return [n for n in pending if n.dependencies <= self._completed]
+
+    def critical_path(self) -> list:
+        """
+        Returns the chain of completed nodes that determined the operation's duration,
+        by walking back from the node that finished last through the dependency
+        that finished last
+        """
+        completed = [n for n in self.nodes if self.is_complete(n) and n.duration > 0]
+        if not completed:
+            return []
+
+        node = max(completed, key=lambda n: n.finished_at)
+        path = [node]
+
+        while True:
+            dependencies = [n for n in completed if n.key in node.dependencies]
+
+            if not dependencies:
+                break
+
+            node = max(dependencies, key=lambda n: n.finished_at)
+            path.insert(0, node)
+
+        return path
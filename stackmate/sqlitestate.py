@@ -0,0 +1,265 @@
+"""Provides a state backend that is stored in an SQLite database"""
+# -*- coding: utf-8 -*-
+import os
+import json
+import sqlite3
+from datetime import datetime
+from stackmate.base import AttributeDict
+from stackmate.helpers import string_hash
+from stackmate.constants import VERSION
+from stackmate.configurations import StageState
+from stackmate.resources import ResourceList
+from stackmate.state import merge_role_resources, ensure_state_migrated
+
+STATE_DATABASE_FILE = 'state.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stages (
+    stage TEXT PRIMARY KEY,
+    version TEXT
+);
+CREATE TABLE IF NOT EXISTS roles (
+    stage TEXT,
+    role TEXT,
+    PRIMARY KEY (stage, role)
+);
+CREATE TABLE IF NOT EXISTS resources (
+    stage TEXT,
+    role TEXT,
+    position INTEGER,
+    resource_id TEXT,
+    contents TEXT,
+    PRIMARY KEY (stage, role, position)
+);
+CREATE INDEX IF NOT EXISTS resources_by_id ON resources (stage, role, resource_id);
+CREATE TABLE IF NOT EXISTS outputs (
+    stage TEXT,
+    role TEXT,
+    position INTEGER,
+    resource_id TEXT,
+    output TEXT,
+    PRIMARY KEY (stage, role, position)
+);
+CREATE INDEX IF NOT EXISTS outputs_by_id ON outputs (stage, resource_id);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT,
+    role TEXT,
+    resources TEXT,
+    recorded_at TEXT
+);
+CREATE INDEX IF NOT EXISTS history_by_role ON history (stage, role);
+'''
+
+SELECT_RESOURCES = '''
+SELECT r.role, r.contents, o.output FROM resources r
+LEFT JOIN outputs o ON o.stage = r.stage AND o.role = r.role AND o.position = r.position
+WHERE r.stage = ? {condition}
+ORDER BY r.role, r.position
+'''
+
+
+class SqliteState:
+    """
+    Holds the state for the project in an SQLite database, next to the stages' state files.
+
+    Resources are indexed by stage, role and id, so that roles are read and updated
+    on their own, rather than the whole state. Changes are committed in a single
+    transaction on every save, and exported to the stage's state file on compaction
+    """
+    def __init__(self, rootpath=None, stage=None):
+        ensure_state_migrated(rootpath)
+
+        self.__state_file = StageState(rootpath=rootpath, stage=stage)
+        self.stage = stage
+
+        os.makedirs(self.__state_file.rootpath, exist_ok=True)
+        self.__connection = sqlite3.connect(self.get_path(rootpath), timeout=30)
+        # readers don't block the writer and vice versa
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__connection.executescript(SCHEMA)
+
+        self.__version = self._import()
+
+    @staticmethod
+    def get_path(rootpath=None) -> str:
+        """Returns the path to the state database"""
+        return os.path.join(StageState(rootpath=rootpath, stage=None).rootpath, STATE_DATABASE_FILE)
+
+    @staticmethod
+    def exists(rootpath=None) -> bool:
+        """Whether the project's state is stored in a database"""
+        return os.path.isfile(SqliteState.get_path(rootpath))
+
+    def _import(self) -> str:
+        """Imports the stage's state file the first time the stage is loaded, returns the version"""
+        row = self.__connection.execute(
+            'SELECT version FROM stages WHERE stage = ?', (self.stage,)).fetchone()
+
+        if row:
+            return row[0]
+
+        contents = dict(self.__state_file.contents)
+        version = contents.pop('version', VERSION)
+
+        with self.__connection:
+            self.__connection.execute(
+                'INSERT INTO stages (stage, version) VALUES (?, ?)', (self.stage, version))
+
+            for role, resources in contents.items():
+                self._write_role(role, resources or [], history=False)
+
+        return version
+
+    def _read_roles(self, role=None, resource_id=None) -> dict:
+        """Reads the resources of the stage, or the ones for a role (and resource id)"""
+        condition, params = '', [self.stage]
+
+        if role is not None:
+            condition, params = condition + ' AND r.role = ?', params + [role]
+
+        if resource_id is not None:
+            condition, params = condition + ' AND r.resource_id = ?', params + [resource_id]
+
+        roles = {}
+        query = SELECT_RESOURCES.format(condition=condition)
+
+        for rolename, contents, output in self.__connection.execute(query, params):
+            entry = json.loads(contents)
+
+            if output is not None:
+                entry['output'] = json.loads(output)
+
+            roles.setdefault(rolename, []).append(entry)
+
+        return roles
+
+    def _write_role(self, role, resources: list, history=True):
+        """Replaces the resources for a role, within the current transaction"""
+        params = (self.stage, role)
+
+        self.__connection.execute(
+            'INSERT OR IGNORE INTO roles (stage, role) VALUES (?, ?)', params)
+        self.__connection.execute('DELETE FROM resources WHERE stage = ? AND role = ?', params)
+        self.__connection.execute('DELETE FROM outputs WHERE stage = ? AND role = ?', params)
+
+        rows, outputs = [], []
+        for position, resource in enumerate(resources):
+            entry = dict(resource)
+            resource_id = entry.get('id')
+
+            if 'output' in entry:
+                outputs.append(params + (
+                    position, resource_id, json.dumps(entry.pop('output'), default=str)))
+
+            rows.append(params + (position, resource_id, json.dumps(entry, default=str)))
+
+        self.__connection.executemany(
+            'INSERT INTO resources (stage, role, position, resource_id, contents) '
+            'VALUES (?, ?, ?, ?, ?)', rows)
+        self.__connection.executemany(
+            'INSERT INTO outputs (stage, role, position, resource_id, output) '
+            'VALUES (?, ?, ?, ?, ?)', outputs)
+
+        if history:
+            self.__connection.execute(
+                'INSERT INTO history (stage, role, resources, recorded_at) VALUES (?, ?, ?, ?)',
+                params + (json.dumps(resources, default=str), str(datetime.utcnow())))
+
+    def get_resources(self, rolename: str) -> ResourceList:
+        """Returns the resource list for the deployable"""
+        return ResourceList(self._read_roles(role=rolename).get(rolename, []))
+
+    def get_deployable_resources(self, deployable) -> ResourceList:
+        """Returns resources for a specific deployable"""
+        rolename = deployable.rolename
+        roles = self._read_roles(role=rolename, resource_id=deployable.deployable_id)
+
+        return ResourceList(resources=roles.get(rolename, []))
+
+    def get(self, path, default=None):
+        """Returns the path in the state"""
+        rolename = path.split('.')[0]
+        return AttributeDict(self._read_roles(role=rolename)).get_path(path) or default
+
+    def merge_role_resource_attributes(self, role, **attrs):
+        """Merges attributes into the ones of every resource for a given role"""
+        entries = self._read_roles(role=role).get(role)
+        if not entries:
+            return
+
+        for entry in entries:
+            entry.update(attrs)
+
+        self._write_role(role, entries)
+
+    def update(self, role, content):
+        """Updates a given role in the state"""
+        resources = merge_role_resources(self.get_resources(role), content)
+        self._write_role(role, resources)
+
+        return resources
+
+    def history(self, role) -> list:
+        """Returns the resources that a role was updated with, oldest first"""
+        return [
+            {'resources': json.loads(resources), 'recorded_at': recorded_at}
+            for resources, recorded_at in self.__connection.execute(
+                'SELECT resources, recorded_at FROM history WHERE stage = ? AND role = ? '
+                'ORDER BY id', (self.stage, role))
+        ]
+
+    @property
+    def contents(self):
+        """Returns the state's contents"""
+        roles = self._read_roles()
+        return AttributeDict({role: roles.get(role, []) for role in self.keys()})
+
+    @property
+    def has_pending_changes(self) -> bool:
+        """Whether there are changes that haven't been committed yet"""
+        return self.__connection.in_transaction
+
+    @property
+    def flush_deadline(self):
+        """Saves are committed right away, there's nothing to flush later on"""
+        return None
+
+    def flush_if_due(self):
+        """Saves are committed right away, there's nothing to flush later on"""
+        return False
+
+    def save(self):
+        """Commits the changes to the database"""
+        self.__connection.commit()
+        return True
+
+    def flush(self):
+        """Commits the changes to the database"""
+        return self.save()
+
+    def compact(self):
+        """Commits the changes and exports the state to the stage's state file"""
+        self.save()
+        self.__connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+        return self.export()
+
+    def export(self):
+        """Writes the state to the stage's state file, in YAML"""
+        self.__state_file.contents = dict(self.contents, version=self.__version)
+        return self.__state_file.write()
+
+    def fingerprint(self) -> str:
+        """Returns a hash of the state's contents"""
+        return string_hash(json.dumps(self.contents, sort_keys=True, default=str))
+
+    def keys(self):
+        """Returns the keys that are stored in the state"""
+        return [role for (role,) in self.__connection.execute(
+            'SELECT role FROM roles WHERE stage = ? ORDER BY rowid', (self.stage,))]
+
+    def close(self):
+        """Closes the connection to the database"""
+        self.__connection.close()
@@ -1,16 +1,106 @@
 """Provides handlers for the project's state"""
 # -*- coding: utf-8 -*-
-from stackmate.constants import VERSION, STATE_OUTPUT_PRESERVED_KEYS
-from stackmate.configurations import ProjectState
+import os
+import json
+import time
+from stackmate.helpers import string_hash
+from stackmate.constants import VERSION, STATE_OUTPUT_PRESERVED_KEYS, STATE_SAVE_INTERVAL, \
+    STATE_BACKENDS, STATE_BACKEND_SQLITE, STATE_BACKEND_YAML, ENV_STATE_BACKEND
+from stackmate.configurations import StageState, is_state_migrated
+from stackmate.exceptions import StateMigrationRequiredError
+from stackmate.journal import StateJournal
 from stackmate.resources import Resource, ResourceList
 
 
+def ensure_state_migrated(rootpath):
+    """Makes sure that the state is stored per stage, the state is not loaded otherwise"""
+    if not is_state_migrated(rootpath):
+        raise StateMigrationRequiredError(
+            'The state of the stages is stored in a single file, '
+            'run `stackmate state --migrate` to store it per stage')
+
+
+def merge_role_resources(currents: ResourceList, content: list) -> list:
+    """
+    Merges the resources reported for a role with the ones currently in the state,
+    returns the resources that the role should be updated with
+    """
+    resources = []
+
+    for entry in content:
+        # find the resource entry in the `current` list
+        current_entry = None
+        if entry.get('id') and currents:
+            current_entry = currents.find_by_id(entry['id'])
+
+        # if the entry was found, overwrite with the current information,
+        # but preserve the credentials
+        if isinstance(current_entry, Resource):
+            serialized = current_entry.serialize().copy()
+            # copy the output and update its values if required
+            output = dict(serialized['output']).copy() if serialized.get('output') else {}
+            entry_output = dict(entry['output']) if entry.get('output') else {}
+
+            for key, value in entry_output.items():
+                # preserve the current value if the key should be preserved and is empty
+                if key in STATE_OUTPUT_PRESERVED_KEYS and not value:
+                    continue
+
+                # otherwise, update the value
+                output[key] = value
+
+            # update with the current entry values, then overwrite the output
+            entry.update({'output': output})
+
+        # the entry should no longer be tainted or touched
+        entry.update({
+            'reference': entry.get('provision_params', {}).get('reference'),
+            'tainted': False,
+            'touched': False,
+        })
+
+        resources.append(dict(entry))
+
+    return resources
+
+
 class State:
     """Holds the state for the project"""
-    def __init__(self, rootpath=None, stage=None):
-        self.__state_file = ProjectState(rootpath=rootpath, stage=stage)
+    def __init__(self, rootpath=None, stage=None, save_interval=STATE_SAVE_INTERVAL):
+        ensure_state_migrated(rootpath)
+
+        self.__state_file = StageState(rootpath=rootpath, stage=stage)
         self.__version = self.__state_file.contents.pop('version', VERSION)
         self.__contents = self.__state_file.contents
+        self.__journal = StateJournal(rootpath=rootpath, stage=stage)
+        # the roles that changed since the state was last saved
+        self.__changed_roles = set()
+        # saves that happen within the interval are batched into a single write
+        self.__save_interval = save_interval
+        self.__last_flushed = None
+
+        # recover the changes of an operation that didn't get to compact them
+        self.__journal.replay(self.__contents)
+
+    @staticmethod
+    def load(rootpath=None, stage=None, backend=None):
+        """
+        Returns the state for a stage, stored in the backend specified. Unless specified,
+        the database is used when the project has one, the stage's state file otherwise
+        """
+        # pylint: disable=import-outside-toplevel
+        from stackmate.sqlitestate import SqliteState
+
+        backend = backend or os.environ.get(ENV_STATE_BACKEND) or (
+            STATE_BACKEND_SQLITE if SqliteState.exists(rootpath) else STATE_BACKEND_YAML)
+
+        if backend not in STATE_BACKENDS:
+            raise ValueError('The state backend should be one of {}'.format(STATE_BACKENDS))
+
+        if backend == STATE_BACKEND_SQLITE:
+            return SqliteState(rootpath=rootpath, stage=stage)
+
+        return State(rootpath=rootpath, stage=stage)
 
     def get_resources(self, rolename: str) -> ResourceList:
         """Returns the resource list for the deployable"""
@@ -35,45 +125,13 @@ class State:
             entry.update(attrs)
 
         self.__contents.set_path(role, entries)
+        self.__changed_roles.add(role)
 
     def update(self, role, content):
         """Updates a given role in the state"""
-        resources = []
-        currents = self.get_resources(role)
-
-        for entry in content:
-            # find the resource entry in the `current` list
-            current_entry = None
-            if entry.get('id') and currents:
-                current_entry = currents.find_by_id(entry['id'])
-
-            # if the entry was found, overwrite with the current information,
-            # but preserve the credentials
-            if isinstance(current_entry, Resource):
-                serialized = current_entry.serialize().copy()
-                # copy the output and update its values if required
-                output = dict(serialized['output']).copy() if serialized.get('output') else {}
-                entry_output = dict(entry['output']) if entry.get('output') else {}
-
-                for key, value in entry_output.items():
-                    # preserve the current value if the key should be preserved and is empty
-                    if key in STATE_OUTPUT_PRESERVED_KEYS and not value:
-                        continue
-
-                    # otherwise, update the value
-                    output[key] = value
-
-                # update with the current entry values, then overwrite the output
-                entry.update({'output': output})
-
-            # the entry should no longer be tainted or touched
-            entry.update({
-                'reference': entry.get('provision_params', {}).get('reference'),
-                'tainted': False,
-                'touched': False,
-            })
+        resources = merge_role_resources(self.get_resources(role), content)
 
-            resources.append(dict(entry))
+        self.__changed_roles.add(role)
 
         return self.__contents.set_path(role, resources)
 
@@ -82,10 +140,73 @@ class State:
         """Returns the state file's contents"""
         return self.__contents
 
+    @property
+    def journal(self) -> StateJournal:
+        """Returns the journal where the changes are recorded until they're compacted"""
+        return self.__journal
+
+    @property
+    def has_pending_changes(self) -> bool:
+        """Whether there are changes that haven't been written to the journal yet"""
+        return bool(self.__changed_roles)
+
+    @property
+    def flush_deadline(self):
+        """
+        Returns the time by which the changes of the saves that were batched have to be flushed,
+        the save interval is the longest they can stay in memory. None when there aren't any
+        """
+        if not self.__changed_roles or self.__last_flushed is None:
+            return None
+
+        return self.__last_flushed + self.__save_interval
+
     def save(self):
-        """Writes out the state file"""
-        self.__state_file.contents = self.__contents
-        return self.__state_file.write()
+        """
+        Records the roles that changed in the journal. Saves that happen within
+        the save interval are batched together, until they're flushed (see `flush_deadline`)
+        """
+        now = time.monotonic()
+
+        if self.__last_flushed is not None and now - self.__last_flushed < self.__save_interval:
+            return True
+
+        return self.flush()
+
+    def flush_if_due(self):
+        """Flushes the changes of the saves that were batched, once their deadline has passed"""
+        deadline = self.flush_deadline
+
+        if deadline is None or deadline > time.monotonic():
+            return False
+
+        return self.flush()
+
+    def flush(self):
+        """Records the roles that changed since the last flush in the journal, in a single write"""
+        if self.__changed_roles:
+            self.__journal.record_many({
+                role: self.__contents.get(role, []) for role in sorted(self.__changed_roles)
+            })
+
+        self.__changed_roles.clear()
+        self.__last_flushed = time.monotonic()
+
+        return True
+
+    def compact(self):
+        """Writes out the state file, including the changes recorded in the journal"""
+        self.__state_file.contents = dict(self.__contents, version=self.__version)
+        written = self.__state_file.write()
+
+        self.__journal.clear()
+        self.__changed_roles.clear()
+
+        return written
+
+    def fingerprint(self) -> str:
+        """Returns a hash of the state's contents"""
+        return string_hash(json.dumps(self.contents, sort_keys=True, default=str))
 
     def keys(self):
         """Returns the keys that are stored in the state"""
@@ -1,8 +1,11 @@
 """Provides tests for dependencies"""
 # -*- coding: utf-8 -*-
 # pylint: disable=E1101,C0111,W0612,R0915
+import copy
+import pickle
 import pytest
-from stackmate.base import AttributeDict
+import yaml
+from stackmate.base import AttributeDict, CachedAttributeDict, compile_path
 from stackmate.base import Model, ModelAttribute
 from stackmate.exceptions import ValidationError
 
@@ -24,6 +27,10 @@ class InnerFakeModel(Model):
             self._inner2 = InnerFakeModel(**attrs)
 
 
+class ParamsFakeModel(Model):
+    _params = ModelAttribute(required=True, datatype=dict)
+
+
 class FakeModel(Model):
     """
     Fake model to test out the base model class
@@ -89,6 +96,88 @@ def describe_attribute_dict():
         assert updated == attr_dict
         assert attr_dict.get_path('empty.not_empty_anymore') == 12345
 
+    def it_wraps_the_nested_values_when_accessed():
+        attr_dict = AttributeDict({'nested': {'inner': 1}, 'entries': [{'value': 1}, 'skipped']})
+        assert isinstance(dict.__getitem__(attr_dict, 'nested'), dict)
+        assert not isinstance(dict.__getitem__(attr_dict, 'nested'), AttributeDict)
+
+        assert isinstance(attr_dict.nested, AttributeDict)
+        assert attr_dict.nested is attr_dict.nested
+        assert attr_dict.entries == [AttributeDict({'value': 1})]
+
+    def it_refreshes_the_wrapped_values_when_updated():
+        attr_dict = AttributeDict({'nested': {'inner': 1}})
+        assert attr_dict.nested.inner == 1
+
+        attr_dict['nested'] = {'inner': 2}
+        assert attr_dict.nested.inner == 2
+
+        attr_dict.set_path('nested.inner', 3)
+        assert attr_dict.nested.inner == 3
+
+        del attr_dict['nested']
+        assert not hasattr(attr_dict, 'nested')
+
+    def it_shares_the_unchanged_values_between_copies():
+        source = {'nested': {'inner': 1}, 'other': {'value': 1}}
+        attr_dict = AttributeDict(source)
+        copied = attr_dict.copy()
+
+        copied.set_path('nested.inner', 2)
+
+        assert copied.get_path('nested.inner') == 2
+        assert attr_dict.get_path('nested.inner') == 1
+        assert source['nested']['inner'] == 1
+        assert copied['other'] is attr_dict['other']
+
+    def it_does_not_pickle_the_wrapped_values():
+        attr_dict = AttributeDict(DICTIONARY)
+        assert attr_dict.nested.inner == DICTIONARY['nested']['inner']
+
+        unpickled = pickle.loads(pickle.dumps(attr_dict))
+        assert unpickled == attr_dict
+        assert unpickled.nested.inner == DICTIONARY['nested']['inner']
+
+    def it_returns_many_paths_at_once():
+        attr_dict = AttributeDict(DICTIONARY)
+        assert attr_dict.get_paths('test', 'nested.inner', 'nested.missing') == [100, 300, None]
+        assert attr_dict.get_paths('missing', 'nested.missing', default=[]) == [[], []]
+
+    def it_compiles_the_paths_once():
+        assert compile_path('somewhere.far.beyond') == ('somewhere', 'far', 'beyond')
+        assert compile_path('somewhere.far.beyond') is compile_path('somewhere.far.beyond')
+
+def describe_cached_attribute_dict():
+    def it_memoizes_the_paths():
+        attr_dict = CachedAttributeDict(DICTIONARY)
+        assert attr_dict.get_path('somewhere.far') is attr_dict.get_path('somewhere.far')
+        assert attr_dict.get_path('somewhere.beyond') is None
+        assert attr_dict.get_path('somewhere.beyond', 'default') == 'default'
+
+    def it_discards_the_memoized_paths_when_updated():
+        attr_dict = CachedAttributeDict(DICTIONARY)
+        assert attr_dict.get_path('nested.inner') == 300
+
+        attr_dict.set_path('nested.inner', 400)
+        assert attr_dict.get_path('nested.inner') == 400
+        assert DICTIONARY['nested']['inner'] == 300
+
+        attr_dict['nested'] = {'inner': 500}
+        assert attr_dict.get_path('nested.inner') == 500
+
+        attr_dict.clear()
+        assert attr_dict.get_path('nested.inner') is None
+
+    def it_copies_and_pickles_the_contents():
+        attr_dict = CachedAttributeDict(DICTIONARY)
+
+        assert isinstance(attr_dict.copy(), CachedAttributeDict)
+        assert attr_dict.copy().get_path('nested.inner') == 300
+
+        unpickled = pickle.loads(pickle.dumps(attr_dict))
+        assert isinstance(unpickled, CachedAttributeDict)
+        assert unpickled.get_path('nested.inner') == 300
+
 def describe_model_attribute():
     def it_initializes_correctly():
         attr = ModelAttribute()
@@ -220,3 +309,76 @@ def describe_model():
         serialized = model.serialize()
         assert isinstance(serialized, dict)
         assert serialized == attributes
+
+    def it_caches_the_serialized_model_until_an_attribute_is_set():
+        model = InnerFakeModel(inner1=10)
+        serialized = model.serialize()
+
+        assert model.serialize() is serialized
+        model.inner1 = 20
+
+        assert model.serialize() is not serialized
+        assert model.serialize()['inner1'] == 20
+
+    def it_does_not_cache_models_that_contain_other_models():
+        model = FakeModel(attr1=True, attr2='a', attr3={'inner1': 30})
+        model.serialize()
+        model.attr3.inner1 = 40
+
+        assert model.serialize()['attr3']['inner1'] == 40
+
+    def it_returns_a_read_only_serialization():
+        model = InnerFakeModel(inner1=10)
+
+        with pytest.raises(TypeError):
+            model.serialize()['inner1'] = 20
+
+        with pytest.raises(TypeError):
+            model.serialize().update({'inner1': 20})
+
+        copied = model.serialize().copy()
+        copied['inner1'] = 20
+        assert model.serialize()['inner1'] == 10
+
+    def it_does_not_share_the_nested_values_of_the_serialization():
+        model = ParamsFakeModel(params={'credentials': {'name': 'db'}, 'nodes': [{'id': 1}]})
+        serialized = model.serialize()
+
+        with pytest.raises(TypeError):
+            serialized['params']['credentials']['name'] = 'changed'
+
+        with pytest.raises(TypeError):
+            serialized['params']['nodes'].append({'id': 2})
+
+        with pytest.raises(TypeError):
+            serialized['params']['nodes'][0]['id'] = 2
+
+        copied = serialized.copy()
+        copied['params']['credentials']['name'] = 'changed'
+        copied['params']['nodes'].append({'id': 2})
+
+        assert model.serialize() is serialized
+        assert model.serialize()['params'] == {'credentials': {'name': 'db'}, 'nodes': [{'id': 1}]}
+
+    def it_copies_and_pickles_the_read_only_serialization():
+        serialized = InnerFakeModel(inner1=10).serialize()
+
+        assert copy.deepcopy(serialized) == serialized
+        assert pickle.loads(pickle.dumps(serialized)) == serialized
+        assert yaml.dump(serialized) == yaml.dump(dict(serialized))
+
+        nested = ParamsFakeModel(params={'nodes': [{'id': 1}]}).serialize()
+        assert pickle.loads(pickle.dumps(nested)) == nested
+        assert yaml.dump(nested) == yaml.dump({'params': {'nodes': [{'id': 1}]}})
+
+    def it_looks_up_the_class_attributes_once():
+        assert InnerFakeModel.get_class_attributes() is InnerFakeModel.get_class_attributes()
+        assert set(InnerFakeModel.get_class_attributes()) == {'inner1', 'inner2'}
+
+    def it_does_not_share_the_updated_attribute_params():
+        first = InnerFakeModel(inner1=10)
+        second = InnerFakeModel(inner1=10)
+        first.set_attribute_params('inner1', choices=[1, 2])
+
+        assert first._attributes['inner1'].choices == [1, 2]
+        assert second._attributes['inner1'].choices is None
@@ -1,9 +1,13 @@
 """Provides tests for dependencies"""
 # -*- coding: utf-8 -*-
 # pylint: disable=E1101,C0111,W0612,R0915
-from stackmate.base import AttributeDict
+import os
+import multiprocessing
+from stackmate.base import AttributeDict, CachedAttributeDict
+from stackmate.helpers import read_yaml, write_yaml
 from stackmate.configurations import ProjectConfiguration, ReadOnlyConfigurationFile,\
-    BranchedConfiguration, ProjectState, ConfigurationFile, OperationsConfiguration
+    BranchedConfiguration, ProjectState, ConfigurationFile, OperationsConfiguration,\
+    StackmateConfiguration, StageState, StateIndex, migrate_branched_state
 
 
 def describe_operations_configuration():
@@ -14,6 +18,14 @@ def describe_operations_configuration():
         assert cfg.filename == 'operations.yml'
         assert cfg.exists
         assert cfg.contents
+        assert isinstance(cfg.contents, CachedAttributeDict)
+
+
+def describe_stackmate_configuration():
+    def it_memoizes_the_paths_looked_up():
+        cfg = StackmateConfiguration()
+        assert isinstance(cfg.contents, CachedAttributeDict)
+        assert cfg.contents.get_path('providers') is cfg.contents.get_path('providers')
 
 
 def describe_project_configuration():
@@ -65,3 +77,80 @@ def describe_project_state():
         assert state.contents.get_path('documentroot') == new_documentroot
         assert state.full_contents.get('documentroot') is None
         assert state.full_contents.get('production').get('documentroot') == new_documentroot
+
+
+def add_stage(rootpath, stage):
+    return StateIndex(rootpath).add(stage)
+
+
+def describe_stage_state():
+    def it_is_stored_in_the_state_directory(tmpdir):
+        state = StageState(rootpath=str(tmpdir), stage='production')
+        assert state.path == os.path.join(str(tmpdir), 'state', 'production.yml')
+        assert not state.exists
+        assert state.contents == {}
+
+    def it_writes_the_stage_only_and_indexes_it(tmpdir):
+        staging = StageState(rootpath=str(tmpdir), stage='staging')
+        staging.contents = {'project': [{'id': 'staging'}]}
+        staging.write()
+
+        production = StageState(rootpath=str(tmpdir), stage='production')
+        production.contents = {'project': [{'id': 'production'}]}
+        production.write()
+
+        assert read_yaml(staging.path) == {'project': [{'id': 'staging'}]}
+        assert read_yaml(production.path) == {'project': [{'id': 'production'}]}
+        assert StateIndex(str(tmpdir)).stages == ['production', 'staging']
+
+    def it_only_writes_the_index_for_new_stages(tmpdir):
+        index = StateIndex(str(tmpdir))
+        assert index.add('production')
+        assert not index.add('production')
+
+    def it_keeps_the_stages_that_are_added_concurrently(tmpdir):
+        stages = ['stage{}'.format(idx) for idx in range(8)]
+
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            pool.starmap(add_stage, [(str(tmpdir), stage) for stage in stages])
+
+        assert StateIndex(str(tmpdir)).stages == stages
+
+
+def describe_migrate_branched_state():
+    def it_splits_the_state_file_per_stage(tmpdir):
+        write_yaml(str(tmpdir.join('state.yml')), {
+            'version': '1.0',
+            'production': {'project': [{'id': 'production'}]},
+            'staging': {'project': [{'id': 'staging'}]},
+        })
+
+        assert migrate_branched_state(str(tmpdir)) == ['production', 'staging']
+        assert StateIndex(str(tmpdir)).stages == ['production', 'staging']
+        assert StageState(str(tmpdir), 'staging').contents == {
+            'version': '1.0', 'project': [{'id': 'staging'}],
+        }
+
+        assert not tmpdir.join('state.yml').exists()
+        assert tmpdir.join('state.yml.migrated').exists()
+
+    def it_migrates_once_when_operations_start_concurrently(tmpdir):
+        write_yaml(str(tmpdir.join('state.yml')), {
+            'production': {'project': [{'id': 'production'}]},
+            'staging': {'project': [{'id': 'staging'}]},
+        })
+
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            migrated = pool.map(migrate_branched_state, [str(tmpdir)] * 4)
+
+        assert sorted(migrated) == [[], [], [], ['production', 'staging']]
+        assert StateIndex(str(tmpdir)).stages == ['production', 'staging']
+
+    def it_migrates_only_once(tmpdir):
+        assert migrate_branched_state(str(tmpdir)) == []
+
+        write_yaml(str(tmpdir.join('state.yml')), {'production': {}})
+        StateIndex(str(tmpdir)).add('staging')
+
+        assert migrate_branched_state(str(tmpdir)) == []
+        assert tmpdir.join('state.yml').exists()
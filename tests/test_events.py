@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=E1101,C0111,W0612,R0915,R0201,R0903,W0106
+import time
+import multiprocessing
+import pytest
+from stackmate.events import EventChannel
+from stackmate.constants import EVENT_OUTPUT, EVENT_PLAY_COMPLETED
+
+
+def publish_play(queue, play, count):
+    for idx in range(count):
+        queue.put((EVENT_OUTPUT, '{}-{}'.format(play, idx)))
+
+    queue.put((EVENT_PLAY_COMPLETED, play))
+
+
+def describe_event_channel():
+    @pytest.fixture
+    def events():
+        return []
+
+    @pytest.fixture
+    def channel(events):
+        with EventChannel(sink=lambda kind, payload: events.append(payload), maxsize=5) as chan:
+            yield chan
+
+    def it_streams_the_events_of_the_workers_in_order(channel, events):
+        workers = [
+            multiprocessing.Process(target=publish_play, args=(channel.queue, play, 20))
+            for play in ('databases', 'caches')
+        ]
+
+        for worker in workers:
+            worker.start()
+
+        assert channel.wait('databases')
+        assert channel.wait('caches')
+
+        for worker in workers:
+            worker.join()
+
+        for play in ('databases', 'caches'):
+            assert [e for e in events if e.startswith(play)] == [
+                '{}-{}'.format(play, idx) for idx in range(20)
+            ]
+
+    def it_times_out_waiting_for_plays_that_have_not_completed(channel):
+        assert not channel.wait('databases', timeout=0.1)
+
+    def it_passes_on_the_remaining_events_when_closed(channel, events):
+        publish_play(channel.queue, 'databases', 3)
+        channel.close()
+
+        assert events == ['databases-0', 'databases-1', 'databases-2']
+
+    def it_keeps_passing_the_events_on_when_the_sink_fails(events):
+        def sink(_kind, payload):
+            if payload == 'databases-0':
+                raise ValueError(payload)
+            events.append(payload)
+
+        with EventChannel(sink=sink) as channel:
+            publish_play(channel.queue, 'databases', 2)
+            assert channel.wait('databases')
+
+        assert events == ['databases-1']
+
+    def it_skips_the_events_that_cannot_be_read(channel, events):
+        # a worker that got killed while publishing leaves a truncated event behind
+        channel.queue._sem.acquire()
+        channel.queue._writer.send_bytes(b'\x80\x04\x95')
+        publish_play(channel.queue, 'databases', 1)
+
+        assert channel.wait('databases')
+        assert events == ['databases-0']
+
+    def it_does_not_block_on_close_when_the_queue_is_broken(events):
+        channel = EventChannel(sink=lambda kind, payload: events.append(payload)).start()
+        # a worker that got killed while writing to the queue, never releases its lock
+        channel.queue._wlock.acquire()
+
+        started = time.monotonic()
+        channel.close(timeout=0.2)
+
+        assert time.monotonic() - started < 2
+        channel.queue._wlock.release()
@@ -2,9 +2,15 @@
 # pylint: disable=E1101,C0111,W0612,R0915
 import os
 from datetime import datetime
+import pytest
 from ansible.utils.unsafe_proxy import AnsibleUnsafeText
+import yaml
+from doubles import allow
+from stackmate import helpers
 from stackmate.helpers import read_yaml, write_yaml, get_project_name, \
-                              get_project_resource_suffix, list_chunks
+                              get_project_resource_suffix, list_chunks, write_atomically, \
+                              load_yaml, dump_yaml, YamlLoader, read_compiled_yaml, \
+                              get_cache_dir
 
 OUTPUT_PATH = '/tmp/somefile.yml'
 FILE_CONTENT = {
@@ -42,6 +48,83 @@ def describe_read_yaml():
         assert retrieved
         assert retrieved == FILE_CONTENT
 
+    def it_can_read_a_file_generated_with_the_fast_dumper():
+        assert write_yaml(OUTPUT_PATH, FILE_CONTENT, fast=True)
+        assert read_yaml(OUTPUT_PATH) == FILE_CONTENT
+
+    def it_uses_libyaml_when_available():
+        assert YamlLoader is (yaml.CFullLoader if yaml.__with_libyaml__ else yaml.FullLoader)
+        assert load_yaml('a:\n  - 1\n  - 2\n') == {'a': [1, 2]}
+
+    def it_indents_the_lists():
+        assert dump_yaml({'a': [1, 2]}) == '---\na:\n  - 1\n  - 2\n'
+        assert load_yaml(dump_yaml({'a': [1, 2]}, fast=True)) == {'a': [1, 2]}
+
+
+def describe_read_compiled_yaml():
+    def it_parses_the_file_once(tmpdir):
+        path = str(tmpdir.join('config.yml'))
+        cache_dir = str(tmpdir.join('cache'))
+        write_yaml(path, FILE_CONTENT)
+
+        assert read_compiled_yaml(path, cache_dir=cache_dir) == read_yaml(path)
+        assert len(os.listdir(cache_dir)) == 1
+
+        allow(helpers).load_yaml.and_raise(AssertionError('The file should not be parsed'))
+        assert read_compiled_yaml(path, cache_dir=cache_dir) == FILE_CONTENT
+
+    def it_parses_the_file_when_it_changes(tmpdir):
+        path = str(tmpdir.join('config.yml'))
+        cache_dir = str(tmpdir.join('cache'))
+
+        write_yaml(path, {'version': 1})
+        assert read_compiled_yaml(path, cache_dir=cache_dir) == {'version': 1}
+
+        write_yaml(path, {'version': 2})
+        assert read_compiled_yaml(path, cache_dir=cache_dir) == {'version': 2}
+
+    def it_reads_the_file_when_the_cache_is_not_writable(tmpdir):
+        path = str(tmpdir.join('config.yml'))
+        write_yaml(path, FILE_CONTENT)
+        tmpdir.join('cache').write('not a directory')
+
+        assert read_compiled_yaml(path, cache_dir=str(tmpdir.join('cache'))) == FILE_CONTENT
+
+    def it_uses_the_cache_directory_configured(tmpdir, monkeypatch):
+        monkeypatch.setenv('STACKMATE_CACHE_DIR', str(tmpdir))
+        assert get_cache_dir() == str(tmpdir)
+
+        monkeypatch.delenv('STACKMATE_CACHE_DIR')
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir))
+        assert get_cache_dir() == os.path.join(str(tmpdir), 'stackmate')
+
+
+def describe_write_atomically():
+    def it_replaces_the_file(tmpdir):
+        path = str(tmpdir.join('state.yml'))
+        write_atomically(path, 'first')
+        os.chmod(path, 0o640)
+
+        assert write_atomically(path, 'second') is True
+
+        with open(path) as file:
+            assert file.read() == 'second'
+
+        assert os.stat(path).st_mode & 0o777 == 0o640
+        assert os.listdir(str(tmpdir)) == ['state.yml']
+
+    def it_leaves_the_file_untouched_when_writing_fails(tmpdir):
+        path = str(tmpdir.join('state.yml'))
+        write_atomically(path, 'first')
+
+        with pytest.raises(TypeError):
+            write_atomically(path, {'not': 'a string'})
+
+        with open(path) as file:
+            assert file.read() == 'first'
+
+        assert os.listdir(str(tmpdir)) == ['state.yml']
+
 
 def describe_get_project_name():
     def it_returns_the_vpc_name_according_to_the_repository(project):
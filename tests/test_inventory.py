@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=E1101,C0111,W0612,R0915,R0201,R0903,W0106
+import pytest
+from ansible.parsing.dataloader import DataLoader
+from stackmate.ansible import InventoryManager
+from stackmate.inventory import InventoryIndex
+from stackmate.state import State
+
+
+def get_instances_entries(project, prefix='10.0'):
+    entries = []
+
+    for deployable in project.deployables_per_role.get('instances', []):
+        for resource in deployable.as_resources():
+            entry = dict(resource.serialize())
+            entry['output'] = {
+                'ip': None,
+                'nodes': [{
+                    'name': 'node-{}'.format(idx),
+                    'ip': '{}.0.{}'.format(prefix, idx),
+                    'private_ip': '172.16.0.{}'.format(idx),
+                } for idx in range(2)],
+            }
+            entries.append(entry)
+
+    return entries
+
+
+def describe_inventory_index():
+    @pytest.fixture
+    def empty_state(tmpdir):
+        return State(rootpath=str(tmpdir), stage='production')
+
+    @pytest.fixture
+    def inventory(project, empty_state):
+        empty_state.update('instances', get_instances_entries(project))
+        return InventoryIndex(project, empty_state)
+
+    def it_returns_the_hosts_per_group(inventory):
+        hosts = inventory.get()
+
+        assert set(hosts) == {'all', 'provisionables', 'application'}
+        assert set(hosts['application']) == {'10.0.0.0', '10.0.0.1'}
+        assert hosts['all'] == hosts['application'] == hosts['provisionables']
+
+    def it_returns_the_variables_of_the_hosts(inventory):
+        assert inventory.get()['application']['10.0.0.1'] == {
+            'node_name': 'node-1',
+            'private_ip': '172.16.0.1',
+            'node_group': 'application',
+        }
+
+    def it_indexes_the_roles_that_changed(inventory, project, empty_state):
+        hosts = inventory.get()
+
+        inventory.update('databases')
+        assert inventory.get() is hosts
+
+        empty_state.update('instances', get_instances_entries(project, prefix='10.1'))
+        inventory.update('instances')
+
+        assert inventory.get() is not hosts
+        assert set(inventory.get()['application']) == {'10.1.0.0', '10.1.0.1'}
+        assert set(hosts['application']) == {'10.0.0.0', '10.0.0.1'}
+
+    def it_is_set_in_the_ansible_inventory(inventory):
+        manager = InventoryManager(loader=DataLoader()).set_inventory(inventory.get())
+        host = manager.get_host('10.0.0.1')
+
+        assert {g.name for g in host.get_groups()} >= {'application', 'provisionables'}
+        assert host.vars['private_ip'] == '172.16.0.1'
+        assert host.vars['node_name'] == 'node-1'
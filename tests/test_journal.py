@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=E1101,C0111,W0612,R0915,R0201,R0903,W0106
+import os
+import pytest
+from doubles import InstanceDouble
+from stackmate.base import AttributeDict
+from stackmate.journal import PlayJournal, StateJournal
+
+
+def describe_play_journal():
+    @pytest.fixture
+    def journal(tmpdir):
+        return PlayJournal(rootpath=str(tmpdir), stage='production')
+
+    @pytest.fixture
+    def play():
+        return InstanceDouble('stackmate.playbooks.Play', rolename='databases', playname='Databases')
+
+    def it_is_stored_next_to_the_state(journal, tmpdir):
+        assert journal.path == os.path.join(str(tmpdir), 'plays.production.journal')
+
+    def it_records_the_completed_plays(journal, play):
+        facts = [{'role': 'databases', 'resources': [{'id': 'db'}]}]
+        journal.record('abc', play, facts)
+
+        assert journal.get_facts('abc') == facts
+        assert journal.get_facts('def') is None
+        assert PlayJournal(rootpath=journal.rootpath, stage='production').get_facts('abc') == facts
+
+    def it_skips_incomplete_entries(journal, play):
+        journal.record('abc', play, [])
+
+        with open(journal.path, 'a') as journalfile:
+            journalfile.write('{"fingerprint": "de')
+
+        assert list(PlayJournal(rootpath=journal.rootpath, stage='production').entries) == ['abc']
+
+    def it_is_cleared(journal, play):
+        journal.record('abc', play, [])
+        journal.clear()
+
+        assert not os.path.isfile(journal.path)
+        assert journal.get_facts('abc') is None
+
+
+def describe_state_journal():
+    @pytest.fixture
+    def journal(tmpdir):
+        return StateJournal(rootpath=str(tmpdir), stage='production')
+
+    def it_is_stored_next_to_the_state(journal, tmpdir):
+        assert journal.path == os.path.join(str(tmpdir), 'state.production.journal')
+
+    def it_replays_the_changes_in_order(journal):
+        journal.record('databases', [{'id': 'db'}])
+        journal.record('applications', [{'id': 'app'}])
+        journal.record('databases', [{'id': 'db', 'touched': True}])
+
+        with open(journal.path, 'a') as journalfile:
+            journalfile.write('{"role": "data')
+
+        contents = journal.replay(AttributeDict({'project': [{'id': 'project'}]}))
+
+        assert contents == {
+            'project': [{'id': 'project'}],
+            'databases': [{'id': 'db', 'touched': True}],
+            'applications': [{'id': 'app'}],
+        }
+
+    def it_records_many_changes_at_once(journal):
+        journal.record_many({'databases': [{'id': 'db'}], 'applications': [{'id': 'app'}]})
+
+        assert journal.read_lines() == [
+            {'role': 'databases', 'resources': [{'id': 'db'}]},
+            {'role': 'applications', 'resources': [{'id': 'app'}]},
+        ]
+
+    def it_is_cleared(journal):
+        journal.record('databases', [])
+        assert journal.exists
+
+        journal.clear()
+        assert not journal.exists
+        assert journal.replay(AttributeDict()) == {}
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=E1101,C0111,W0612,R0915,R0201,R0903,W0106
+import os
+import json
+import threading
+import pytest
+from stackmate.locks import StateLock, pid_exists
+from stackmate.exceptions import StateLockedError
+
+
+def describe_state_lock():
+    @pytest.fixture
+    def rootpath(tmpdir):
+        return str(tmpdir)
+
+    def it_is_stored_in_the_state_directory(rootpath):
+        lock = StateLock(rootpath=rootpath, stage='production')
+        assert lock.path == os.path.join(rootpath, 'state', 'production.lock')
+
+    def it_locks_the_state_of_the_whole_project_without_a_stage(rootpath):
+        lock = StateLock(rootpath=rootpath)
+        assert lock.path == os.path.join(rootpath, 'state', 'index.lock')
+
+    def it_records_the_holder(rootpath):
+        with StateLock(rootpath=rootpath, stage='production') as lock:
+            assert lock.locked
+            assert lock.holder()['pid'] == os.getpid()
+            assert lock.metrics['attempts'] == 1
+
+        assert not lock.locked
+
+    def it_times_out_when_the_stage_is_locked(rootpath):
+        with StateLock(rootpath=rootpath, stage='production'):
+            lock = StateLock(rootpath=rootpath, stage='production', timeout=0.2)
+
+            with pytest.raises(StateLockedError):
+                lock.acquire()
+
+            assert lock.metrics['waited'] >= 0.2
+            assert not lock.locked
+
+    def it_does_not_lock_other_stages(rootpath):
+        with StateLock(rootpath=rootpath, stage='production'):
+            with StateLock(rootpath=rootpath, stage='staging', timeout=0) as lock:
+                assert lock.locked
+
+    def it_waits_for_the_lock_to_be_released(rootpath):
+        holder = StateLock(rootpath=rootpath, stage='production').acquire()
+        threading.Timer(0.3, holder.release).start()
+
+        with StateLock(rootpath=rootpath, stage='production', timeout=5) as lock:
+            assert lock.metrics['waited'] >= 0.2
+            assert lock.metrics['attempts'] > 1
+
+    def it_breaks_abandoned_locks(rootpath):
+        holder = StateLock(rootpath=rootpath, stage='production').acquire()
+        details = dict(holder.holder(), pid=2 ** 22 + 1)
+
+        # the process that acquired the lock has died, its children are still holding it
+        with open(holder.path, 'w') as lockfile:
+            lockfile.write(json.dumps(details))
+
+        with StateLock(rootpath=rootpath, stage='production', timeout=1) as lock:
+            assert lock.metrics['broken']
+            assert lock.holder()['pid'] == os.getpid()
+
+        holder.release()
+
+    def it_breaks_locks_that_are_held_for_too_long(rootpath):
+        holder = StateLock(rootpath=rootpath, stage='production').acquire()
+
+        with StateLock(rootpath=rootpath, stage='production', timeout=1, stale_after=0) as lock:
+            assert lock.metrics['broken']
+
+        holder.release()
+
+
+def describe_pid_exists():
+    def it_checks_whether_a_process_is_running():
+        assert pid_exists(os.getpid())
+        assert not pid_exists(2 ** 22 + 1)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=E1101,C0111,W0612,R0915
+import os
+import sys
+import subprocess
+from click.testing import CliRunner
+from stackmate.__main__ import cli
+from stackmate.locks import StateLock
+from stackmate.helpers import write_yaml
+from stackmate.exceptions import StateLockedError
+
+
+def describe_cli():
+    def it_does_not_import_ansible_on_start_up():
+        # a new interpreter, since the tests themselves have already imported ansible
+        output = subprocess.check_output([sys.executable, '-c', (
+            'import sys, stackmate.__main__; '
+            'print(sorted({m.split(".")[0] for m in sys.modules} & {"ansible", "jinja2"}))'
+        )])
+
+        assert output.decode().strip() == '[]'
+
+    def it_does_not_compact_the_state_while_the_stage_is_locked(tmpdir):
+        os.makedirs(str(tmpdir.join('state')))
+        write_yaml(str(tmpdir.join('state', 'production.yml')), {'project': []})
+        args = ['--stage', 'production', '--path', str(tmpdir), 'state', '--compact']
+
+        with StateLock(rootpath=str(tmpdir), stage='production'):
+            result = CliRunner().invoke(cli, args)
+
+        assert isinstance(result.exception, StateLockedError)
+        assert CliRunner().invoke(cli, args).exit_code == 0
@@ -1,8 +1,13 @@
 """Provides tests for operations"""
 # -*- coding: utf-8 -*-
 # pylint: disable=E1101,C0111,W0612,R0915
-from stackmate.operations import DeploymentOperation, RollbackOperation
+import os
+import shutil
+import pytest
+from stackmate.operations import DeploymentOperation, RollbackOperation, PlanOperation
 from stackmate.playbooks import PlaybookIterator
+from stackmate.locks import StateLock
+from stackmate.exceptions import StateLockedError
 
 
 def describe_deployment_operation():
@@ -93,3 +98,45 @@ def describe_rollback_operation():
         iterator = operation.iterator
         assert isinstance(iterator, PlaybookIterator)
         assert iterator.operation == 'rollback'
+
+
+def describe_plan_operation():
+    def get_plan_attrs(stage, tmpdir):
+        # planning locks the stage, keep the lock file out of the test data
+        path = str(tmpdir.join('project'))
+        shutil.copytree(os.path.join('tests', 'data', 'rails-fully-deployed'), path)
+
+        return {
+            'operation_id': '123',
+            'operation_url': 'https://stackmate.io/operations/123',
+            'path': path,
+            'stage': stage,
+            'plan_file': str(tmpdir.join('plan.json')),
+        }
+
+    def it_writes_out_the_plan(stage, tmpdir):
+        operation = PlanOperation(**get_plan_attrs(stage, tmpdir))
+        plan = operation.run()
+
+        assert os.path.isfile(operation.plan_path)
+        assert plan['operation'] == 'deployment'
+
+    def it_refuses_to_plan_while_the_stage_is_locked(stage, tmpdir):
+        attrs = get_plan_attrs(stage, tmpdir)
+
+        with StateLock(rootpath=attrs['path'], stage=stage):
+            with pytest.raises(StateLockedError):
+                PlanOperation(**attrs).run()
+
+        assert not os.path.isfile(attrs['plan_file'])
+
+    def it_deploys_the_plan(stage, tmpdir):
+        attrs = get_plan_attrs(stage, tmpdir)
+        PlanOperation(**attrs).run()
+
+        operation = DeploymentOperation(
+            operation_id='123', operation_url=attrs['operation_url'], path=attrs['path'],
+            stage=stage, commit_reference='abc12345', commit_author='John Doe',
+            commit_message='Commit message', plan=attrs['plan_file'])
+
+        assert operation.iterator.plan['stage'] == stage
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=E1101,C0111,W0612,R0915,R0201,R0903,W0106
+import os
+import json
+import pytest
+from doubles import allow
+from stackmate.project import Project
+from stackmate.state import State
+from stackmate.playbooks import PlaybookIterator
+from stackmate.planner import Planner, to_json
+from stackmate.exceptions import InvalidPlanError
+
+
+def get_plays_per_role(iterator):
+    plays = {}
+    updated_roles = set()
+
+    for playbook in iter(iterator):
+        pbplays, updated_roles = playbook.get_plays(updated_roles)
+
+        for play in pbplays:
+            plays.setdefault(play.rolename, []).append(play.tasks)
+
+    return plays
+
+
+def describe_planner():
+    @pytest.fixture
+    def get_iterator():
+        def iterator_factory(plan=None):
+            directory = os.path.abspath(os.path.join('tests', 'data', 'rails-fully-deployed'))
+            project = Project.load(rootpath=directory, stage='production')
+            state = State(rootpath=directory, stage='production')
+            allow(state).save.and_return(True)
+            return PlaybookIterator('deployment', project, state, plan=plan)
+
+        return iterator_factory
+
+    @pytest.fixture
+    def plan(get_iterator):
+        return Planner(get_iterator()).compute()
+
+    def it_computes_the_changes_for_every_step(plan, get_iterator):
+        assert plan['operation'] == 'deployment'
+        assert plan['stage'] == 'production'
+        assert len(plan['steps']) == len(get_iterator().steps)
+        assert plan['steps'][0]['roles']['prepare']['provisions']
+
+    def it_summarizes_the_changes(plan):
+        summary = Planner.summary(plan)
+        assert summary['instances'] == {'provisions': 1, 'modifications': 0, 'terminations': 0}
+
+    def it_writes_and_loads_the_plan(plan, get_iterator, tmpdir):
+        path = Planner.write(plan, Planner.get_path(str(tmpdir), 'production'))
+
+        assert path.endswith('plan.production.json')
+        assert Planner.load(path, get_iterator()) == json.loads(json.dumps(plan, default=to_json))
+
+    def it_refuses_plans_of_a_previous_version(plan, get_iterator, tmpdir):
+        plan['version'] = 1
+        path = Planner.write(plan, str(tmpdir.join('plan.json')))
+
+        with pytest.raises(InvalidPlanError, match='version 1 of the plan format'):
+            Planner.load(path, get_iterator())
+
+    def it_refuses_plans_computed_against_a_different_state(plan, get_iterator, tmpdir):
+        plan['state'] = 'outdated'
+        path = Planner.write(plan, str(tmpdir.join('plan.json')))
+
+        with pytest.raises(InvalidPlanError):
+            Planner.load(path, get_iterator())
+
+    def it_keeps_only_the_resources_to_be_changed(plan):
+        instances = plan['steps'][1]['roles']['instances']
+        assert instances == {
+            'provisions': [('service-application-rails-app-server', 'rails-app-server-1')],
+            'modifications': [],
+            'terminations': [],
+        }
+
+    def it_runs_the_planned_changes(plan, get_iterator, tmpdir):
+        expected = get_plays_per_role(get_iterator())
+        path = Planner.write(plan, str(tmpdir.join('plan.json')))
+        iterator = get_iterator()
+        iterator.plan = Planner.load(path, iterator)
+
+        assert json.loads(json.dumps(get_plays_per_role(iterator), default=to_json)) == \
+            json.loads(json.dumps(expected, default=to_json))
+
+    def it_computes_the_provision_params_after_the_roles_that_run_before(plan, get_iterator):
+        iterator = get_iterator(plan=json.loads(json.dumps(plan, default=to_json)))
+        updated_roles = set()
+        routing_plays = []
+
+        for playbook in iter(iterator):
+            plays, updated_roles = playbook.get_plays(updated_roles)
+            routing_plays += [play for play in plays if play.rolename == 'routing']
+
+            # the instances are provisioned by the time the routing gets deployed
+            for play in plays:
+                if play.rolename == 'instances':
+                    [provision] = play.tasks[0]['vars']['provisions']
+                    iterator.state.update('instances', [
+                        dict(provision, output={'nodes': [{'resource_id': 'i-provisioned'}]})])
+
+        [routing] = routing_plays[0].tasks[0]['vars']['provisions']
+        assert routing['provision_params']['target_instances'] == ['i-provisioned']
+
+    def it_refuses_planned_changes_that_no_longer_apply(plan, get_iterator):
+        plan['steps'][1]['roles']['instances']['provisions'] = [['service-unknown', None]]
+        iterator = get_iterator(plan=plan)
+        updated_roles = set()
+
+        with pytest.raises(InvalidPlanError):
+            for playbook in iter(iterator):
+                _plays, updated_roles = playbook.get_plays(updated_roles)
@@ -12,7 +12,7 @@ from stackmate.constants import LOCALHOST, CONNECTION_LOCAL, CONNECTION_SSH, \
 
 from stackmate.state import State
 from stackmate.provisioner import Provisioner
-from stackmate.playbooks import PlaybookIterator, Playbook, Play, OPERATIONS
+from stackmate.playbooks import PlaybookIterator, Playbook, Play, ProjectVars, OPERATIONS
 
 def get_playbook_iterator(dirname, stage='production', operation='deployment'):
     """Returns a playbook iterator from a given directory"""
@@ -131,6 +131,18 @@ def describe_play():
         assert not instances_play.gather_facts
         assert nginx_play.gather_facts
 
+    def it_returns_the_number_of_hosts_it_targets(instances_play, nginx_play):
+        inventory = {'all': {'10.0.0.1': {}, '10.0.0.2': {}}, 'provisionables': {}}
+        assert instances_play.host_count(inventory) == 1
+        assert nginx_play.host_count(inventory) == 2
+        assert nginx_play.host_count({}) == 1
+
+    def it_gathers_a_subset_of_the_facts(project, state, nginx_role):
+        assert 'gather_subset' not in get_play(project, state, nginx_role).get_source()
+
+        play = get_play(project, state, dict(nginx_role, gather_subset=['!all', 'min']))
+        assert play.get_source()['gather_subset'] == ['!all', 'min']
+
     def it_forces_local_plays(project, state, nginx_role):
         play = get_play(project, state, nginx_role, {'force_local': True})
         assert play.is_local()
@@ -138,6 +150,31 @@ def describe_play():
     def it_returns_the_variables(instances_play, global_vars):
         assert instances_play.get_variables() == global_vars
 
+    def it_is_described_without_the_shared_variables(instances_role):
+        shared_vars = {'stage': 'production', 'private_key': 'key'}
+        play = Play(instances_role, {'has_changes': True}, global_vars=shared_vars, forks=2)
+
+        descriptor = play.get_descriptor(shared_vars)
+        assert descriptor.variables == {}
+
+        described = descriptor.get_play(shared_vars)
+        assert described.get_variables() == shared_vars
+        assert described.get_source() == play.get_source()
+        assert described.forks == 2
+
+    def it_describes_the_variables_that_differ(instances_role):
+        shared_vars = {'stage': 'production', 'private_key': 'key'}
+        play = Play(instances_role, {}, global_vars=dict(shared_vars, vpc_id='vpc'))
+
+        descriptor = play.get_descriptor(shared_vars)
+        assert descriptor.variables == {'vpc_id': 'vpc'}
+        assert descriptor.get_play(shared_vars).get_variables() == dict(shared_vars, vpc_id='vpc')
+
+        # the play doesn't have all the shared variables, it carries its own
+        play = Play(instances_role, {}, global_vars={'stage': 'staging'})
+        descriptor = play.get_descriptor(shared_vars)
+        assert descriptor.get_play(shared_vars).get_variables() == {'stage': 'staging'}
+
     def it_returns_the_correct_tasks(instances_play, nginx_play):
         instance_tasks = instances_play.tasks
         assert len(instance_tasks) == 1
@@ -172,6 +209,36 @@ def describe_play():
         assert source['tasks'][0]['args'] == {'name': 'instances'}
 
 
+def describe_project_vars():
+    @pytest.fixture
+    def empty_state(tmpdir):
+        return State(rootpath=str(tmpdir), stage='production')
+
+    def it_shares_the_variables(project, empty_state):
+        project_vars = ProjectVars(project, empty_state, {'extravar1': 140})
+        variables = project_vars.get()
+
+        assert variables['stage'] == 'production'
+        assert variables['extravar1'] == 140
+        assert project_vars.get() is variables
+
+    def it_refreshes_the_output_of_the_prerequisites(project, empty_state):
+        project_vars = ProjectVars(project, empty_state)
+        variables = project_vars.get()
+
+        empty_state.update('prerequisites', [{'id': 'prerequisites', 'output': {'vpc_id': 'vpc'}}])
+
+        refreshed = project_vars.get()
+        assert refreshed is not variables
+        assert refreshed['vpc_id'] == 'vpc'
+        assert 'vpc_id' not in variables
+        assert project_vars.get() is refreshed
+
+    def it_is_shared_by_the_playbooks_of_an_operation(project, empty_state):
+        iterator = PlaybookIterator('deployment', project, empty_state)
+        assert all(playbook.project_vars is iterator.project_vars for playbook in iterator)
+
+
 def describe_playbook():
     @pytest.fixture
     def prep_config():
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=E1101,C0111,W0612,R0915,R0201,R0903,W0106
+import os
+import time
+import signal
+import multiprocessing
+import pytest
+from stackmate.pool import WorkerPool, ForkBudget, terminate_worker, stop_timed_out_play
+from stackmate.exceptions import DeploymentTimeoutError
+
+INITIALIZED = []
+
+
+def mark_initialized():
+    INITIALIZED.append(os.getpid())
+
+
+def initialized_in_worker():
+    return (os.getpid(), list(INITIALIZED))
+
+
+def install_termination_handler():
+    signal.signal(signal.SIGTERM, terminate_worker)
+
+
+def install_timeout_handler():
+    signal.signal(signal.SIGALRM, stop_timed_out_play)
+
+
+def hang_with_a_child(timeout):
+    child = multiprocessing.Process(target=time.sleep, args=(60,))
+    child.start()
+
+    try:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        time.sleep(60)
+    except DeploymentTimeoutError:
+        time.sleep(0.5)
+        return (child.pid, os.getpid())
+
+
+def spawn_child():
+    child = multiprocessing.Process(target=time.sleep, args=(60,))
+    child.start()
+    return child.pid
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+
+    # zombie processes are not alive either
+    with open('/proc/{}/stat'.format(pid)) as stat:
+        return stat.read().split()[2] != 'Z'
+
+
+def describe_worker_pool():
+    @pytest.fixture
+    def pool():
+        worker_pool = WorkerPool(max_workers=2, initializer=mark_initialized)
+        yield worker_pool
+        worker_pool.shutdown()
+
+    def it_validates_the_start_method():
+        with pytest.raises(ValueError):
+            WorkerPool(start_method='spawn')
+
+    def it_starts_lazily(pool):
+        assert not pool.started
+        pool.submit(os.getpid).result()
+        assert pool.started
+
+    def it_initializes_every_worker_once(pool):
+        pool.start()
+        results = [pool.submit(initialized_in_worker).result() for _ in range(10)]
+
+        for pid, initialized in results:
+            assert initialized == [pid]
+
+        assert len({pid for pid, _ in results}) <= 2
+
+    def it_shuts_down(pool):
+        pool.start()
+        pool.shutdown()
+        assert not pool.started
+
+    def it_terminates_the_workers_along_with_their_children():
+        pool = WorkerPool(max_workers=1, initializer=install_termination_handler)
+        child_pid = pool.submit(spawn_child).result()
+        assert is_alive(child_pid)
+
+        pool.terminate()
+        time.sleep(0.5)
+
+        assert not pool.started
+        assert not is_alive(child_pid)
+
+    def it_stops_the_plays_that_run_out_of_time_in_the_worker():
+        with WorkerPool(max_workers=1, initializer=install_timeout_handler) as pool:
+            started = time.monotonic()
+            child_pid, worker_pid = pool.submit(hang_with_a_child, 0.2).result()
+
+            assert time.monotonic() - started < 5
+            assert not is_alive(child_pid)
+            # the worker is still there, for the next plays
+            assert pool.submit(os.getpid).result() == worker_pid
+
+    def it_supports_the_forkserver_start_method():
+        with WorkerPool(max_workers=1, start_method='forkserver') as pool:
+            assert pool.submit(os.getpid).result() != os.getpid()
+
+
+def describe_fork_budget():
+    def it_validates_the_budget():
+        with pytest.raises(ValueError):
+            ForkBudget(total=-1)
+
+    def it_splits_the_forks_in_proportion_to_the_hosts():
+        budget = ForkBudget(total=10)
+        grants = budget.allocate({'web': 30, 'db': 10})
+
+        assert grants == {'web': 7, 'db': 2}
+        assert budget.in_use == 9
+        assert budget.available == 1
+
+    def it_never_grants_more_forks_than_hosts():
+        budget = ForkBudget(total=100)
+        assert budget.allocate({'local': 1, 'web': 4}) == {'local': 1, 'web': 4}
+
+    def it_makes_plays_wait_when_the_budget_is_exhausted():
+        budget = ForkBudget(total=2)
+        assert budget.allocate({'first': 2}) == {'first': 2}
+        assert budget.allocate({'second': 1}) == {'second': 0}
+
+        budget.release('first')
+        assert budget.allocate({'second': 1}) == {'second': 1}
+
+    def it_reports_the_utilisation():
+        budget = ForkBudget(total=4)
+        budget.allocate({'first': 2, 'second': 2})
+        budget.release('second')
+
+        assert budget.utilisation == {
+            'total': 4, 'in_use': 2, 'available': 2, 'peak': 4, 'plays': 1, 'ratio': 0.5,
+        }
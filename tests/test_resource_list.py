@@ -167,3 +167,39 @@ def describe_provision_resources():
         changes = resource_list.serialize()
         assert changes['terminations']
         assert len(changes['terminations']) == 1
+
+    def it_looks_up_the_resources_by_id():
+        resource_list = ResourceList([
+            {'id': 'first', 'group': {}, 'created_at': '2020-02-07 17:26:57.000001'},
+            {'id': 'second', 'group': {}, 'created_at': '2020-02-07 17:26:57.000002'},
+        ])
+        other = ResourceList([{'id': 'third', 'group': {}}])
+
+        assert resource_list['second'].id == 'second'
+        assert resource_list.find_by_id('third') is None
+        assert Resource(id='first', group={}) in resource_list
+
+        resource_list += other
+        assert resource_list.find_by_id('third') is other.all[0]
+        assert len(resource_list) == 3
+
+    def it_keeps_the_index_up_to_date_when_provisioning(mysql_service):
+        resource_list = ResourceList()
+        assert not resource_list.exists(mysql_service)
+
+        resource_list.provision(mysql_service)
+        assert resource_list.exists(mysql_service)
+        assert len(resource_list.find(mysql_service)) == 1
+
+    def it_returns_the_resources_left_unchanged_in_a_single_pass():
+        resource_list = ResourceList([
+            {'id': 'first', 'group': {}, 'created_at': '2020-02-07 17:26:57.000001'},
+            {'id': 'second', 'group': {}, 'created_at': '2020-02-07 17:26:57.000002'},
+            {'id': 'third', 'group': {}, 'created_at': '2020-02-07 17:26:57.000003'},
+        ])
+        [third, second, first] = resource_list.all
+
+        resource_list.remove(second)
+
+        assert resource_list.unchanged() == [third, first]
+        assert [r['id'] for r in resource_list.serialize()['unchanged']] == ['third', 'first']
@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=E1101,C0111,W0612,R0915,R0201,R0903,W0106
+import os
+import time
+import signal
+import multiprocessing
 import pytest
 from doubles import allow
-from stackmate.runner import Runner
+from ansible import constants as C
+from ansible.errors import AnsibleError
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.loader import cache_loader
+from stackmate import runner as runner_module
+from stackmate.runner import Runner, init_fact_cache, dump_output
+from stackmate.pool import terminate_worker
+from stackmate.ansible import VariableManager
 from stackmate.project import Project
 from stackmate.state import State
 from stackmate.playbooks import PlaybookIterator
+from stackmate.journal import PlayJournal, StateJournal
 from stackmate.exceptions import DeploymentFailedError
 
 
@@ -25,6 +37,100 @@ def mock_runner_failing_databases(play, _inventory, _output_logger):
     return [{'role': play.rolename, 'resources': []}]
 
 
+def mock_runner_failing_databases_slow_caches(play, _inventory, _output_logger):
+    if play.rolename == 'databases':
+        raise DeploymentFailedError
+    if play.rolename == 'caches':
+        time.sleep(30)
+    return [{'role': play.rolename, 'resources': []}]
+
+
+def mock_runner_failing_databases_killed_while_publishing(play, inventory, output_logger):
+    dump_output(play, inventory, output_logger)
+
+    if play.rolename == 'databases':
+        raise DeploymentFailedError
+    if play.rolename == 'caches':
+        # the worker gets killed while holding the lock of the event queue
+        def kill_while_publishing(signum, frame):
+            runner_module._EVENTS._wlock.acquire()
+            terminate_worker(signum, frame)
+
+        signal.signal(signal.SIGTERM, kill_while_publishing)
+        time.sleep(30)
+    return [{'role': play.rolename, 'resources': []}]
+
+
+def mock_runner_hanging_caches(play, _inventory, _output_logger):
+    if play.rolename == 'caches':
+        time.sleep(30)
+    return [{'role': play.rolename, 'resources': []}]
+
+
+def get_cached_facts(path):
+    init_fact_cache(path)
+
+    VariableManager(loader=DataLoader()).set_host_facts('10.0.0.1', {'ansible_os_family': 'Debian'})
+    return VariableManager(loader=DataLoader())._fact_cache.get('10.0.0.1')
+
+
+def access_cached_facts(path, writes):
+    init_fact_cache(path)
+    facts = {'ansible_os_family': 'Debian', 'ansible_packages': ['package'] * 20000}
+    corrupted = 0
+
+    for _ in range(100):
+        # a new plugin every time, so that the facts are read from the file rather than memory
+        plugin = cache_loader.get(C.CACHE_PLUGIN)
+
+        if writes:
+            plugin.set('10.0.0.1', facts)
+            continue
+
+        try:
+            corrupted += int(plugin.get('10.0.0.1') != facts)
+        except AnsibleError:
+            corrupted += 1
+
+    return corrupted
+
+
+def mock_runner_fact_cache(play, _inventory, _output_logger):
+    from ansible import constants as C # pylint: disable=import-outside-toplevel
+    return [{'role': play.rolename, 'resources': [{'cache': C.CACHE_PLUGIN_CONNECTION}]}]
+
+
+def mock_runner_slow_caches_reading_journal(play, _inventory, _output_logger):
+    resources = []
+
+    # the plays that completed meanwhile should have been recorded in the state journal
+    if play.rolename == 'caches':
+        time.sleep(2)
+        journal = StateJournal(rootpath=os.environ['STATE_ROOTPATH'], stage='production')
+        resources = [{'id': 'caches', 'journaled': [e['role'] for e in journal.read_lines()]}]
+
+    return [{'role': play.rolename, 'resources': resources}]
+
+
+def describe_fact_cache():
+    def it_shares_the_facts_of_the_hosts(tmpdir):
+        # in a worker, the ansible configuration of the tests is left intact
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            facts = pool.apply(get_cached_facts, (str(tmpdir),))
+
+        assert facts == {'ansible_os_family': 'Debian'}
+        assert os.listdir(str(tmpdir)) == ['10.0.0.1']
+
+    def it_never_reads_the_facts_while_they_are_written(tmpdir):
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            pool.apply(access_cached_facts, (str(tmpdir), True))
+            corrupted = pool.starmap(access_cached_facts, [
+                (str(tmpdir), writes) for writes in (True, True, False, False)])
+
+        assert corrupted == [0, 0, 0, 0]
+        assert os.listdir(str(tmpdir)) == ['10.0.0.1']
+
+
 def describe_runner():
     @pytest.fixture
     def iterator(project_path, stage):
@@ -41,6 +147,38 @@ def describe_runner():
         runner = Runner(iterator)
         runner.dump()
 
+    def it_caches_the_facts_for_the_operation(iterator):
+        facts = []
+        runner = Runner(iterator)
+        allow(runner.iterator).apply_state_changes.and_return_result_of(facts.extend)
+
+        runner.run(process_func=mock_runner_fact_cache, commit_state=False)
+
+        caches = {fact['resources'][0]['cache'] for fact in facts}
+        assert len(caches) == 1
+        assert os.path.basename(caches.pop()).startswith('stackmate-facts-')
+        assert runner.fact_cache is None
+
+    def it_writes_the_batched_state_changes_while_plays_are_running(project_path, stage, \
+            tmpdir, monkeypatch):
+        monkeypatch.setenv('STATE_ROOTPATH', str(tmpdir))
+        state = State(rootpath=str(tmpdir), stage=stage, save_interval=0.5)
+        iterator = PlaybookIterator('deployment', Project.load(project_path, stage), state)
+
+        Runner(iterator, max_workers=4).run(process_func=mock_runner_slow_caches_reading_journal)
+
+        # databases completes right after the step starts, its save is batched
+        assert 'databases' in state.contents['caches'][0]['journaled']
+
+    def it_writes_the_output_of_the_workers(iterator):
+        runner = Runner(iterator)
+        runner.dump()
+
+        statuses = [result['status'] for result in runner.output_logger.results]
+        assert statuses[0] == 'started'
+        assert statuses[-1] == 'success'
+        assert statuses.count('print') == len(statuses) - 2 > 0
+
     def it_runs_the_playbook(runner):
         # plays, inventories, mock_runner = get_mock_runner_components()
 
@@ -95,3 +233,82 @@ def describe_runner():
             'essentials', 'caches', 'mailer', 'cdn',
             'elasticstorage', 'volumes',
         }
+
+    def it_reports_the_critical_path(runner):
+        runner.run(process_func=mock_runner, commit_state=False)
+
+        [success] = [r for r in runner.output_logger.results if r.get('status') == 'success']
+        path = [entry['role'] for entry in success['critical_path']]
+
+        assert path[0] == 'prepare'
+        assert path[-1] == 'notifications'
+
+    def it_cancels_the_running_plays_when_failing_fast(iterator):
+        runner = Runner(iterator, max_workers=4, fail_fast=True)
+        started = time.monotonic()
+        runner.run(process_func=mock_runner_failing_databases_slow_caches, commit_state=False)
+        provisioned = set(runner.iterator.state.contents.keys())
+
+        assert time.monotonic() - started < 20
+        assert 'caches' not in provisioned
+        assert 'databases' not in provisioned
+        assert 'nginx' not in provisioned
+        assert [r for r in runner.output_logger.results if r.get('status') == 'cancelled']
+
+    def it_streams_the_events_over_a_new_channel_once_the_workers_are_killed(iterator):
+        runner = Runner(iterator, max_workers=4, fail_fast=True)
+        started = time.monotonic()
+        runner.run(
+            process_func=mock_runner_failing_databases_killed_while_publishing,
+            commit_state=False)
+
+        results = runner.output_logger.results
+        statuses = [r['status'] for r in results]
+        cancelled = statuses.index('cancelled')
+
+        assert time.monotonic() - started < 30
+        # the failure play runs on the restarted workers, its output is still written
+        assert 'print' in statuses[cancelled:]
+        assert statuses[-1] == 'failure'
+
+    def it_fails_plays_that_time_out(iterator):
+        runner = Runner(iterator, max_workers=4, play_timeout=2)
+        started = time.monotonic()
+        runner.run(process_func=mock_runner_hanging_caches, commit_state=False)
+        provisioned = set(runner.iterator.state.contents.keys())
+
+        assert time.monotonic() - started < 20
+        assert 'caches' not in provisioned
+        assert 'databases' in provisioned
+        assert 'nginx' not in provisioned
+        assert [r for r in runner.output_logger.results if r.get('status') == 'timeout']
+        assert runner.output_logger.results[-1]['status'] == 'failure'
+
+    def it_frees_the_workers_of_the_plays_that_time_out(iterator):
+        # a single worker, the plays after the one that hangs need it to be stopped
+        runner = Runner(iterator, max_workers=1, play_timeout=2)
+        started = time.monotonic()
+        runner.run(process_func=mock_runner_hanging_caches, commit_state=False)
+        provisioned = set(runner.iterator.state.contents.keys())
+
+        assert time.monotonic() - started < 20
+        assert 'caches' not in provisioned
+        assert {'databases', 'mailer'} <= provisioned
+        assert [r['name'] for r in runner.output_logger.results if r.get('status') == 'timeout']
+        assert runner.output_logger.results[-1]['status'] == 'failure'
+
+    def it_resumes_from_the_plays_that_have_not_completed(iterator, tmpdir):
+        journal = PlayJournal(rootpath=str(tmpdir), stage='production')
+        runner = Runner(iterator, journal=journal)
+        runner.run(process_func=mock_runner_failing_nginx, commit_state=False)
+        assert 'prerequisites' in {e['role'] for e in journal.read().values()}
+
+        runner = Runner(iterator, journal=journal, resume=True)
+        runner.run(process_func=mock_runner, commit_state=False)
+        results = runner.output_logger.results
+        resumed = [r for r in results if r.get('status') == 'resumed']
+
+        assert len(resumed) == 11
+        assert results[-1]['status'] == 'success'
+        assert 'nginx' in runner.iterator.state.contents
+        assert not os.path.isfile(journal.path)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=E1101,C0111,W0612,R0915,R0201,R0903,W0106
+import pytest
+from stackmate.scheduler import PlayGraph, get_role_dependencies
+
+STEPS = [
+    {
+        'name': 'Prerequisites',
+        'parallel': False,
+        'roles': [
+            {'name': 'prepare', 'hosts': 'localhost'},
+            {'name': 'prerequisites', 'hosts': 'localhost'},
+        ],
+    },
+    {
+        'name': 'Core',
+        'parallel': True,
+        'roles': [
+            {'name': 'ssl', 'hosts': 'localhost'},
+            {'name': 'instances', 'hosts': 'localhost'},
+        ],
+    },
+    {
+        'name': 'Targets',
+        'parallel': True,
+        'roles': [
+            {'name': 'cdn', 'hosts': 'localhost'},
+            {'name': 'databases', 'hosts': 'all'},
+        ],
+    },
+    {
+        'name': 'Config',
+        'parallel': True,
+        'roles': [
+            {'name': 'configfiles', 'hosts': 'all'},
+        ],
+    },
+    {
+        'name': 'Notifications',
+        'barrier': True,
+        'roles': [
+            {'name': 'notifications', 'hosts': 'localhost'},
+        ],
+    },
+]
+
+
+def rolenames(graph, node):
+    return {graph.get_node(key).rolename for key in node.dependencies}
+
+
+def describe_play_graph():
+    @pytest.fixture
+    def graph():
+        return PlayGraph(STEPS, get_role_dependencies())
+
+    def it_creates_a_node_per_role_and_step(graph):
+        assert [n.rolename for n in graph.nodes] == [
+            'prepare', 'prerequisites', 'ssl', 'instances',
+            'cdn', 'databases', 'configfiles', 'notifications',
+        ]
+
+    def it_chains_the_roles_of_sequential_steps(graph):
+        [prepare, prerequisites] = graph.nodes[:2]
+        assert not prepare.dependencies
+        assert rolenames(graph, prerequisites) == {'prepare'}
+
+    def it_uses_the_role_dependencies(graph):
+        [ssl, instances, cdn] = graph.nodes[2:5]
+        assert rolenames(graph, ssl) == {'prerequisites'}
+        assert rolenames(graph, instances) == {'prerequisites'}
+        assert rolenames(graph, cdn) == {'prerequisites', 'ssl'}
+
+    def it_keeps_the_step_order_for_roles_running_on_the_hosts(graph):
+        configfiles = graph.nodes[6]
+        assert rolenames(graph, configfiles) == {'instances', 'databases'}
+
+    def it_waits_for_every_previous_role_on_barrier_steps(graph):
+        notifications = graph.nodes[-1]
+        assert rolenames(graph, notifications) == {n.rolename for n in graph.nodes[:-1]}
+
+    def it_returns_the_nodes_that_are_ready(graph):
+        pending = list(graph.nodes)
+        assert graph.ready(pending) == [graph.nodes[0]]
+
+        for node in graph.nodes[:2]:
+            pending.remove(node)
+            graph.complete(node)
+
+        assert [n.rolename for n in graph.ready(pending)] == ['ssl', 'instances']
+        assert graph.is_step_complete(0)
+        assert not graph.is_step_complete(1)
+
+    def it_returns_the_critical_path(graph):
+        for node in graph.nodes:
+            node.start()
+            graph.complete(node)
+
+        path = graph.critical_path()
+        assert path[-1].rolename == 'notifications'
+        assert path[0].rolename == 'prepare'
+
+        for previous, node in zip(path, path[1:]):
+            assert previous.key in node.dependencies
+
+
+def describe_role_dependencies():
+    def it_adds_the_roles_of_the_parent_deployables(project):
+        dependencies = get_role_dependencies(project)
+        assert 'instances' in dependencies['environment']
+        assert 'databases' in dependencies['environment']
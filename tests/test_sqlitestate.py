@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=E1101,C0111,W0612,R0915,R0201,R0903,W0106
+import os
+import sqlite3
+import pytest
+from doubles import InstanceDouble
+from stackmate.helpers import read_yaml, write_yaml
+from stackmate.state import State
+from stackmate.sqlitestate import SqliteState
+
+RESOURCES = [
+    {'id': 'mysql', 'group': 'databases', 'output': {'host': 'db', 'password': 'secret'}},
+    {'id': 'postgres', 'group': 'databases'},
+]
+
+
+def describe_sqlite_state():
+    @pytest.fixture
+    def rootpath(tmpdir):
+        os.makedirs(str(tmpdir.join('state')))
+        write_yaml(str(tmpdir.join('state', 'production.yml')), {
+            'version': '1.0', 'databases': RESOURCES, 'prerequisites': [],
+        })
+        return str(tmpdir)
+
+    @pytest.fixture
+    def state(rootpath):
+        project_state = SqliteState(rootpath=rootpath, stage='production')
+        yield project_state
+        project_state.close()
+
+    def it_imports_the_state_file(state, rootpath):
+        assert SqliteState.exists(rootpath)
+        assert state.keys() == ['databases', 'prerequisites']
+        assert state.contents == {'databases': RESOURCES, 'prerequisites': []}
+        assert state.fingerprint() == State(rootpath=rootpath, stage='production').fingerprint()
+
+    def it_queries_the_resources(state):
+        assert state.get('databases')[0].output.host == 'db'
+        assert state.get('nothing', []) == []
+        assert [r.id for r in state.get_resources('databases').all] == ['mysql', 'postgres']
+
+        deployable = InstanceDouble(
+            'stackmate.deployables.Deployable', rolename='databases', deployable_id='postgres')
+        assert [r.id for r in state.get_deployable_resources(deployable).all] == ['postgres']
+
+    def it_updates_a_role_in_a_transaction(state, rootpath):
+        state.update('databases', [
+            {'id': 'mysql', 'group': 'databases', 'output': {'host': 'db2', 'password': ''}},
+        ])
+        assert state.has_pending_changes
+
+        # other connections don't see the changes until they're committed
+        assert len(SqliteState(rootpath=rootpath, stage='production').get('databases')) == 2
+
+        state.save()
+        assert not state.has_pending_changes
+
+        reloaded = SqliteState(rootpath=rootpath, stage='production')
+        assert len(reloaded.get('databases')) == 1
+        assert reloaded.get('databases')[0].output == {'host': 'db2', 'password': 'secret'}
+
+    def it_merges_attributes_into_the_resources(state):
+        state.merge_role_resource_attributes('databases', touched=True)
+        state.merge_role_resource_attributes('nothing', touched=True)
+        state.save()
+
+        assert all(r['touched'] for r in state.get('databases'))
+        assert 'nothing' not in state.keys()
+
+    def it_keeps_the_history_of_the_roles(state):
+        state.update('databases', [])
+        state.save()
+
+        assert [h['resources'] for h in state.history('databases')] == [[]]
+        assert state.get('databases') is None
+        assert 'databases' in state.keys()
+
+    def it_exports_the_state_file_when_compacted(state, rootpath):
+        state.merge_role_resource_attributes('databases', touched=True)
+        state.compact()
+
+        contents = read_yaml(os.path.join(rootpath, 'state', 'production.yml'))
+        assert contents['version'] == '1.0'
+        assert all(r['touched'] for r in contents['databases'])
+
+    def it_keeps_the_stages_apart(state, rootpath):
+        staging = SqliteState(rootpath=rootpath, stage='staging')
+        staging.update('databases', [{'id': 'redis', 'group': 'databases'}])
+        staging.save()
+
+        assert [r['id'] for r in state.get('databases')] == ['mysql', 'postgres']
+        assert staging.keys() == ['databases']
+
+
+def describe_load():
+    def it_uses_the_database_when_there_is_one(tmpdir):
+        rootpath = str(tmpdir)
+        assert isinstance(State.load(rootpath=rootpath, stage='production'), State)
+
+        SqliteState(rootpath=rootpath, stage='production').close()
+        assert isinstance(State.load(rootpath=rootpath, stage='production'), SqliteState)
+        assert isinstance(State.load(rootpath=rootpath, stage='production', backend='yaml'), State)
+
+    def it_validates_the_backend(tmpdir):
+        with pytest.raises(ValueError):
+            State.load(rootpath=str(tmpdir), stage='production', backend='redis')
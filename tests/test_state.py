@@ -1,8 +1,12 @@
 # # -*- coding: utf-8 -*-
 # pylint: disable=E1101,C0111,W0612,R0915
+import os
+import time
 import pytest
 from doubles import allow
+from stackmate.helpers import read_yaml, write_yaml
 from stackmate.state import State
+from stackmate.exceptions import StateMigrationRequiredError
 
 def describe_state():
     @pytest.fixture
@@ -50,3 +54,85 @@ def describe_state():
         assert len(project_state.contents.get('databases')) == 1
         project_state.save()
         assert len(project_state.contents.get('databases')) == 1
+
+
+def describe_state_journal():
+    @pytest.fixture
+    def rootpath(tmpdir):
+        os.makedirs(str(tmpdir.join('state')))
+        write_yaml(str(tmpdir.join('state', 'production.yml')), {
+            'project': [{'id': 'project', 'touched': False}],
+        })
+        return str(tmpdir)
+
+    def it_does_not_load_the_state_of_the_stages_stored_together(tmpdir):
+        write_yaml(str(tmpdir.join('state.yml')), {'production': {'project': []}})
+
+        with pytest.raises(StateMigrationRequiredError):
+            State(rootpath=str(tmpdir), stage='production')
+
+        assert tmpdir.join('state.yml').exists()
+        assert not tmpdir.join('state').exists()
+
+    def it_records_the_changed_roles_instead_of_writing_the_state(rootpath, database_facts):
+        state = State(rootpath=rootpath, stage='production')
+        state.update('databases', database_facts)
+        state.save()
+
+        assert state.journal.exists
+        assert 'databases' not in read_yaml(os.path.join(rootpath, 'state', 'production.yml'))
+
+        # nothing changed since the last save, nothing gets recorded
+        state.save()
+        assert len(state.journal.read_lines()) == 1
+
+    def it_replays_the_journal_when_loaded(rootpath, database_facts):
+        state = State(rootpath=rootpath, stage='production')
+        state.update('databases', database_facts)
+        state.merge_role_resource_attributes('project', touched=True)
+        state.save()
+
+        recovered = State(rootpath=rootpath, stage='production')
+        assert recovered.contents == state.contents
+
+    def it_batches_the_saves_within_the_interval(rootpath, database_facts):
+        state = State(rootpath=rootpath, stage='production', save_interval=3600)
+        state.merge_role_resource_attributes('project', touched=True)
+        state.save()
+        assert len(state.journal.read_lines()) == 1
+
+        state.update('databases', database_facts)
+        state.save()
+        assert state.has_pending_changes
+        assert len(state.journal.read_lines()) == 1
+
+        state.flush()
+        assert not state.has_pending_changes
+        assert [e['role'] for e in state.journal.read_lines()] == ['project', 'databases']
+
+    def it_flushes_the_batched_saves_once_the_interval_is_over(rootpath, database_facts):
+        state = State(rootpath=rootpath, stage='production', save_interval=0.2)
+        state.merge_role_resource_attributes('project', touched=True)
+        state.save()
+        assert state.flush_deadline is None
+
+        state.update('databases', database_facts)
+        state.save()
+        assert state.flush_deadline is not None
+        assert not state.flush_if_due()
+        assert len(state.journal.read_lines()) == 1
+
+        time.sleep(0.2)
+        assert state.flush_if_due()
+        assert state.flush_deadline is None
+        assert [e['role'] for e in state.journal.read_lines()] == ['project', 'databases']
+
+    def it_compacts_the_journal_into_the_state_file(rootpath, database_facts):
+        state = State(rootpath=rootpath, stage='production')
+        state.update('databases', database_facts)
+        state.save()
+        state.compact()
+
+        assert not state.journal.exists
+        contents = read_yaml(os.path.join(rootpath, 'state', 'production.yml'))
+        assert contents['databases'] == state.contents['databases']
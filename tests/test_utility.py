@@ -50,6 +50,14 @@ def describe_utility():
             Utility.get_deployable_subclass('routing', 'digitalocean'), RoutingUtility.__class__)
         assert Utility.get_deployable_subclass('routing') is None
 
+    def it_sets_up_the_attributes_once_per_kind():
+        first = Utility.factory(kind='configfiles', attributes={'source': 'a', 'target': 'b'})
+        second = Utility.factory(kind='configfiles', attributes={'source': 'c', 'target': 'd'})
+
+        assert first._attributes['source'] is second._attributes['source']
+        assert first.source == 'a'
+        assert second.source == 'c'
+
 
 def describe_configfiles_utility():
     def it_has_an_entry_in_stackmate_yml():